@@ -0,0 +1,92 @@
+"""
+Import-time budget check for the Runic CLI.
+
+Runs `runic track list` under `python -X importtime` in an empty directory and
+fails if the total import time exceeds the committed budget, or if a module that
+should be imported lazily is loaded on this path.
+
+Usage:
+    python benchmarks/import_time.py [--runs N] [--budget-ms MS]
+"""
+
+import sys
+import argparse
+import subprocess
+import tempfile
+from typing import Dict, List, Tuple
+
+# Committed budget for the total import time of `runic track list`, in milliseconds
+IMPORT_BUDGET_MS = 100.0
+
+# Modules that must not be imported by `runic track list`
+LAZY_MODULES = ['git', 'shutil', 'importlib.metadata', 'concurrent.futures', 'hashlib', 'runic.trace', 'runic.snapshot']
+
+COMMAND = "from runic.cli import cli; cli.main(['track', 'list'], standalone_mode=False)"
+
+def parse_importtime(stderr: str) -> Tuple[float, Dict[str, int]]:
+    """Parse the output of `python -X importtime`.
+
+    Args:
+        stderr: The captured standard error of the measured process.
+
+    Returns:
+        The total import time in milliseconds and the cumulative time in
+        microseconds of every imported module.
+    """
+    total_us = 0
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(cumulative)
+        # Top-level imports are indented by exactly one space
+        if name.startswith(' ') and not name.startswith('  '):
+            total_us += int(cumulative)
+    return total_us / 1000.0, modules
+
+def measure(runs: int) -> Tuple[float, Dict[str, int]]:
+    """Measure the import time of `runic track list`, keeping the fastest run.
+
+    Args:
+        runs: The number of runs.
+
+    Returns:
+        The fastest total import time in milliseconds and that run's modules.
+    """
+    best = None
+    with tempfile.TemporaryDirectory() as project_dir:
+        for _ in range(runs):
+            result = subprocess.run([sys.executable, '-X', 'importtime', '-c', COMMAND],
+                                    cwd=project_dir, capture_output=True, text=True)
+            if result.returncode != 0:
+                raise RuntimeError(result.stderr)
+            total_ms, modules = parse_importtime(result.stderr)
+            if best is None or total_ms < best[0]:
+                best = (total_ms, modules)
+    return best
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--runs', type=int, default=5, help='Number of runs (the fastest one counts)')
+    parser.add_argument('--budget-ms', type=float, default=IMPORT_BUDGET_MS, help='Import-time budget in milliseconds')
+    args = parser.parse_args(argv)
+
+    total_ms, modules = measure(args.runs)
+    eager = [name for name in LAZY_MODULES if name in modules]
+
+    print(f"runic track list imports: {total_ms:.1f} ms (budget {args.budget_ms:.1f} ms)")
+    for name, cumulative in sorted(modules.items(), key=lambda item: -item[1])[:10]:
+        print(f"  {cumulative / 1000.0:7.1f} ms  {name}")
+
+    failed = False
+    if total_ms > args.budget_ms:
+        print("FAIL: import-time budget exceeded")
+        failed = True
+    if eager:
+        print(f"FAIL: modules that should be imported lazily were loaded: {', '.join(eager)}")
+        failed = True
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""
+Scaling benchmark for the Runic CLI and chat commands.
+
+Times every command on synthetic projects that grow one dimension at a time (tracks,
+memory file size, Git branches), appends the results to benchmarks/history.json, and
+compares them with the previous run of the same mode. Fails if a command regressed.
+
+Usage:
+    python benchmarks/scaling.py [--repeat N] [--subprocess] [--label NAME] [--no-compare]
+"""
+
+import os
+import sys
+import argparse
+from typing import List
+
+from runic.bench import (append_history, compare_runs, format_comparison, format_table,
+                         load_history, run_benchmarks)
+
+# The history of scaling runs on this machine
+HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history.json')
+
+# A baseline project, then the same project grown along each dimension
+CASES = [
+    {'tracks': 20, 'file_kb': 4, 'branches': 100},
+    {'tracks': 200, 'file_kb': 4, 'branches': 100},
+    {'tracks': 1000, 'file_kb': 4, 'branches': 100},
+    {'tracks': 20, 'file_kb': 64, 'branches': 100},
+    {'tracks': 20, 'file_kb': 4, 'branches': 5000},
+]
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs of each command after the first')
+    parser.add_argument('--subprocess', action='store_true', help='Run each command as a separate runic process')
+    parser.add_argument('--only', action='append', default=[], help='Only run the commands starting with this name')
+    parser.add_argument('--label', help='Name of this run in the history')
+    parser.add_argument('--history', default=HISTORY, help='JSON file the results are added to')
+    parser.add_argument('--no-compare', action='store_true', help="Don't compare with the previous run")
+    args = parser.parse_args(argv)
+
+    record = run_benchmarks(CASES, args.repeat, args.only, args.subprocess, progress=print)
+    if args.label:
+        record['label'] = args.label
+    for line in format_table(record):
+        print(line)
+
+    previous = [run for run in load_history(args.history) if run.get('mode') == record['mode']]
+    index = append_history(args.history, record)
+    print(f"Saved as run {index} in {args.history}.")
+    if args.no_compare or not previous:
+        return 0
+    comparisons = compare_runs(previous[-1], record)
+    for line in format_comparison(comparisons):
+        print(line)
+    return 1 if any(c.status == 'regression' for c in comparisons) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
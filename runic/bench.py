@@ -0,0 +1,471 @@
+"""
+Bench module for Runic.
+
+This module provides `runic bench`, which measures how the CLI and chat commands scale.
+It generates synthetic projects with a given number of tracks, memory file size and Git
+branches, times every command in them, and appends the results to a JSON history file.
+`runic bench compare` then flags the commands that got slower between two runs.
+
+Commands run in-process by default, so repeated runs are warm like calls answered by the
+daemon; --subprocess runs each command as a separate `runic` process instead.
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import platform
+import statistics
+import subprocess
+import contextlib
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+# Runs of each scenario after the first, which is reported separately
+DEFAULT_REPEAT = 5
+
+# Synthetic project size unless --tracks, --file-kb or --branches is given
+DEFAULT_TRACKS = 20
+DEFAULT_FILE_KB = 4
+DEFAULT_BRANCHES = 100
+
+# History file unless --history is given
+DEFAULT_HISTORY = 'runic-bench.json'
+
+# A scenario regressed if its median grew by more than this fraction...
+DEFAULT_THRESHOLD = 0.2
+
+# ...and by more than this many milliseconds, so timer noise on fast commands doesn't count
+MIN_REGRESSION_MS = 2.0
+
+# Author of the synthetic commits
+_GIT_ENV = {'GIT_AUTHOR_NAME': 'runic-bench', 'GIT_AUTHOR_EMAIL': 'bench@runic.invalid',
+            'GIT_COMMITTER_NAME': 'runic-bench', 'GIT_COMMITTER_EMAIL': 'bench@runic.invalid'}
+
+_PARAGRAPH = ("The service keeps its state in memory files that agents read at the start of every task. "
+              "Each change is recorded with its reason, so later agents can follow the decisions made. ")
+
+class Scenario(NamedTuple):
+    """A timed command.
+
+    args gives the `runic` arguments of run i. If handler is set, in-process runs call it
+    instead of the CLI, to time a chat handler on its own. setup and teardown run around
+    each timed run, untimed; cwd gives the directory run i happens in.
+    """
+    name: str
+    args: Callable[[int], List[str]]
+    handler: Optional[Callable[[int], Any]] = None
+    setup: Optional[Callable[[int], None]] = None
+    teardown: Optional[Callable[[int], None]] = None
+    cwd: Optional[Callable[[int], str]] = None
+
+class Comparison(NamedTuple):
+    """How one scenario of one case changed between two runs."""
+    case: str
+    scenario: str
+    base_ms: Optional[float]
+    head_ms: Optional[float]
+    status: str  # 'regression', 'improvement', 'same', 'new' or 'missing'
+
+class SyntheticProject:
+    """A generated Git repository with a Runic memory of a given size."""
+
+    def __init__(self, path: str, tracks: int = DEFAULT_TRACKS, file_kb: int = DEFAULT_FILE_KB,
+                 branches: int = DEFAULT_BRANCHES):
+        """Initialize the project.
+
+        Args:
+            path: The directory to generate the project in.
+            tracks: The number of tracks.
+            file_kb: The approximate size of each memory file, in KiB.
+            branches: The number of Git branches besides main.
+        """
+        self.path = os.path.abspath(path)
+        self.tracks = tracks
+        self.file_kb = file_kb
+        self.branches = branches
+
+    @property
+    def case(self) -> str:
+        """The name of the project's size, used to match results between runs."""
+        return f"tracks={self.tracks} file_kb={self.file_kb} branches={self.branches}"
+
+    def git(self, *args: str, input: Optional[str] = None, env: Optional[Dict[str, str]] = None) -> str:
+        """Run a git command in the project and return its output."""
+        result = subprocess.run(['git', '-C', self.path] + list(args), input=input, capture_output=True,
+                                text=True, env=dict(os.environ, **_GIT_ENV, **(env or {})))
+        if result.returncode != 0:
+            raise RuntimeError(f"git {' '.join(args)}: {result.stderr.strip()}")
+        return result.stdout.strip()
+
+    def commit_file(self, parent: str, name: str, content: str, message: str) -> str:
+        """Create a commit on top of parent that adds one file, without touching the checkout.
+
+        Returns:
+            The new commit's SHA.
+        """
+        index = os.path.join(self.path, '.git', 'bench-index')
+        env = {'GIT_INDEX_FILE': index}
+        try:
+            self.git('read-tree', parent, env=env)
+            blob = self.git('hash-object', '-w', '--stdin', input=content)
+            self.git('update-index', '--add', '--cacheinfo', f"100644,{blob},{name}", env=env)
+            tree = self.git('write-tree', env=env)
+            return self.git('commit-tree', tree, '-p', parent, '-m', message)
+        finally:
+            if os.path.exists(index):
+                os.unlink(index)
+
+    def _memory_file(self, title: str, sections: Dict[str, str]) -> str:
+        """Render a memory file padded to about file_kb KiB with 'Completed Tasks' items."""
+        text = f"# {title}\n\n" + ''.join(f"## {heading}\n{body}\n\n" for heading, body in sections.items())
+        items = []
+        size = len(text)
+        while size < self.file_kb * 1024:
+            item = f"- Task {len(items) + 1}: {_PARAGRAPH}"
+            items.append(item)
+            size += len(item) + 1
+        return text + "## Completed Tasks\n" + '\n'.join(items) + "\n\n## Last Updated\n2026-01-01 00:00:00\n"
+
+    def generate(self) -> None:
+        """Create the repository, its branches and the Runic memory."""
+        os.makedirs(self.path, exist_ok=True)
+        self.git('init', '-q', '-b', 'main')
+        # Commands that commit (rebases) run without _GIT_ENV
+        self.git('config', 'user.name', _GIT_ENV['GIT_AUTHOR_NAME'])
+        self.git('config', 'user.email', _GIT_ENV['GIT_AUTHOR_EMAIL'])
+        Path(self.path, 'README.md').write_text("# Synthetic project\n")
+        self.git('add', 'README.md')
+        self.git('commit', '-q', '-m', 'Initial commit')
+        self.git('commit', '-q', '--allow-empty', '-m', 'Second commit')
+        # The checkout stays on main's commit but detached, so merges into main don't touch it
+        self.git('checkout', '-q', '--detach')
+
+        track_names = [f"track-{n:04d}" for n in range(self.tracks)] or ['track']
+        main = self.git('rev-parse', 'main')
+        refs = ''.join(f"create refs/heads/{track_names[n % len(track_names)]}-task-{n}\0{main}\0"
+                       for n in range(self.branches))
+        if refs:
+            self.git('update-ref', '-z', '--stdin', input=refs)
+
+        with self.inside():
+            quiet_cli(['init'])
+
+        memory = Path(self.path, '.runic', 'memory')
+        for name in ('project-brief', 'product-context', 'system-patterns', 'tech-context', 'active-context'):
+            (memory / f"{name}.md").write_text(self._memory_file(name.replace('-', ' ').title(),
+                                                                 {'Overview': _PARAGRAPH}))
+        (memory / 'progress.md').write_text(self._memory_file('Progress', {
+            'Overall Status': 'In progress', 'Upcoming Tasks': '- Finish the benchmark\n- Review the results'}))
+        for name in track_names[:self.tracks]:
+            track_dir = memory / 'tracks' / name
+            track_dir.mkdir(parents=True, exist_ok=True)
+            (track_dir / 'active-context.md').write_text(self._memory_file(f"{name} Active Context",
+                                                                           {'Current Focus': _PARAGRAPH}))
+            (track_dir / 'progress.md').write_text(self._memory_file(f"{name} Progress", {
+                'Overall Status': 'In progress', 'Upcoming Tasks': '- Next task'}))
+
+    @contextlib.contextmanager
+    def inside(self, path: Optional[str] = None):
+        """Run the enclosed code in the project's directory (or path)."""
+        previous = os.getcwd()
+        os.chdir(path or self.path)
+        try:
+            yield
+        finally:
+            os.chdir(previous)
+
+def quiet_cli(args: List[str]) -> None:
+    """Run a `runic` command in-process with its output discarded."""
+    from runic.cli import cli
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        cli.main(args, standalone_mode=False)
+
+def scenarios(project: SyntheticProject, scratch_dir: str) -> List[Scenario]:
+    """Get the scenarios timed in a project.
+
+    Args:
+        project: The synthetic project.
+        scratch_dir: A directory for the fresh projects `runic init` runs in.
+
+    Returns:
+        The scenarios, in the order they run.
+    """
+    from runic import chat_commands
+
+    def reset_head(i: int) -> None:
+        # Git state changed behind the cached repository context
+        project.git('checkout', '-q', '--detach', 'main')
+        from runic.git_context import get_repo_context
+        get_repo_context(project.path).invalidate()
+
+    def delete_branch(name: str) -> Callable[[int], None]:
+        def teardown(i: int) -> None:
+            reset_head(i)
+            project.git('branch', '-q', '-D', f"{name}-{i}")
+        return teardown
+
+    def branch_at(name: str, commit: Callable[[int], str]) -> Callable[[int], None]:
+        def setup(i: int) -> None:
+            project.git('update-ref', f"refs/heads/{name}-{i}", commit(i))
+        return setup
+
+    main_before = {}
+
+    def merge_setup(i: int) -> None:
+        main_before[i] = project.git('rev-parse', 'main')
+        project.git('update-ref', f"refs/heads/bench-merge-{i}",
+                    project.commit_file('main', f"bench/merge-{i}.txt", f"{i}\n", f"Merge bench {i}"))
+
+    def merge_teardown(i: int) -> None:
+        project.git('update-ref', 'refs/heads/main', main_before.pop(i))
+        delete_branch('bench-merge')(i)
+
+    def track_init_teardown(i: int) -> None:
+        import shutil
+        reset_head(i)
+        for branch in project.git('branch', '--list', f"bench-track-{i}-*", '--format=%(refname:short)').split():
+            project.git('branch', '-q', '-D', branch)
+        shutil.rmtree(os.path.join(project.path, '.runic', 'memory', 'tracks', f"bench-track-{i}"), ignore_errors=True)
+
+    def chat(command: str) -> Callable[[int], List[str]]:
+        return lambda i: ['chat', command.format(i=i)]
+
+    return [
+        Scenario('track list', lambda i: ['track', 'list']),
+        Scenario('track status', lambda i: ['track', 'status']),
+        Scenario('mem update', lambda i: ['mem', 'update', '--no-compact']),
+        Scenario('mem next', lambda i: ['mem', 'next']),
+        Scenario('init', lambda i: ['init'], cwd=lambda i: os.path.join(scratch_dir, f"init-{i}"),
+                 setup=lambda i: os.makedirs(os.path.join(scratch_dir, f"init-{i}"))),
+        Scenario('update', lambda i: ['update']),
+        Scenario('migrate', lambda i: ['migrate']),
+        Scenario('branch list', chat('$branch list'), lambda i: chat_commands.handle_branch_list([])),
+        Scenario('branch create', chat('$branch create bench-create-{i}'),
+                 lambda i: chat_commands.handle_branch_create([f"bench-create-{i}"]),
+                 teardown=delete_branch('bench-create')),
+        Scenario('branch delete', chat('$branch delete bench-delete-{i}'),
+                 lambda i: chat_commands.handle_branch_delete([f"bench-delete-{i}"]),
+                 setup=branch_at('bench-delete', lambda i: project.git('rev-parse', 'main'))),
+        Scenario('branch update', chat('$branch update bench-update-{i}'),
+                 lambda i: chat_commands.handle_branch_update([f"bench-update-{i}"]),
+                 setup=branch_at('bench-update', lambda i: project.commit_file(
+                     'main~1', f"bench/update-{i}.txt", f"{i}\n", f"Update bench {i}")),
+                 teardown=delete_branch('bench-update')),
+        Scenario('branch merge', chat('$branch merge bench-merge-{i}'),
+                 lambda i: chat_commands.handle_branch_merge([f"bench-merge-{i}"]),
+                 setup=merge_setup, teardown=merge_teardown),
+        Scenario('branch ready', chat('$branch ready bench-ready'),
+                 lambda i: chat_commands.handle_branch_ready(['bench-ready'])),
+        Scenario('track init', chat('$track init bench-track-{i}'),
+                 lambda i: chat_commands.handle_track_init([f"bench-track-{i}"]),
+                 teardown=track_init_teardown),
+    ]
+
+def time_scenario(project: SyntheticProject, scenario: Scenario, repeat: int,
+                  use_subprocess: bool = False) -> Dict[str, Any]:
+    """Time one scenario.
+
+    The first run, which pays for imports and cold caches, is reported as first_ms; the
+    statistics cover the repeat runs after it.
+
+    Returns:
+        The scenario's timings in milliseconds, or its error.
+    """
+    timings = []
+    for i in range(repeat + 1):
+        if scenario.setup:
+            scenario.setup(i)
+        cwd = scenario.cwd(i) if scenario.cwd else project.path
+        try:
+            if use_subprocess:
+                start = time.perf_counter()
+                result = subprocess.run([sys.executable, '-m', 'runic.cli'] + scenario.args(i), cwd=cwd,
+                                        capture_output=True, text=True, env=dict(os.environ, RUNIC_NO_DAEMON='1'))
+                elapsed = time.perf_counter() - start
+                if result.returncode != 0:
+                    raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'failed')
+            else:
+                with project.inside(cwd):
+                    start = time.perf_counter()
+                    if scenario.handler:
+                        response = scenario.handler(i)
+                    else:
+                        quiet_cli(scenario.args(i))
+                        response = None
+                    elapsed = time.perf_counter() - start
+                if isinstance(response, str) and response.startswith(('Error', 'Git error')):
+                    raise RuntimeError(response)
+        except Exception as e:
+            return {'error': str(e)}
+        finally:
+            if scenario.teardown:
+                scenario.teardown(i)
+        timings.append(elapsed * 1000.0)
+
+    runs = timings[1:] or timings
+    return {'first_ms': round(timings[0], 3), 'median_ms': round(statistics.median(runs), 3),
+            'min_ms': round(min(runs), 3), 'max_ms': round(max(runs), 3), 'runs': len(runs)}
+
+def run_benchmarks(cases: Iterable[Dict[str, int]], repeat: int = DEFAULT_REPEAT, only: Iterable[str] = (),
+                   use_subprocess: bool = False, work_dir: Optional[str] = None,
+                   progress: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """Generate a project for every case and time every scenario in it.
+
+    Args:
+        cases: The project sizes, as dictionaries of SyntheticProject arguments.
+        repeat: The number of timed runs of each scenario after the first.
+        only: Only run the scenarios whose name starts with one of these.
+        use_subprocess: Run each command as a separate `runic` process.
+        work_dir: Where to generate the projects (kept afterwards). Defaults to a temporary directory.
+        progress: Called with a line of text after each scenario.
+
+    Returns:
+        The run record stored in the history file.
+    """
+    import shutil
+    import tempfile
+    from runic.git_context import close_repo_contexts
+
+    if shutil.which('git') is None:
+        raise RuntimeError("git is required to generate the benchmark projects")
+
+    record = {'time': time.strftime('%Y-%m-%d %H:%M:%S'), 'version': _runic_version(),
+              'python': platform.python_version(), 'platform': platform.platform(),
+              'mode': 'subprocess' if use_subprocess else 'in-process', 'repeat': repeat, 'cases': []}
+    base = work_dir or tempfile.mkdtemp(prefix='runic-bench-')
+    try:
+        for n, params in enumerate(cases):
+            project = SyntheticProject(os.path.join(base, f"project-{n}"), **params)
+            project.generate()
+            results = {}
+            for scenario in scenarios(project, os.path.join(base, f"scratch-{n}")):
+                if only and not any(scenario.name.startswith(name) for name in only):
+                    continue
+                results[scenario.name] = time_scenario(project, scenario, repeat, use_subprocess)
+                if progress:
+                    progress(f"{project.case}  {scenario.name}: {format_result(results[scenario.name])}")
+            # Release the cached git processes of this project before the next one
+            close_repo_contexts()
+            record['cases'].append({'case': project.case, 'params': params, 'results': results})
+    finally:
+        if work_dir is None:
+            shutil.rmtree(base, ignore_errors=True)
+    return record
+
+def _runic_version() -> str:
+    """Get the installed Runic version, if any."""
+    try:
+        from importlib.metadata import version
+        return version('runic')
+    except Exception:
+        return 'unknown'
+
+def format_result(result: Dict[str, Any]) -> str:
+    """Format one scenario's timings for display."""
+    if 'error' in result:
+        return f"error: {result['error']}"
+    return (f"median {result['median_ms']:.1f} ms (min {result['min_ms']:.1f}, max {result['max_ms']:.1f}, "
+            f"first {result['first_ms']:.1f})")
+
+def format_table(record: Dict[str, Any]) -> List[str]:
+    """Format a run as a table of medians, one column per project size."""
+    cases = record['cases']
+    names = []
+    for case in cases:
+        names.extend(name for name in case['results'] if name not in names)
+    lines = [''] + [f"[{n + 1}] {case['case']}" for n, case in enumerate(cases)]
+    lines.append(f"{'median ms':<16}" + ''.join(f"{f'[{n + 1}]':>11}" for n in range(len(cases))))
+    for name in names:
+        cells = []
+        for case in cases:
+            result = case['results'].get(name)
+            cells.append('-' if result is None else 'error' if 'error' in result else f"{result['median_ms']:.1f}")
+        lines.append(f"{name:<16}" + ''.join(f"{cell:>11}" for cell in cells))
+    return lines
+
+def format_comparison(comparisons: List[Comparison]) -> List[str]:
+    """Format the regressions and improvements of a comparison, and a summary."""
+    lines = []
+    changed = [c for c in comparisons if c.status in ('regression', 'improvement')]
+    for c in changed:
+        lines.append(f"  {c.status.upper():<12} {c.scenario:<16} {c.base_ms:>8.1f} ms -> {c.head_ms:>8.1f} ms "
+                     f"({(c.head_ms / c.base_ms - 1) * 100 if c.base_ms else float('inf'):+.0f}%)  [{c.case}]")
+    regressions = sum(1 for c in changed if c.status == 'regression')
+    compared = sum(1 for c in comparisons if c.status not in ('new', 'missing'))
+    lines.append(f"{regressions} regressions, {len(changed) - regressions} improvements in {compared} timings compared.")
+    if len(comparisons) > compared:
+        lines.append(f"{len(comparisons) - compared} timings were only in one of the runs.")
+    return lines
+
+def load_history(path: str) -> List[Dict[str, Any]]:
+    """Read the runs stored in a history file (none if it doesn't exist)."""
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f).get('runs', [])
+    except FileNotFoundError:
+        return []
+
+def append_history(path: str, record: Dict[str, Any]) -> int:
+    """Add a run to a history file.
+
+    Returns:
+        The run's index in the history.
+    """
+    from runic.locking import atomic_write
+    runs = load_history(path)
+    runs.append(record)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    atomic_write(path, (json.dumps({'runs': runs}, indent=1) + '\n').encode('utf-8'))
+    return len(runs) - 1
+
+def find_run(runs: List[Dict[str, Any]], ref: str) -> Optional[int]:
+    """Find a run by index (negative counts from the end) or label, the latest match first."""
+    try:
+        index = int(ref)
+        return index % len(runs) if -len(runs) <= index < len(runs) else None
+    except ValueError:
+        pass
+    for index in range(len(runs) - 1, -1, -1):
+        if runs[index].get('label') == ref:
+            return index
+    return None
+
+def compare_runs(base: Dict[str, Any], head: Dict[str, Any], threshold: float = DEFAULT_THRESHOLD,
+                 min_ms: float = MIN_REGRESSION_MS) -> List[Comparison]:
+    """Compare the median timings of two runs, case by case.
+
+    Args:
+        base: The earlier run.
+        head: The later run.
+        threshold: The relative growth of the median that counts as a regression.
+        min_ms: The absolute growth, in milliseconds, a regression also needs.
+
+    Returns:
+        One comparison per scenario of every case in either run.
+    """
+    def medians(run):
+        return {(case['case'], name): result.get('median_ms')
+                for case in run['cases'] for name, result in case['results'].items()}
+
+    before = medians(base)
+    after = medians(head)
+    comparisons = []
+    for key in list(before) + [key for key in after if key not in before]:
+        base_ms, head_ms = before.get(key), after.get(key)
+        if base_ms is None and head_ms is None:
+            status = 'same'
+        elif base_ms is None:
+            status = 'new'
+        elif head_ms is None:
+            status = 'missing'
+        elif head_ms > base_ms * (1 + threshold) and head_ms - base_ms > min_ms:
+            status = 'regression'
+        elif base_ms > head_ms * (1 + threshold) and base_ms - head_ms > min_ms:
+            status = 'improvement'
+        else:
+            status = 'same'
+        comparisons.append(Comparison(key[0], key[1], base_ms, head_ms, status))
+    return comparisons
@@ -0,0 +1,241 @@
+"""
+Build module for Runic.
+
+This module provides `runic compile`, which assembles the files an agent is told to read
+into one prompt file per role and track under `.runic/build/`: the role instructions and
+the framework documents of its Required Reading first, then the memory files, with the
+ones that change most often last. Keeping the stable content at the front lets provider
+prompt caching reuse the longest possible prefix between sessions and between tracks.
+
+Builds are incremental: `.runic/build/manifest.json` records the content hash of every
+source, and a bundle is only reassembled when one of its sources changed. The output
+contains no timestamps and is written only when its bytes differ, so compiling an
+unchanged project leaves every bundle byte-identical.
+"""
+
+import os
+import json
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Bump this whenever the layout of a bundle changes, so existing bundles are rebuilt
+BUILD_VERSION = 1
+
+# Framework documents each role is told to read, in the order of its Required Reading
+ROLE_CORE_FILES = {
+    'orchestrator': ('identity.md', 'memory-structure.md', 'commands.md', 'rules.md', 'track-management.md'),
+    'specialist': ('identity.md', 'memory-structure.md', 'commands.md', 'rules.md'),
+}
+
+# Core memory files that change with every session; they go after the background files
+VOLATILE_CORE_FILES = ('active-context.md', 'progress.md')
+
+class BuildResult(NamedTuple):
+    """The outcome of compiling one bundle."""
+    name: str
+    path: str
+    status: str  # 'built', 'unchanged' or 'removed'
+    sources: int
+
+def _sha1(data: bytes) -> str:
+    """Hash content; hashlib is only imported once a source actually has to be read."""
+    import hashlib
+    return hashlib.sha1(data).hexdigest()
+
+class BundleCompiler:
+    """Compiles the role bundles of a project into .runic/build/."""
+
+    def __init__(self, memory_manager=None):
+        """Initialize the compiler.
+
+        Args:
+            memory_manager: The MemoryManager whose files are compiled. If None, a new one is created.
+        """
+        if memory_manager is None:
+            from runic.memory import MemoryManager
+            memory_manager = MemoryManager()
+        self.memory_manager = memory_manager
+        self.base_dir = memory_manager.base_dir
+        self.build_dir = self.base_dir / 'build'
+        self.manifest_path = self.build_dir / 'manifest.json'
+        # Paths in bundles are relative to the project root, so they don't depend on the cwd
+        self.root = self.base_dir.resolve().parent
+        self._manifest = None
+
+    def _load_manifest(self) -> Dict:
+        """Load the manifest of the previous build on first use."""
+        if self._manifest is None:
+            self._manifest = {'sources': {}, 'bundles': {}}
+            try:
+                data = json.loads(self.manifest_path.read_text())
+                if data.get('version') == BUILD_VERSION:
+                    self._manifest = data
+            except (OSError, ValueError, AttributeError):
+                # A missing or corrupt manifest just means a full build
+                pass
+        return self._manifest
+
+    def _relpath(self, path: Path) -> str:
+        """Get the project-relative path of a source, as it appears in bundles."""
+        try:
+            return Path(os.path.abspath(path)).relative_to(self.root).as_posix()
+        except ValueError:
+            return Path(path).as_posix()
+
+    def _source_hash(self, path: Path, sources: Dict) -> Optional[str]:
+        """Get a source's content hash, re-reading it only if its stat changed."""
+        key = self._relpath(path)
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            return None
+        entry = sources.get(key)
+        if entry and entry['mtime_ns'] == stat_result.st_mtime_ns and entry['size'] == stat_result.st_size:
+            return entry['hash']
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        sources[key] = {'mtime_ns': stat_result.st_mtime_ns, 'size': stat_result.st_size, 'hash': _sha1(data)}
+        return sources[key]['hash']
+
+    def bundle_sources(self, role: str, track_dir: Optional[str] = None) -> List[Tuple[str, List[Path]]]:
+        """List the sources of a bundle as (part, files) pairs, from most to least stable.
+
+        Args:
+            role: 'orchestrator' or 'specialist'.
+            track_dir: The specialist's track directory name.
+
+        Returns:
+            The parts of the bundle in order: 'framework', 'context', 'tracks', 'requests', 'active' and 'track'.
+        """
+        manager = self.memory_manager
+        framework = [self.base_dir / f"{role}.md"]
+        framework += [self.base_dir / 'core' / name for name in ROLE_CORE_FILES[role]]
+
+        core = manager.get_core_memory_files()
+        context = [path for path in core if path.name not in VOLATILE_CORE_FILES]
+        active = [path for path in core if path.name in VOLATILE_CORE_FILES]
+
+        tracks, own = [], []
+        for entry in sorted(manager.scan_tracks(), key=lambda entry: entry.dir_name):
+            (own if entry.dir_name == track_dir else tracks).extend(entry.memory_files())
+
+        requests = []
+        if role == 'orchestrator':
+            requests_dir = manager.memory_dir / 'merge-requests'
+            if requests_dir.is_dir():
+                requests = sorted(requests_dir.glob('*.md'))
+
+        parts = [('framework', framework), ('context', context), ('tracks', tracks),
+                 ('requests', requests), ('active', active), ('track', own)]
+        return [(part, [path for path in files if path.is_file()]) for part, files in parts]
+
+    def bundles(self) -> List[Tuple[str, str, Optional[str]]]:
+        """List the bundles of the project as (name, role, track directory) triples."""
+        bundles = []
+        if (self.base_dir / 'orchestrator.md').is_file():
+            bundles.append(('orchestrator', 'orchestrator', None))
+        if (self.base_dir / 'specialist.md').is_file():
+            for entry in sorted(self.memory_manager.scan_tracks(), key=lambda entry: entry.dir_name):
+                bundles.append((f"specialist-{entry.dir_name}", 'specialist', entry.dir_name))
+        return bundles
+
+    def render(self, role: str, track_dir: Optional[str], parts: List[Tuple[str, List[Path]]]) -> bytes:
+        """Assemble a bundle from its sources.
+
+        Args:
+            role: 'orchestrator' or 'specialist'.
+            track_dir: The specialist's track directory name.
+            parts: The bundle's sources (see bundle_sources).
+
+        Returns:
+            The bundle's content.
+        """
+        chunks = [
+            f"<!-- Runic {role} bundle, compiled by `runic compile`. It contains the role instructions, "
+            f"the documents listed under Required Reading and the memory files, so they need not be "
+            f"read separately. Do not edit; edit the source files and recompile. -->\n".encode('utf-8')
+        ]
+        for part, files in parts:
+            if part == 'track' and track_dir:
+                # The only track-specific text, placed after everything the specialists of all tracks share
+                display_name = self.memory_manager._to_title_case(track_dir.replace('-', ' '))
+                chunks.append(f"<!-- Your track: {display_name} ({track_dir}) -->\n".encode('utf-8'))
+            for path in files:
+                data = path.read_bytes()
+                chunks.append(f"<!-- {self._relpath(path)} -->\n".encode('utf-8'))
+                chunks.append(data.rstrip(b'\n') + b'\n')
+        return b'\n'.join(chunks)
+
+    def compile(self, tracks: Optional[List[str]] = None, force: bool = False) -> List[BuildResult]:
+        """Compile the bundles whose sources changed.
+
+        Args:
+            tracks: Only compile the specialist bundles of these track directories (and no
+                orchestrator bundle). If None, every bundle is compiled and bundles of
+                removed tracks are deleted.
+            force: Reassemble every bundle even if its sources didn't change.
+
+        Returns:
+            One result per bundle.
+        """
+        from runic.locking import atomic_write
+        manifest = self._load_manifest()
+        sources, built = manifest['sources'], manifest['bundles']
+        used_sources = set()
+        results = []
+        self.build_dir.mkdir(parents=True, exist_ok=True)
+
+        for name, role, track_dir in self.bundles():
+            if tracks is not None and track_dir not in tracks:
+                continue
+            parts = self.bundle_sources(role, track_dir)
+            inputs = [(self._relpath(path), self._source_hash(path, sources)) for _, files in parts for path in files]
+            used_sources.update(key for key, _ in inputs)
+            digest = _sha1(json.dumps([BUILD_VERSION, role, track_dir, inputs]).encode('utf-8'))
+            output = self.build_dir / f"{name}.md"
+
+            previous = built.get(name)
+            if not force and previous and previous['inputs'] == digest and output.is_file():
+                results.append(BuildResult(name, str(output), 'unchanged', len(inputs)))
+                continue
+
+            data = self.render(role, track_dir, parts)
+            try:
+                unchanged = output.read_bytes() == data
+            except OSError:
+                unchanged = False
+            if not unchanged:
+                atomic_write(output, data)
+            built[name] = {'inputs': digest}
+            results.append(BuildResult(name, str(output), 'unchanged' if unchanged else 'built', len(inputs)))
+
+        if tracks is None:
+            current = {name for name, _, _ in self.bundles()}
+            for name in sorted(set(built) - current):
+                del built[name]
+                output = self.build_dir / f"{name}.md"
+                try:
+                    output.unlink()
+                    results.append(BuildResult(name, str(output), 'removed', 0))
+                except FileNotFoundError:
+                    pass
+            for key in set(sources) - used_sources:
+                del sources[key]
+
+        self._save_manifest()
+        return results
+
+    def _save_manifest(self) -> None:
+        """Write the manifest if it changed."""
+        from runic.locking import atomic_write
+        manifest = self._load_manifest()
+        manifest['version'] = BUILD_VERSION
+        data = json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8')
+        try:
+            if self.manifest_path.read_bytes() == data:
+                return
+        except OSError:
+            pass
+        atomic_write(self.manifest_path, data)
@@ -3,13 +3,25 @@ Chat commands module for Runic.
 
 This module provides functions for handling chat commands in the Runic framework.
 It focuses on commands that AI agents can use within the chat interface.
+GitPython is slow to import, so it is only imported by the handlers that run git.
 """
 
-import git
 import os
+import re
+import json
 import datetime
 from pathlib import Path
-from typing import List, Optional, Tuple, Dict, Any, Union
+from typing import List, Optional, Tuple, Dict, Any, Union, Iterator
+from runic.git_context import get_repo_context
+
+# Number of branches `$branch list` shows per page unless --limit is given
+DEFAULT_BRANCH_LIST_LIMIT = 100
+
+# Commands that change neither the repository nor memory
+_READ_ONLY_COMMANDS = {('branch', 'list')}
+
+# Writes whose second identical run, straight after the first, has no further effect
+_IDEMPOTENT_WRITE_COMMANDS = {('branch', 'ready')}
 
 def handle_branch_command(subcommand: str, args: List[str]) -> str:
     """
@@ -22,6 +34,7 @@ def handle_branch_command(subcommand: str, args: List[str]) -> str:
     Returns:
         A string response to be displayed in the chat
     """
+    import git
     if not subcommand:
         return "Error: Branch subcommand is required. Available commands: create, delete, merge, list, update, ready"
     
@@ -59,6 +72,7 @@ def handle_branch_create(args: List[str]) -> str:
     Returns:
         Success or error message
     """
+    import git
     if not args:
         return "Error: Branch name is required. Usage: $branch create <name>"
     
@@ -67,8 +81,9 @@ def handle_branch_create(args: List[str]) -> str:
     # Note: The agent should prefix the branch name with the track name if it's a specialist
     
     try:
-        repo = git.Repo('.')
-        repo.git.checkout('-b', branch_name)
+        context = get_repo_context()
+        context.git.checkout('-b', branch_name)
+        context.invalidate()
         return f"Branch '{branch_name}' created successfully."
     except git.GitCommandError as e:
         return f"Git error: {str(e)}"
@@ -87,6 +102,7 @@ def handle_branch_delete(args: List[str]) -> str:
     Returns:
         Success or error message
     """
+    import git
     if not args:
         return "Error: Branch name is required. Usage: $branch delete <name>"
     
@@ -95,8 +111,9 @@ def handle_branch_delete(args: List[str]) -> str:
     # Note: The agent should verify the branch belongs to its track if it's a specialist
     
     try:
-        repo = git.Repo('.')
-        repo.git.branch('-d', branch_name)
+        context = get_repo_context()
+        context.git.branch('-d', branch_name)
+        context.invalidate()
         return f"Branch '{branch_name}' deleted successfully."
     except git.GitCommandError as e:
         return f"Git error: {str(e)}"
@@ -105,6 +122,10 @@ def handle_branch_merge(args: List[str]) -> str:
     """
     Merge a Git branch into main.
     
+    The merge is computed in memory (`git merge-tree --write-tree`) and main is moved with
+    `git update-ref`, so no branch is checked out. A checkout that has main checked out only
+    gets the files the merge changed.
+    
     Note: This command should only be used by the Orchestrator agent.
     
     Args:
@@ -113,6 +134,7 @@ def handle_branch_merge(args: List[str]) -> str:
     Returns:
         Success or error message
     """
+    import git
     if not args:
         return "Error: Branch name is required. Usage: $branch merge <name>"
     
@@ -121,92 +143,258 @@ def handle_branch_merge(args: List[str]) -> str:
     # Note: The agent should verify it's the Orchestrator before using this command
     
     try:
-        repo = git.Repo('.')
-        main_branch = 'main' if 'main' in [b.name for b in repo.branches] else 'master'
+        context = get_repo_context()
+        main_branch = context.default_branch()
+        if context.resolve(f"refs/heads/{branch_name}") is None:
+            return f"Error: Branch '{branch_name}' not found."
         
-        # Checkout main branch
-        repo.git.checkout(main_branch)
-        
-        # Merge the specified branch
-        repo.git.merge(branch_name)
+        result = context.merge_into(main_branch, f"refs/heads/{branch_name}", f"Merge branch '{branch_name}'")
+        if result.status == 'conflict':
+            return (f"Error: Merging '{branch_name}' into '{main_branch}' conflicts in: {', '.join(result.conflicts)}. "
+                    f"Update the branch with $branch update {branch_name} and resolve the conflicts first.")
+        if result.status == 'up-to-date':
+            return f"Branch '{branch_name}' is already merged into '{main_branch}'."
         
         return f"Branch '{branch_name}' merged successfully into '{main_branch}'."
     except git.GitCommandError as e:
         return f"Git error: {str(e)}"
 
+def parse_command_options(args: List[str], flags: Tuple[str, ...] = ()) -> Tuple[Dict[str, str], List[str]]:
+    """
+    Split chat command arguments into options and positional arguments.
+    
+    Options can be written as '--name value', '--name=value' or 'name=value'.
+    Names listed in flags take no value and are set to 'true'.
+    
+    Args:
+        args: The command arguments
+        flags: The option names that take no value
+        
+    Returns:
+        A tuple of (options, positional arguments)
+    """
+    options = {}
+    positional = []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg.startswith('--'):
+            name, sep, value = arg[2:].partition('=')
+            if not sep and name not in flags:
+                if i + 1 >= len(args):
+                    raise ValueError(f"Option --{name} requires a value")
+                i += 1
+                value = args[i]
+            options[name.replace('-', '_')] = value if sep or name not in flags else 'true'
+        elif '=' in arg:
+            name, _, value = arg.partition('=')
+            options[name.replace('-', '_')] = value
+        else:
+            positional.append(arg)
+        i += 1
+    return options, positional
+
+def _branch_track(branch: str) -> str:
+    """Get the track a branch belongs to from its prefix ('other' for main and unprefixed branches)."""
+    parts = branch.split('-', 1)
+    if len(parts) > 1 and parts[0] != 'main' and parts[0] != 'master':
+        return parts[0]
+    return 'other'
+
+def _branch_cursor_key(sort: str, name: str, committer_date: int) -> Tuple:
+    """Get the position of a branch in a listing, as compared against a paging cursor."""
+    return (-committer_date, name) if sort == 'date' else (name,)
+
+def iter_branch_list(args: List[str]) -> Iterator[str]:
+    """
+    List Git branches, one output line at a time.
+    
+    Branches come from a single `git for-each-ref` call and are written out as they are read,
+    so memory use and the time to the first line don't grow with the number of branches.
+    
+    Options:
+        --track NAME: Only branches of this track (NAME-*)
+        --prefix TEXT: Only branches whose name starts with TEXT
+        --glob PATTERN: Only branches matching PATTERN (e.g. 'api-*-fix')
+        --sort name|date: Alphabetical (default, grouped by track) or most recent commit first
+        --limit N: Show at most N branches (default DEFAULT_BRANCH_LIST_LIMIT, 0 for all)
+        --after CURSOR: Continue a listing after the cursor printed by the previous page
+        --ahead-behind: Show how many commits each branch is ahead of and behind main
+    
+    Args:
+        args: Command arguments
+        
+    Yields:
+        The lines of the formatted branch list
+    """
+    options, _ = parse_command_options(args, flags=('ahead-behind',))
+    sort = options.get('sort', 'name')
+    if sort not in ('name', 'date'):
+        raise ValueError(f"Unknown sort order: {sort}. Use 'name' or 'date'.")
+    limit = int(options.get('limit', DEFAULT_BRANCH_LIST_LIMIT))
+    
+    patterns = []
+    track = options.get('track')
+    if track:
+        patterns += [f"{track.lower()}-*", f"{track.lower()}-*/**"]
+    if options.get('prefix'):
+        patterns += [f"{options['prefix']}*", f"{options['prefix']}*/**"]
+    if options.get('glob'):
+        patterns.append(options['glob'])
+    
+    cursor = None
+    if options.get('after'):
+        if sort == 'date':
+            date, _, name = options['after'].partition(':')
+            cursor = _branch_cursor_key(sort, name, int(date))
+        else:
+            cursor = _branch_cursor_key(sort, options['after'], 0)
+    
+    context = get_repo_context()
+    base = context.default_branch() if options.get('ahead_behind') else None
+    
+    yield "Branches by date:" if sort == 'date' else "Branches by track:"
+    
+    shown = 0
+    current_track = None
+    others = []
+    last = None
+    for branch in context.iter_branches(patterns, sort, base):
+        if cursor is not None and _branch_cursor_key(sort, branch.name, branch.committer_date) <= cursor:
+            continue
+        if limit and shown == limit:
+            # There is at least one more branch, so tell the caller how to continue
+            after = f"{last.committer_date}:{last.name}" if sort == 'date' else last.name
+            if others:
+                yield "\nOther:"
+                yield from others
+            yield f"\n... more branches. Continue with: $branch list {' '.join(_replace_option(args, 'after', after))}"
+            return
+        
+        line = f"- {branch.name}"
+        if sort == 'date':
+            line += datetime.datetime.fromtimestamp(branch.committer_date).strftime(" (%Y-%m-%d %H:%M)")
+        if branch.ahead is not None and branch.name != base:
+            line += f" [+{branch.ahead}/-{branch.behind}]"
+        
+        if sort == 'date':
+            yield line
+        else:
+            branch_track = track.lower() if track else _branch_track(branch.name)
+            if branch_track == 'other':
+                # Unprefixed branches are scattered through the name order, so they go last
+                others.append(line)
+            else:
+                if branch_track != current_track:
+                    yield f"\n{branch_track.capitalize()}:"
+                    current_track = branch_track
+                yield line
+        shown += 1
+        last = branch
+    
+    if others:
+        yield "\nOther:"
+        yield from others
+    if not shown:
+        yield "No matching branches."
+
+def _replace_option(args: List[str], name: str, value: str) -> List[str]:
+    """Get a copy of command arguments with one option set to a new value."""
+    options_removed = []
+    i = 0
+    while i < len(args):
+        arg = args[i]
+        if arg == f"--{name}":
+            i += 2
+            continue
+        if arg.startswith(f"--{name}=") or arg.startswith(f"{name}="):
+            i += 1
+            continue
+        options_removed.append(arg)
+        i += 1
+    return options_removed + [f"--{name}", value]
+
 def handle_branch_list(args: List[str]) -> str:
     """
     List Git branches.
     
     Note: This command behaves differently for Orchestrator vs Specialist agents:
     - Orchestrator: Lists all branches grouped by track
-    - Specialist: Should filter results to show only branches for their track
+    - Specialist: Should pass --track to show only branches for their track
     
     Args:
-        args: Command arguments (unused)
+        args: Command arguments (see iter_branch_list for the options)
         
     Returns:
         Formatted list of branches
     """
+    import git
     try:
-        repo = git.Repo('.')
-        branches = [b.name for b in repo.branches]
-        
-        # Group branches by track
-        tracks = {}
-        for branch in branches:
-            parts = branch.split('-', 1)
-            if len(parts) > 1 and parts[0] != 'main' and parts[0] != 'master':
-                track = parts[0]
-                if track not in tracks:
-                    tracks[track] = []
-                tracks[track].append(branch)
-            else:
-                if 'other' not in tracks:
-                    tracks['other'] = []
-                tracks['other'].append(branch)
-        
-        # Format the output
-        result = "Branches by track:\n"
-        for track, track_branches in sorted(tracks.items()):
-            result += f"\n{track.capitalize()}:\n"
-            for branch in sorted(track_branches):
-                result += f"- {branch}\n"
-        
-        return result.strip()
+        return '\n'.join(iter_branch_list(args))
     except git.GitCommandError as e:
         return f"Git error: {str(e)}"
+    except ValueError as e:
+        return f"Error: {str(e)}"
 
 def handle_branch_update(args: List[str]) -> str:
     """
     Update feature branch with latest changes from main.
     
+    Main is fetched from origin and moved with `git update-ref`, and the feature branch is
+    fast-forwarded when it has no commits of its own. Only a real rebase uses a checkout, in
+    a temporary worktree, and a checkout that has the branch checked out only gets the files
+    that changed.
+    
     Note: This command behaves differently for Orchestrator vs Specialist agents:
     - Orchestrator: Can update any branch
     - Specialist: Should only update branches for their track
     
     Args:
-        args: Command arguments (unused)
+        args: Command arguments [branch_name] (defaults to the current branch)
         
     Returns:
         Success or error message
     """
+    import git
     try:
-        repo = git.Repo('.')
-        current_branch = repo.active_branch.name
+        context = get_repo_context()
+        if args:
+            current_branch = args[0]
+        else:
+            try:
+                current_branch = context.repo.active_branch.name
+            except TypeError:
+                return "Error: HEAD is detached. Please checkout a feature branch or name one: $branch update <name>"
         
         # Ensure we're on a feature branch
-        main_branch = 'main' if 'main' in [b.name for b in repo.branches] else 'master'
+        main_branch = context.default_branch()
         if current_branch == main_branch:
             return f"Error: Cannot update {main_branch} branch. Please checkout a feature branch first."
         
         # Note: The agent should verify the branch belongs to its track if it's a specialist
         
-        # Update the branch
-        repo.git.checkout(main_branch)
-        repo.git.pull('origin', main_branch)
-        repo.git.checkout(current_branch)
-        repo.git.rebase(main_branch)
+        branch_sha = context.resolve(f"refs/heads/{current_branch}")
+        if branch_sha is None:
+            return f"Error: Branch '{current_branch}' not found."
+        
+        # Bring main up to date with origin, as `git pull` would, without checking it out
+        if context.has_remote('origin'):
+            context.git.fetch('origin', main_branch)
+            pulled = context.merge_into(main_branch, 'FETCH_HEAD', f"Merge branch '{main_branch}' of origin")
+            if pulled.status == 'conflict':
+                return f"Error: '{main_branch}' has diverged from origin with conflicts in: {', '.join(pulled.conflicts)}."
+        
+        main_sha = context.resolve(f"refs/heads/{main_branch}")
+        if context.is_ancestor(main_sha, branch_sha):
+            return f"Branch '{current_branch}' is already up to date with '{main_branch}'."
+        
+        if context.is_ancestor(branch_sha, main_sha):
+            new_sha = main_sha
+        else:
+            new_sha, conflicts = context.rebase_detached(branch_sha, main_sha)
+            if new_sha is None:
+                return f"Error: Rebasing '{current_branch}' onto '{main_branch}' conflicts in: {', '.join(conflicts)}."
+        context.advance_branch(current_branch, new_sha, branch_sha, f"runic: update from {main_branch}")
         
         return f"Branch '{current_branch}' updated with latest changes from '{main_branch}'."
     except git.GitCommandError as e:
@@ -237,26 +425,33 @@ def handle_branch_ready(args: List[str]) -> str:
         # Create or update a file in .runic/memory/merge-requests
         merge_dir = Path(".runic/memory/merge-requests")
         merge_dir.mkdir(parents=True, exist_ok=True)
+        requested = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         
-        # Create a file for this merge request
-        merge_file = merge_dir / f"{branch_name}.md"
-        with merge_file.open('w') as f:
-            f.write(f"# Merge Request: {branch_name}\n\n")
-            f.write(f"## Date Requested\n{datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            f.write("## Status\nPending\n\n")
-            f.write("## Notes\n[Add notes here]\n")
+        def request_merge(data: Optional[bytes]) -> bytes:
+            if data is None:
+                return (f"# Merge Request: {branch_name}\n\n"
+                        f"## Date Requested\n{requested}\n\n"
+                        "## Status\nPending\n\n"
+                        "## Notes\n[Add notes here]\n").encode('utf-8')
+            # Re-requesting keeps the notes (and anything else) other agents added
+            from runic.sections import MemoryDocument
+            return MemoryDocument(data).set('Date Requested', requested).set('Status', 'Pending').data
+        
+        from runic.locking import update_file
+        update_file(str(merge_dir / f"{branch_name}.md"), request_merge)
         
         return f"Branch '{branch_name}' marked as ready for merge. The Orchestrator will be notified."
     except Exception as e:
         return f"Error: {str(e)}"
 
-def handle_track_command(subcommand: str, args: List[str]) -> str:
+def handle_track_command(subcommand: str, args: List[str], memory_manager: Optional[Any] = None) -> str:
     """
     Handle track management commands.
     
     Args:
         subcommand: The track subcommand (init, status, list, etc.)
         args: Arguments for the subcommand
+        memory_manager: The MemoryManager to use. If None, a new one is created.
         
     Returns:
         A string response to be displayed in the chat
@@ -266,14 +461,30 @@ def handle_track_command(subcommand: str, args: List[str]) -> str:
     
     try:
         if subcommand == 'init':
-            return handle_track_init(args)
+            return handle_track_init(args, memory_manager)
         # Other track commands would be implemented here
         else:
             return f"Unknown track command: {subcommand}. Available commands: init, status, list, update, save"
     except Exception as e:
         return f"Error: {str(e)}"
 
-def handle_track_init(args: List[str]) -> str:
+def task_branch_suffix(task: str) -> str:
+    """
+    Convert a task line into the kebab-case suffix of a branch name.
+    
+    Placeholder brackets and characters that git doesn't allow in branch names are dropped,
+    e.g. '- [Future task 1]' becomes 'future-task-1'.
+    
+    Args:
+        task: The task line, with or without its leading '-'
+        
+    Returns:
+        The branch name suffix, or an empty string if nothing usable is left
+    """
+    name = task.strip().lstrip('-').strip().lower()
+    return re.sub(r'[^a-z0-9]+', '-', name).strip('-')
+
+def handle_track_init(args: List[str], memory_manager: Optional[Any] = None) -> str:
     """
     Initialize a new track and create its first branch.
     
@@ -281,10 +492,12 @@ def handle_track_init(args: List[str]) -> str:
     
     Args:
         args: Command arguments [track_name]
+        memory_manager: The MemoryManager to use. If None, a new one is created.
         
     Returns:
         Success or error message
     """
+    import git
     if not args:
         return "Error: Track name is required. Usage: $track init <name>"
     
@@ -293,43 +506,32 @@ def handle_track_init(args: List[str]) -> str:
     # Note: The agent should verify it's the Orchestrator before using this command
     
     try:
-        # Create the track using the existing CLI command
-        import subprocess
-        result = subprocess.run(['runic', 'track', 'init', track_name], 
-                               capture_output=True, text=True)
+        # Create the track in-process instead of spawning `runic track init`
+        if memory_manager is None:
+            from runic.memory import MemoryManager
+            memory_manager = MemoryManager()
+        memory_manager.ensure_directories()
         
-        if result.returncode != 0:
-            return f"Error initializing track: {result.stderr}"
-        
-        # Get the track directory name
-        from runic.memory import MemoryManager
-        memory_manager = MemoryManager()
-        track_dir_name = memory_manager._get_track_dir_name(track_name)
+        track = memory_manager.create_track(track_name)
+        if track is not None:
+            track_dir_name = track.dir_name
+            upcoming_tasks = track.upcoming_tasks
+        else:
+            # The track already exists, so branch off its current upcoming tasks
+            track_dir_name = memory_manager._get_track_dir_name(track_name)
+            progress_path = memory_manager.tracks_dir / track_dir_name / 'progress.md'
+            upcoming_tasks = memory_manager.get_upcoming_tasks(progress_path) or []
         
-        # Read the progress.md file to find the first task
-        progress_path = Path(f".runic/memory/tracks/{track_dir_name}/progress.md")
+        # Name the branch after the first upcoming task
         first_task = "initial-setup"  # Default branch name
-        
-        try:
-            content = progress_path.read_text()
-            # Look for the first task in the "Upcoming Tasks" section
-            upcoming_match = content.split("## Upcoming Tasks", 1)
-            if len(upcoming_match) > 1:
-                tasks = upcoming_match[1].strip().split('\n')
-                for task in tasks:
-                    if task.strip().startswith('-'):
-                        # Extract the task name and convert to kebab-case
-                        task_name = task.strip()[1:].strip()
-                        first_task = task_name.lower().replace(' ', '-')
-                        break
-        except Exception:
-            # If we can't read the file or find a task, use the default
-            pass
+        if upcoming_tasks:
+            first_task = task_branch_suffix(upcoming_tasks[0]) or first_task
         
         # Create the first branch for this track
         branch_name = f"{track_dir_name}-{first_task}"
-        repo = git.Repo('.')
-        repo.git.checkout('-b', branch_name)
+        context = get_repo_context()
+        context.git.checkout('-b', branch_name)
+        context.invalidate()
         
         return f"Track '{track_name}' initialized successfully and branch '{branch_name}' created."
     except git.GitCommandError as e:
@@ -368,27 +570,201 @@ def parse_chat_command(message: str) -> Optional[Tuple[str, str, List[str]]]:
     
     return (command_type, subcommand, args)
 
-def handle_chat_command(message: str) -> Optional[str]:
+def parse_chat_script(message: str) -> List[Tuple[str, Optional[Tuple[str, str, List[str]]]]]:
     """
-    Handle a chat command.
+    Parse every chat command in a message.
+    
+    A message that starts with '$' can hold several '$' command lines (other lines are
+    ignored), and a message that is a JSON array holds one command per item: a command
+    string ("$branch create api-auth") or an object like
+    {"command": "branch", "subcommand": "create", "args": ["api-auth"]}. The array can also
+    be wrapped as {"commands": [...], "stop_on_error": true}. Any other message holds no
+    commands, even if a later line starts with '$'.
     
     Args:
-        message: The chat message containing the command
+        message: The chat message to parse
         
     Returns:
-        A response string if the message contains a valid command,
-        or None if no command is found or the command is not recognized
+        A list of (source, parsed) pairs in message order, where parsed is the
+        (command_type, subcommand, args) tuple, or None for a JSON item that isn't a command
     """
-    parsed = parse_chat_command(message)
-    if not parsed:
-        return None
-    
+    text = message.strip()
+    if text.startswith('[') or text.startswith('{'):
+        try:
+            items = json.loads(text)
+        except ValueError:
+            return []
+        if isinstance(items, dict):
+            items = items.get('commands')
+        if not isinstance(items, list):
+            return []
+    elif text.startswith('$'):
+        entries = []
+        for line in text.splitlines():
+            parsed = parse_chat_command(line.strip())
+            if parsed:
+                entries.append((line.strip(), parsed))
+        return entries
+    else:
+        # Ordinary chat that merely mentions a command on a later line is not a script
+        return []
+    
+    entries = []
+    for item in items:
+        parsed = None
+        if isinstance(item, str):
+            source = item.strip()
+            parsed = parse_chat_command(source)
+        elif isinstance(item, dict) and item.get('command'):
+            args = [str(arg) for arg in item.get('args', [])]
+            parsed = (str(item['command']).lstrip('$'), str(item.get('subcommand', '')), args)
+            source = ' '.join(['$' + parsed[0], parsed[1]] + args).strip()
+        else:
+            source = json.dumps(item)
+        entries.append((source, parsed))
+    return entries
+
+def _dispatch_chat_command(parsed: Tuple[str, str, List[str]], memory_manager: Optional[Any] = None) -> Optional[str]:
+    """Run one parsed chat command and return its response, or None if it isn't recognized."""
     command_type, subcommand, args = parsed
     
     if command_type == 'branch':
         return handle_branch_command(subcommand, args)
     elif command_type == 'track':
-        return handle_track_command(subcommand, args)
+        return handle_track_command(subcommand, args, memory_manager)
     # Future: Add handlers for other command types (mem, etc.)
     
     return None
+
+def _is_error_response(response: str) -> bool:
+    """Check whether a handler response reports a failure."""
+    return response.startswith(('Error', 'Git error', 'Unknown'))
+
+def handle_chat_script(message: str, stop_on_error: Optional[bool] = None) -> Optional[List[Dict[str, Any]]]:
+    """
+    Run every chat command in a message in one pass.
+    
+    All commands share one repository context and one MemoryManager. A read-only command
+    repeated with no write in between, or the same write repeated back to back, is run once
+    and its response reused.
+    
+    Args:
+        message: The chat message containing the commands (see parse_chat_script)
+        stop_on_error: Skip the remaining commands after the first failure. If None, use the
+            message's "stop_on_error" setting, which defaults to False.
+        
+    Returns:
+        One {'command', 'ok', 'response'} dictionary per command, in message order,
+        or None if the message contains no command
+    """
+    entries = parse_chat_script(message)
+    if not entries:
+        return None
+    
+    if stop_on_error is None:
+        try:
+            settings = json.loads(message)
+            stop_on_error = bool(settings.get('stop_on_error')) if isinstance(settings, dict) else False
+        except ValueError:
+            stop_on_error = False
+    
+    from runic.memory import MemoryManager
+    memory_manager = MemoryManager()
+    
+    results = []
+    read_only_responses = {}
+    previous = None
+    for source, parsed in entries:
+        if parsed is None:
+            results.append({'command': source, 'ok': False, 'response': f"Error: Not a chat command: {source}"})
+        else:
+            key = (parsed[0], parsed[1], tuple(parsed[2]))
+            if key in read_only_responses:
+                response = read_only_responses[key]
+            elif previous is not None and key == previous[0] and key[:2] in _IDEMPOTENT_WRITE_COMMANDS:
+                response = previous[1]
+            else:
+                response = _dispatch_chat_command(parsed, memory_manager)
+                if key[:2] in _READ_ONLY_COMMANDS:
+                    read_only_responses[key] = response
+                else:
+                    # Anything else may have changed the repository or memory
+                    read_only_responses.clear()
+            previous = (key, response)
+            
+            if response is None:
+                response = f"Unknown command: {source}"
+            results.append({'command': source, 'ok': not _is_error_response(response), 'response': response})
+        
+        if stop_on_error and not results[-1]['ok']:
+            break
+    
+    return results
+
+def format_script_results(results: List[Dict[str, Any]]) -> str:
+    """
+    Format the results of a chat script for display in the chat.
+    
+    Args:
+        results: The results returned by handle_chat_script
+        
+    Returns:
+        One block per command with its status and response
+    """
+    blocks = []
+    for result in results:
+        status = 'ok' if result['ok'] else 'failed'
+        blocks.append(f"[{status}] {result['command']}\n{result['response']}")
+    return '\n\n'.join(blocks)
+
+def stream_chat_command(message: str) -> Optional[Iterator[str]]:
+    """
+    Handle a chat command, yielding its response line by line where the command supports it.
+    
+    Args:
+        message: The chat message containing the command
+        
+    Returns:
+        An iterator over the response lines, or None if the message isn't a recognized command
+    """
+    parsed = parse_chat_command(message.strip())
+    if parsed and parsed[:2] == ('branch', 'list') and len(parse_chat_script(message)) == 1:
+        import git
+        
+        def lines() -> Iterator[str]:
+            try:
+                yield from iter_branch_list(parsed[2])
+            except git.GitCommandError as e:
+                yield f"Git error: {str(e)}"
+            except ValueError as e:
+                yield f"Error: {str(e)}"
+        return lines()
+    
+    response = handle_chat_command(message)
+    return iter([response]) if response is not None else None
+
+def handle_chat_command(message: str) -> Optional[str]:
+    """
+    Handle a chat command.
+    
+    A message with several commands is run as a script (see handle_chat_script).
+    
+    Args:
+        message: The chat message containing the command
+        
+    Returns:
+        A response string if the message contains a valid command,
+        or None if no command is found or the command is not recognized
+    """
+    entries = parse_chat_script(message)
+    if len(entries) > 1 or (entries and entries[0][1] is None):
+        return format_script_results(handle_chat_script(message))
+    
+    parsed = parse_chat_command(message.strip())
+    if not parsed and entries:
+        # The only command of a JSON message, or the only recognized line of a '$' message
+        parsed = entries[0][1]
+    if not parsed:
+        return None
+    
+    return _dispatch_chat_command(parsed)
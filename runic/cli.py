@@ -1,16 +1,51 @@
 import click
-import shutil
 import os
 from pathlib import Path
-import importlib.metadata
 from datetime import datetime
-from runic.memory import MemoryManager
 
-@click.group()
-@click.version_option(importlib.metadata.version('runic'))
-def cli():
+# Heavy modules (shutil, runic.memory, GitPython) are imported inside the commands
+# that need them, and the version is only looked up when --version is passed,
+# so each short-lived `runic` call pays only for what it uses.
+
+class RunicGroup(click.Group):
+    """The runic command group; reports failed daemon requests as errors instead of tracebacks."""
+
+    def invoke(self, ctx):
+        try:
+            return super().invoke(ctx)
+        except Exception as e:
+            from runic.daemon import DaemonError
+            if isinstance(e, DaemonError):
+                raise click.ClickException(str(e))
+            raise
+
+@click.group(cls=RunicGroup)
+@click.version_option(package_name='runic')
+@click.option('--timings', is_flag=True, help='Print where the time went (spans, file and process counts) on stderr')
+@click.option('--trace', 'trace_path', type=click.Path(dir_okay=False),
+              help='Write a Chrome trace (chrome://tracing, Perfetto) of the run to this file')
+@click.pass_context
+def cli(ctx, timings, trace_path):
     """Runic - A framework for parallel development with multiple AI agents"""
-    pass
+    if timings or trace_path:
+        # Instrumentation is only installed here, so runs without these options pay nothing
+        from runic.trace import start_tracing
+        start_tracing(f"runic {ctx.invoked_subcommand or ''}".strip())
+        ctx.call_on_close(lambda: _finish_tracing(timings, trace_path))
+
+def _finish_tracing(timings, trace_path):
+    """Stop tracing and report the recorded spans."""
+    from runic.trace import stop_tracing
+    tracer = stop_tracing()
+    if tracer is None:
+        return
+    if trace_path:
+        tracer.write_trace(trace_path)
+    if timings:
+        for line in tracer.format_summary():
+            click.echo(line, err=True)
+    if trace_path:
+        click.echo(f"Trace written to {trace_path}", err=True)
 
 @click.group()
 def track():
@@ -21,41 +56,38 @@ def track():
 @click.argument('name')
 def track_init(name):
     """Create a new track with the given name"""
+    from runic.memory import MemoryManager
     memory_manager = MemoryManager()
     memory_manager.ensure_directories()
     
-    if memory_manager.create_track(name):
-        # Get kebab-case directory name
-        track_dir_name = memory_manager._get_track_dir_name(name)
-        # Get Title Case display name
-        display_name = memory_manager._to_title_case(name)
-        
-        click.echo(f"Track '{display_name}' created successfully!")
+    new_track = memory_manager.create_track(name)
+    if new_track:
+        click.echo(f"Track '{new_track.display_name}' created successfully!")
         click.echo(f"Edit the track files at:")
-        click.echo(f"  .runic/memory/tracks/{track_dir_name}/active-context.md")
-        click.echo(f"  .runic/memory/tracks/{track_dir_name}/progress.md")
+        click.echo(f"  .runic/memory/tracks/{new_track.dir_name}/active-context.md")
+        click.echo(f"  .runic/memory/tracks/{new_track.dir_name}/progress.md")
     else:
         click.echo(f"Track '{name}' already exists!")
 
 @track.command(name="list")
 def track_list():
     """List all tracks"""
-    memory_manager = MemoryManager()
-    track_files = memory_manager.get_track_memory_files()
+    from runic.daemon import query
+    tracks = query('track_list')
     
-    if not track_files:
+    if not tracks:
         click.echo("No tracks found. Create one with 'runic track init <name>'")
         return
     
     click.echo("Available tracks:")
-    for track in sorted(track_files.keys()):
+    for track in tracks:
         click.echo(f"  - {track}")
 
 @track.command(name="status")
 def track_status():
     """Show status of all tracks"""
-    memory_manager = MemoryManager()
-    track_statuses = memory_manager.get_all_track_statuses()
+    from runic.daemon import query
+    track_statuses = query('track_status')
     
     if not track_statuses:
         click.echo("No tracks found. Create one with 'runic track init <name>'")
@@ -68,6 +100,53 @@ def track_status():
         else:
             click.echo(f"  - {track}: Status not found in progress file")
 
+@track.command(name="workspace")
+@click.argument('name', required=False)
+@click.option('--all', 'all_tracks', is_flag=True, help='Create a workspace for every track')
+@click.option('--path', help='Where to create the workspace (default: ../<project>-<track>)')
+@click.option('--branch', help='The branch to check out (default: the track\'s latest branch)')
+@click.option('--prune', is_flag=True, help='Remove workspaces whose track, branch or directory is gone')
+def track_workspace(name, all_tracks, path, branch, prune):
+    """Create a Git worktree for a track that shares this project's memory"""
+    import git
+    from runic.memory import MemoryManager
+    from runic.workspace import create_workspace, prune_workspaces
+    memory_manager = MemoryManager()
+    tracks = sorted(entry.dir_name for entry in memory_manager.scan_tracks())
+    
+    try:
+        if prune:
+            results = prune_workspaces(tracks)
+            if not results:
+                click.echo("No stale workspaces found.")
+        elif all_tracks or name:
+            if all_tracks and (path or branch):
+                click.echo("Error: --path and --branch only apply to a single track.")
+                return
+            track_dirs = tracks if all_tracks else [memory_manager._get_track_dir_name(name)]
+            missing = [t for t in track_dirs if t not in tracks]
+            if missing:
+                click.echo(f"Track '{missing[0]}' not found. Create it with 'runic track init {missing[0]}'")
+                return
+            if not track_dirs:
+                click.echo("No tracks found. Create one with 'runic track init <name>'")
+                return
+            results = [create_workspace(track_dir, path, branch) for track_dir in track_dirs]
+        else:
+            click.echo("Error: Give a track name, --all or --prune.")
+            return
+    except git.InvalidGitRepositoryError:
+        click.echo("Error: Not a Git repository.")
+        return
+    
+    for result in results:
+        if result.status == 'error':
+            click.echo(f"  ✗ {result.track}: {result.message}")
+            continue
+        click.echo(f"  - {result.track}: {result.status} {result.path}" + (f" ({result.branch})" if result.branch else ""))
+        if result.message:
+            click.echo(f"    {result.message}")
+
 @click.group()
 def mem():
     """Manage memory files"""
@@ -75,153 +154,626 @@ def mem():
 
 @mem.command(name="update")
 @click.option('--track', help='Update only the specified track')
-def mem_update(track):
+@click.option('--verbose', is_flag=True, help='Show the result for every file')
+@click.option('--no-compact', is_flag=True, help="Don't compact files over the size or token threshold")
+def mem_update(track, verbose, no_compact):
     """Update memory files with timestamps"""
-    memory_manager = MemoryManager()
+    from runic.daemon import query
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
     if track:
-        # Convert track name to kebab-case for directory path
-        track_dir_name = memory_manager._get_track_dir_name(track)
-        track_dir = os.path.join('.runic/memory/tracks', track_dir_name)
-        
-        if not os.path.exists(track_dir):
+        result = query('mem_update', {'track': track, 'timestamp': timestamp, 'compact': not no_compact})
+        if not result['found']:
             click.echo(f"Track '{track}' not found!")
             return
         
-        # Get Title Case display name
-        display_name = memory_manager._to_title_case(track)
-        
-        click.echo(f"Updating memory files for track '{display_name}'...")
-        updated = memory_manager.update_track_timestamps(track, timestamp)
-        click.echo(f"Updated {updated} files.")
+        click.echo(f"Updating memory files for track '{result['display_name']}'...")
+        click.echo(f"Updated {result['updated']} files.")
     else:
         click.echo("Updating all memory files...")
-        result = memory_manager.update_all_timestamps(timestamp)
+        result = query('mem_update', {'timestamp': timestamp, 'compact': not no_compact})
         click.echo(f"Updated {result['core']} core files and {result['tracks']} track files.")
-    
+        if result['unchanged']:
+            click.echo(f"{result['unchanged']} files were already up to date.")
+        for path, status, error in result['results']:
+            if status == 'error':
+                click.echo(f"Error updating {path}: {error}")
+            elif verbose:
+                click.echo(f"  {status}: {path}")
+    
+    for compacted in result.get('compacted', []):
+        click.echo(f"Compacted {compacted['path']}: archived {compacted['items']} items "
+                   f"({compacted['bytes_before']} -> {compacted['bytes_after']} bytes).")
     click.echo("Memory update complete!")
 
 def update_file_timestamp(file_path, timestamp):
     """Add or update timestamp in a markdown file"""
+    from runic.memory import MemoryManager
     memory_manager = MemoryManager()
     return memory_manager.update_timestamp(file_path, timestamp)
 
 @mem.command(name="next")
 def mem_next():
     """Determine and execute next steps based on memory analysis"""
-    memory_manager = MemoryManager()
+    from runic.daemon import query
     
     click.echo("Analyzing memory files to determine next steps...")
     
-    # Get all memory files
-    memory_files = memory_manager.get_all_memory_files()
+    next_steps = query('mem_next')
     
     # Check if we have any memory files
-    if not memory_files['core'] and not memory_files['tracks']:
+    if not next_steps['has_memory']:
         click.echo("No memory files found. Initialize memory files first.")
         return
     
     # Analyze progress.md to find next steps
-    progress_file = memory_manager.memory_dir / 'progress.md'
-    if progress_file.exists():
-        try:
-            content = progress_file.read_text()
-            # Extract upcoming tasks if available
-            upcoming_match = content.split("## Upcoming Tasks", 1)
-            if len(upcoming_match) > 1:
-                upcoming_tasks = upcoming_match[1].strip()
-                if upcoming_tasks:
-                    click.echo("Based on memory analysis, recommended next steps:")
-                    for line in upcoming_tasks.split('\n'):
-                        if line.strip().startswith('-'):
-                            click.echo(f"  {line.strip()}")
-                else:
-                    click.echo("No upcoming tasks found in progress.md.")
-            else:
-                click.echo("No 'Upcoming Tasks' section found in progress.md.")
-        except Exception as e:
-            click.echo(f"Error analyzing progress.md: {e}")
+    if next_steps['progress_exists']:
+        upcoming_tasks = next_steps['upcoming']
+        if upcoming_tasks is None:
+            click.echo("No 'Upcoming Tasks' section found in progress.md.")
+        elif upcoming_tasks:
+            click.echo("Based on memory analysis, recommended next steps:")
+            for task in upcoming_tasks:
+                click.echo(f"  {task}")
+        else:
+            click.echo("No upcoming tasks found in progress.md.")
     else:
         click.echo("progress.md not found. Create it to track next steps.")
     
     # Check for active tracks
-    if memory_files['tracks']:
+    if next_steps['tracks']:
         click.echo("\nActive tracks:")
-        for track_name, files in memory_files['tracks'].items():
-            status = memory_manager.get_track_status(track_name)
+        for track_name, status in next_steps['tracks'].items():
             click.echo(f"  - {track_name}: {status or 'No status available'}")
     
     click.echo("\nRecommended actions:")
     click.echo("1. Update memory files with recent changes: runic mem update")
     click.echo("2. Review track statuses: runic track status")
-    if not memory_files['tracks']:
+    if not next_steps['tracks']:
         click.echo("3. Initialize your first track: runic track init <name>")
 
-@click.group()
-def integrate():
-    """Integration points for external tools"""
-    pass
-
-@click.command()
-def init():
-    """Initialize Runic in the current project"""
-    # Create .runic directory if it doesn't exist
-    if not os.path.exists('.runic'):
-        click.echo("Creating .runic directory.")
-        os.makedirs('.runic')
+@mem.command(name="watch")
+@click.option('--once', is_flag=True, help='Print the changes since the last run and exit')
+@click.option('--poll', is_flag=True, help='Poll for changes instead of using inotify')
+@click.option('--interval', type=float, default=None, help='Seconds between polls (default: 1)')
+@click.option('--socket', 'socket_path', help='Send events to clients of this Unix socket instead of stdout')
+@click.option('--state', 'state_path', default='.runic/watch-state.json', show_default=True,
+              help='Where this consumer keeps the last-seen index; give each consumer its own')
+def mem_watch(once, poll, interval, socket_path, state_path):
+    """Stream memory changes as NDJSON events, one per changed section"""
+    import json
+    from runic.watch import DEFAULT_POLL_INTERVAL, EventSocket, MemoryWatcher
+    if not os.path.isdir('.runic/memory'):
+        click.echo("No .runic/memory directory found. Run 'runic init' first.", err=True)
+        return
+    
+    # Consumers sharing a state file see each change only once between them
+    if os.path.dirname(state_path):
+        os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    watcher = MemoryWatcher('.runic/memory', state_path=state_path)
+    if once:
+        for event in watcher.refresh():
+            click.echo(json.dumps(event))
+        watcher.save()
+        return
+    
+    try:
+        server = EventSocket(socket_path) if socket_path else None
+    except OSError as e:
+        raise click.ClickException(f"Couldn't listen on {socket_path}: {e}")
     
-    # Get the absolute path to the current file (cli.py)
-    cli_file_path = Path(__file__).resolve()
+    def emit(event):
+        if server:
+            server.send(event)
+        else:
+            click.echo(json.dumps(event))
     
-    # Get the absolute path to the .runic directory in the package
-    package_dir = cli_file_path.parent
-    core_files_dir = package_dir / '.runic'
+    if server:
+        click.echo(f"Sending memory change events to {socket_path} (Ctrl+C to stop)", err=True)
     
-    click.echo(f"Using core files directory: {core_files_dir}")
+    import signal
     
-    # Check if the template directory exists
-    if not core_files_dir.exists():
-        click.echo(f"Error: Core files directory not found at {core_files_dir}")
+    def terminate(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        watcher.watch(emit, interval or DEFAULT_POLL_INTERVAL, use_inotify=not poll)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server:
+            server.close()
+
+@mem.command(name="pack")
+@click.option('--budget', type=int, required=True, help='Maximum number of tokens in the bundle')
+@click.option('--role', type=click.Choice(['orchestrator', 'specialist']), default=None,
+              help='Agent role (default: specialist with --track, orchestrator otherwise)')
+@click.option('--track', help="The specialist's track")
+@click.option('--query', help='Prefer sections mentioning these words')
+@click.option('--tokenizer', help="'approx' (default), 'tiktoken' or 'module:function'")
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='Write the bundle to a file instead of stdout')
+@click.option('--stats', is_flag=True, help='Report the included and dropped sections on stderr')
+def mem_pack(budget, role, track, query, tokenizer, output, stats):
+    """Build one token-budgeted context bundle for a role"""
+    from runic.memory import MemoryManager
+    from runic.pack import ContextPacker
+    memory_manager = MemoryManager()
+    if track and not (memory_manager.tracks_dir / memory_manager._get_track_dir_name(track)).is_dir():
+        click.echo(f"Track '{track}' not found.", err=True)
         return
     
-    # Create symlinks for all files except memory.templates
+    try:
+        packer = ContextPacker(memory_manager, tokenizer)
+        result = packer.pack(role or ('specialist' if track else 'orchestrator'), budget, track, query)
+    except ValueError as e:
+        click.echo(f"Error: {e}", err=True)
+        return
     
-    click.echo("Symlinking core files...")
+    if output:
+        Path(output).write_text(result.text)
+    else:
+        click.echo(result.text, nl=False)
+    
+    if stats or output:
+        click.echo(f"Packed {len(result.included)} sections in {result.tokens} of {budget} tokens; "
+                   f"dropped {len(result.dropped)}.", err=True)
+    if stats:
+        for item in result.dropped:
+            click.echo(f"  - dropped {os.path.relpath(item.path)} > {item.heading or '(preamble)'} "
+                       f"({item.tokens} tokens, score {item.score:.0f})", err=True)
+
+@mem.command(name="search")
+@click.argument('query', nargs=-1, required=True)
+@click.option('--track', help='Only search the files of this track')
+@click.option('--section', help='Only search sections whose heading contains this text')
+@click.option('--kind', type=click.Choice(['core', 'track', 'merge-request', 'archive']),
+              help='Only search this kind of memory file')
+@click.option('--limit', '-n', type=int, default=10, help='Maximum number of results')
+@click.option('--json', 'as_json', is_flag=True, help='Print the results as JSON')
+def mem_search(query, track, section, kind, limit, as_json):
+    """Full-text search over all memory files, ranked with BM25"""
+    import json
+    from runic.daemon import query as daemon_query
+    from runic.memory import MemoryManager
+    memory_manager = MemoryManager()
+    track_dir = memory_manager._get_track_dir_name(track) if track else None
+    if track_dir and not (memory_manager.tracks_dir / track_dir).is_dir():
+        click.echo(f"Track '{track}' not found.")
+        return
+
+    response = daemon_query('mem_search', {'query': ' '.join(query), 'limit': limit, 'track': track_dir,
+                                           'section': section, 'kind': kind})
+    if as_json:
+        click.echo(json.dumps(response['results'], indent=2))
+        return
+    if not response['results']:
+        click.echo("No matching sections.")
+        return
+    for hit in response['results']:
+        lines = f"{hit['line']}-{hit['end_line']}" if hit['end_line'] > hit['line'] else f"{hit['line']}"
+        click.echo(f"{os.path.relpath(hit['file'])}:{lines}  {hit['heading'] or '(preamble)'}  ({hit['score']:.2f})")
+        for line in hit['snippet'].split('\n'):
+            click.echo(f"    {line[:200]}" + ("…" if len(line) > 200 else ""))
+
+@mem.command(name="compact")
+@click.option('--track', help="Only compact this track's files")
+@click.option('--keep', type=int, default=5, show_default=True, help='Items kept in each history section')
+@click.option('--auto', is_flag=True, help='Only compact files over the size or token threshold')
+@click.option('--max-bytes', type=int, help='Size threshold for --auto (default: $RUNIC_COMPACT_MAX_BYTES or 8192)')
+@click.option('--max-tokens', type=int, help='Token threshold for --auto (default: $RUNIC_COMPACT_MAX_TOKENS or 2000)')
+@click.option('--tracks', is_flag=True, help="Also move the directories of finished tracks to the archive")
+@click.option('--dry-run', is_flag=True, help='Show what would be archived without changing anything')
+def mem_compact(track, keep, auto, max_bytes, max_tokens, tracks, dry_run):
+    """Move completed tasks and finished tracks to the memory archive"""
+    from runic.daemon import query
+    from runic.memory import MemoryManager
+    memory_manager = MemoryManager()
+    if track and not (memory_manager.tracks_dir / memory_manager._get_track_dir_name(track)).is_dir():
+        click.echo(f"Track '{track}' not found.")
+        return
     
-    for root, dirs, files in os.walk(str(core_files_dir)):
-        # Skip memory.templates directory for symlinking
-        if 'memory.templates' in root:
-            continue
-            
-        # Get the relative path from core_files_dir
-        rel_path = os.path.relpath(root, str(core_files_dir))
-        
-        # Create the corresponding directory in .runic
-        if rel_path != '.':
-            target_dir = os.path.join('.runic', rel_path)
-            os.makedirs(target_dir, exist_ok=True)
+    results = query('mem_compact', {'track': track, 'keep': keep, 'auto': auto, 'max_bytes': max_bytes,
+                                    'max_tokens': max_tokens, 'tracks': tracks, 'dry_run': dry_run})
+    if not results:
+        click.echo("Nothing to compact.")
+        return
+    verb = "Would archive" if dry_run else "Archived"
+    for result in results:
+        if result['action'] == 'archived-track':
+            click.echo(f"{verb} finished track {result['path']} ({result['items']} files, {result['bytes_before']} bytes)")
         else:
-            target_dir = '.runic'
-        
-        # Create symlinks for all files in the current directory
-        for file in files:
-            src = os.path.join(root, file)
-            dst = os.path.join(target_dir, file)
-            
-            # Create absolute symlink
-            os.symlink(src, dst)
+            size = "" if dry_run else f", {result['bytes_before']} -> {result['bytes_after']} bytes"
+            click.echo(f"{verb} {result['items']} items from {result['path']}{size}")
+    if not dry_run:
+        click.echo("See .runic/memory/archive/index.jsonl for the archived entries.")
+
+@mem.command(name="reindex")
+def mem_reindex():
+    """Rebuild the parsed-memory index from scratch"""
+    from runic.daemon import query
+    indexed = query('mem_reindex')
+    click.echo(f"Reindexed {indexed} memory files.")
+
+@click.command()
+@click.argument('message')
+@click.option('--json', 'as_json', is_flag=True, help='Print one JSON result per command')
+@click.option('--stop-on-error', is_flag=True, help='Skip the remaining commands after the first failure')
+def chat(message, as_json, stop_on_error):
+    """Run $ chat commands, e.g. runic chat '$branch list'
+
+    MESSAGE can hold several $ command lines, or a JSON array of commands; they all
+    run in one pass. Use - to read MESSAGE from standard input.
+    """
+    from runic.daemon import query
+    if message == '-':
+        import sys
+        message = sys.stdin.read()
+    
+    if as_json or stop_on_error:
+        results = query('chat_script', {'message': message, 'stop_on_error': stop_on_error or None})
+        if results is None:
+            click.echo(f"Not a recognized chat command: {message}")
+        elif as_json:
+            import json
+            click.echo(json.dumps(results, indent=2))
+        else:
+            from runic.chat_commands import format_script_results
+            click.echo(format_script_results(results))
+        return
+    
+    from runic.daemon import DaemonUnavailable, send_request
+    if not os.environ.get('RUNIC_NO_DAEMON'):
+        try:
+            response = send_request('chat', {'message': message})
+        except DaemonUnavailable:
+            pass
+        else:
+            click.echo(response if response is not None else f"Not a recognized chat command: {message}")
+            return
+    
+    # In-process, long responses such as $branch list are printed as they are produced
+    from runic.chat_commands import stream_chat_command
+    lines = stream_chat_command(message)
+    if lines is None:
+        click.echo(f"Not a recognized chat command: {message}")
+        return
+    for line in lines:
+        click.echo(line)
+
+@click.group(name='merge-queue')
+def merge_queue():
+    """Process the merge requests made with $branch ready"""
+    pass
+
+@merge_queue.command(name="list")
+@click.option('--order', type=click.Choice(['time', 'priority']), default='time', help='Processing order')
+@click.option('--all', 'include_all', is_flag=True, help='Include requests that are no longer pending')
+def merge_queue_list(order, include_all):
+    """List merge requests in processing order"""
+    from runic.merge_queue import MergeQueue
+    requests = MergeQueue().requests(order, include_all)
+    if not requests:
+        click.echo("No pending merge requests.")
+        return
+    
+    click.echo("Merge requests:")
+    for request in requests:
+        priority = f", priority {request.priority}" if request.priority else ""
+        click.echo(f"  - {request.branch}: {request.status} (requested {request.requested}{priority})")
+
+@merge_queue.command(name="run")
+@click.option('--batch-size', type=int, default=None, help='Number of requests merged and tested together (default: 4)')
+@click.option('--order', type=click.Choice(['time', 'priority']), default='time', help='Processing order')
+@click.option('--test', 'test_command', help='Shell command that must pass on each merged batch')
+@click.option('--test-timeout', type=int, default=None, help='Seconds the test command may run (default: 1800)')
+@click.option('--dry-run', is_flag=True, help="Test the batches without moving main or updating requests")
+def merge_queue_run(batch_size, order, test_command, test_timeout, dry_run):
+    """Merge pending requests into main in tested batches"""
+    import git
+    from runic.merge_queue import DEFAULT_BATCH_SIZE, DEFAULT_TEST_TIMEOUT, MergeQueue
+    
+    def report(result):
+        mark = '✓' if result.status == 'merged' else '✗'
+        click.echo(f"  {mark} {result.branch}: {result.detail}")
     
+    try:
+        results = MergeQueue().run(batch_size or DEFAULT_BATCH_SIZE, order, test_command,
+                                   test_timeout or DEFAULT_TEST_TIMEOUT, dry_run, progress=report)
+    except (git.GitCommandError, ValueError) as e:
+        click.echo(f"Error: {e}")
+        return
+    
+    if not results:
+        click.echo("No pending merge requests.")
+        return
+    merged = sum(1 for result in results if result.status == 'merged')
+    click.echo(f"{merged} of {len(results)} merge requests {'would merge' if dry_run else 'merged'}.")
+
+@click.command()
+@click.option('--stop', is_flag=True, help='Stop the daemon running for this project')
+def serve(stop):
+    """Run a local daemon that answers runic and $ commands over a Unix socket"""
+    from runic.daemon import DaemonError, run_daemon, send_request, socket_path
+    if stop:
+        try:
+            send_request('shutdown')
+            click.echo("Runic daemon stopped.")
+        except DaemonError as e:
+            click.echo(f"Error: {e}")
+        return
     
-    # Copy memory.templates to memory
-    click.echo("Copying memory templates...")
+    if not os.path.exists('.runic'):
+        click.echo("No .runic directory found. Run 'runic init' first.")
+        return
     
-    memory_core_files_dir = core_files_dir / 'memory.templates'
-    memory_dir = Path('.runic') / 'memory'
+    click.echo(f"Runic daemon listening on {socket_path()} (Ctrl+C to stop)")
+    try:
+        run_daemon()
+    except DaemonError as e:
+        click.echo(f"Error: {e}")
+
+@click.command(name="compile")
+@click.option('--track', 'tracks', multiple=True, help='Compile only the bundle of this track (repeatable)')
+@click.option('--force', is_flag=True, help='Reassemble every bundle even if its sources are unchanged')
+@click.option('--verbose', is_flag=True, help='Show the result for every bundle')
+def compile_bundles(tracks, force, verbose):
+    """Assemble one prompt file per role and track in .runic/build"""
+    from runic.build import BundleCompiler
+    from runic.memory import MemoryManager
+    memory_manager = MemoryManager()
+    if not memory_manager.base_dir.is_dir():
+        click.echo("Runic is not initialized in this project. Run 'runic init' first.")
+        return
+
+    track_dirs = None
+    if tracks:
+        track_dirs = [memory_manager._get_track_dir_name(name) for name in tracks]
+        for name, track_dir in zip(tracks, track_dirs):
+            if not (memory_manager.tracks_dir / track_dir).is_dir():
+                click.echo(f"Track '{name}' not found.")
+                return
+
+    results = BundleCompiler(memory_manager).compile(track_dirs, force)
+    for result in results:
+        if verbose or result.status != 'unchanged':
+            click.echo(f"  {result.status:<9} {os.path.relpath(result.path)}"
+                       + (f" ({result.sources} sources)" if result.sources else ""))
+    built = sum(1 for result in results if result.status == 'built')
+    click.echo(f"Compiled {len(results)} bundles: {built} rebuilt, "
+               f"{sum(1 for result in results if result.status == 'unchanged')} unchanged.")
+
+@click.group()
+def bench():
+    """Benchmark the commands on synthetic projects"""
+    pass
+
+@bench.command(name="run")
+@click.option('--tracks', type=int, multiple=True, help='Number of tracks (repeatable; default: 20)')
+@click.option('--file-kb', type=int, multiple=True, help='Size of each memory file in KiB (repeatable; default: 4)')
+@click.option('--branches', type=int, multiple=True, help='Number of Git branches (repeatable; default: 100)')
+@click.option('--repeat', type=int, default=5, show_default=True, help='Timed runs of each command after the first')
+@click.option('--only', multiple=True, help='Only run the commands starting with this name (repeatable)')
+@click.option('--subprocess', 'use_subprocess', is_flag=True, help='Run each command as a separate runic process')
+@click.option('--history', default='runic-bench.json', show_default=True, help='JSON file the results are added to')
+@click.option('--label', help='Name of this run, for runic bench compare')
+@click.option('--keep', type=click.Path(file_okay=False), help='Generate the projects in this directory and keep them')
+@click.option('--compare', 'compare_previous', is_flag=True, help='Compare with the previous run in the history')
+def bench_run(tracks, file_kb, branches, repeat, only, use_subprocess, history, label, keep, compare_previous):
+    """Time every command on synthetic projects of each size
+
+    Each combination of --tracks, --file-kb and --branches gets its own project.
+    """
+    import itertools
+    from runic.bench import (DEFAULT_BRANCHES, DEFAULT_FILE_KB, DEFAULT_TRACKS, append_history,
+                             compare_runs, format_comparison, format_table, load_history, run_benchmarks)
+    cases = [{'tracks': t, 'file_kb': f, 'branches': b} for t, f, b in itertools.product(
+        tracks or [DEFAULT_TRACKS], file_kb or [DEFAULT_FILE_KB], branches or [DEFAULT_BRANCHES])]
+    try:
+        record = run_benchmarks(cases, repeat, only, use_subprocess, keep, progress=click.echo)
+    except RuntimeError as e:
+        click.echo(f"Error: {e}")
+        return
+    if label:
+        record['label'] = label
+    
+    for line in format_table(record):
+        click.echo(line)
+    previous = load_history(history)
+    index = append_history(history, record)
+    click.echo(f"Saved as run {index} in {history}.")
+    if compare_previous:
+        # Timings of in-process and subprocess runs aren't comparable
+        same_mode = [run for run in previous if run.get('mode') == record['mode']]
+        if not same_mode:
+            click.echo("No previous run to compare with.")
+        else:
+            comparisons = compare_runs(same_mode[-1], record)
+            for line in format_comparison(comparisons):
+                click.echo(line)
+            if any(c.status == 'regression' for c in comparisons):
+                raise SystemExit(1)
+
+@bench.command(name="compare")
+@click.argument('base', default='-2')
+@click.argument('head', default='-1')
+@click.option('--history', default='runic-bench.json', show_default=True, help='JSON file with the results')
+@click.option('--threshold', type=float, default=20.0, show_default=True,
+              help='Percentage the median must grow by to count as a regression')
+@click.option('--min-ms', type=float, default=2.0, show_default=True,
+              help='Milliseconds the median must grow by to count as a regression')
+def bench_compare(base, head, history, threshold, min_ms):
+    """Compare two runs and flag regressions (exit status 1 if any)
+
+    BASE and HEAD are run indexes (negative counts from the end) or labels; by default
+    the last two runs are compared.
+    """
+    from runic.bench import compare_runs, find_run, format_comparison, load_history
+    runs = load_history(history)
+    indexes = [find_run(runs, ref) for ref in (base, head)]
+    for ref, index in zip((base, head), indexes):
+        if index is None:
+            click.echo(f"Run '{ref}' not found in {history}.")
+            return
+    base_run, head_run = (runs[index] for index in indexes)
+    click.echo(f"Comparing run {indexes[0]} ({base_run['time']}) with run {indexes[1]} ({head_run['time']})")
+    if base_run.get('mode') != head_run.get('mode'):
+        click.echo(f"Warning: the runs used different modes ({base_run.get('mode')} and {head_run.get('mode')}).")
+    comparisons = compare_runs(base_run, head_run, threshold / 100.0, min_ms)
+    for line in format_comparison(comparisons):
+        click.echo(line)
+    if any(c.status == 'regression' for c in comparisons):
+        raise SystemExit(1)
+
+@click.group()
+def integrate():
+    """Integration points for external tools"""
+    pass
+
+@integrate.command(name="docs")
+@click.argument('source')
+@click.option('--tool', type=click.Choice(['builtin']), default='builtin', help='Ingester to use')
+@click.option('--name', help='Directory name under .runic/docs (default: derived from the source)')
+@click.option('--concurrency', type=int, default=None, help='Requests in flight at once (default: 32)')
+@click.option('--per-host', type=int, default=None, help='Requests in flight at once per host (default: 8)')
+@click.option('--max-pages', type=int, default=None, help='Maximum number of pages (default: 1000)')
+@click.option('--force', is_flag=True, help='Re-fetch every page, ignoring ETag and Last-Modified')
+@click.option('--verbose', is_flag=True, help='Show the result for every page')
+def integrate_docs(source, tool, name, concurrency, per_host, max_pages, force, verbose):
+    """Ingest a documentation site or local mirror into .runic/docs"""
+    from runic import docs
+    if not Path('.runic').is_dir():
+        click.echo("Runic is not initialized in this project. Run 'runic init' first.")
+        return
+
+    try:
+        ingester = docs.DocsIngester(source, name, '.runic', concurrency or docs.DEFAULT_CONCURRENCY,
+                                     per_host or docs.DEFAULT_PER_HOST, max_pages or docs.DEFAULT_MAX_PAGES)
+    except ValueError as e:
+        click.echo(f"Error: {e}")
+        return
+
+    def report(page):
+        if page.status in ('failed', 'skipped'):
+            click.echo(f"  ✗ {page.url}: {page.status}, {page.detail}")
+        elif verbose:
+            click.echo(f"  - {page.url}: {page.status} ({page.chunks} chunks)")
+
+    click.echo(f"Ingesting {ingester.start_url} into {ingester.docs_dir}...")
+    result = ingester.run(force, report)
+    counts = {}
+    for page in result.pages:
+        counts[page.status] = counts.get(page.status, 0) + 1
+    summary = ', '.join(f"{count} {status}" for status, count in sorted(counts.items()))
+    click.echo(f"{len(result.pages)} pages ({summary or 'none'}) in {result.seconds:.1f}s; "
+               f"{result.chunks_written} chunks written, {result.chunks_removed} removed.")
+    click.echo(f"Table of contents: {ingester.docs_dir / 'toc.md'}")
+
+@integrate.command(name="vector-db")
+@click.option('--tool', type=click.Choice(['builtin']), default='builtin', help='Vector database to use')
+@click.option('--action', type=click.Choice(['index', 'query', 'stats', 'clear']), default=None,
+              help='What to do (default: query with --query, index otherwise)')
+@click.option('--query', 'queries', multiple=True, help='Text to search for (repeatable; answered in one batch)')
+@click.option('-k', 'k', type=int, default=5, help='Number of results per query')
+@click.option('--embedder', help="'hashing' (default), 'hashing:<dim>' or 'module:function'")
+@click.option('--json', 'as_json', is_flag=True, help='Print the results as JSON')
+def integrate_vector_db(tool, action, queries, k, embedder, as_json):
+    """Search memory sections with the built-in local vector index"""
+    import json
+    from runic.daemon import query
+    from runic.vector import VectorIndex
+    action = action or ('query' if queries else 'index')
+    if not Path('.runic').is_dir():
+        click.echo("Runic is not initialized in this project. Run 'runic init' first.")
+        return
+
+    try:
+        if action == 'query':
+            if not queries:
+                click.echo("Error: --action query needs at least one --query.")
+                return
+            response = query('vector_query', {'queries': list(queries), 'k': k, 'embedder': embedder})
+            if as_json:
+                click.echo(json.dumps(response['results'] if len(queries) > 1 else response['results'][0], indent=2))
+                return
+            for text, hits in zip(queries, response['results']):
+                if len(queries) > 1:
+                    click.echo(f"Results for '{text}':")
+                if not hits:
+                    click.echo("  No matching sections.")
+                for hit in hits:
+                    click.echo(f"  {hit['score']:.3f}  {os.path.relpath(hit['file'])}:{hit['line']}  {hit['heading']}")
+                    click.echo(f"         {hit['preview'][:100]}")
+            return
+
+        index = VectorIndex('.runic', embedder)
+        if action == 'clear':
+            index.clear()
+            click.echo("Vector index deleted.")
+            return
+        if action == 'index':
+            update = index.update()
+            click.echo(f"Indexed {update.chunks} chunks: {update.files} files read, "
+                       f"{update.embedded} chunks embedded, {update.removed} removed.")
+        stats = index.stats()
+        if as_json:
+            click.echo(json.dumps(stats, indent=2))
+        elif action == 'stats':
+            click.echo(f"Embedder: {stats['embedder']} ({stats['dim'] or '?'} dimensions)")
+            click.echo(f"Chunks: {stats['chunks']} from {stats['files']} files ({stats['free_rows']} free rows)")
+            click.echo(f"Vector file: {stats['bytes'] / 1048576:.1f} MiB")
+    except ValueError as e:
+        click.echo(f"Error: {e}")
+
+def _sync_runic(replace_files=False, refresh_templates=False, full=False, dry_run=False, verbose=False,
+                backup=None, before_apply=None):
+    """Link .runic to the package's core files and report what changed.
+
+    Returns:
+        The plan, or None if the package's core files are missing.
+    """
+    from runic.sync import SyncEngine
+    engine = SyncEngine('.runic')
+    click.echo(f"Core files directory: {engine.package_dir}")
+    if not engine.package_dir.exists():
+        click.echo(f"Error: Core files directory not found at {engine.package_dir}")
+        return None
+    
+    plan = engine.plan(replace_files, refresh_templates, full)
+    if plan.up_to_date:
+        click.echo("Core files are up to date (the package hasn't changed since the last sync; use --full to check every link).")
+        return plan
+    if before_apply and plan.changes() and not dry_run:
+        before_apply(plan)
+    counts = engine.apply(plan, dry_run, backup)
+    
+    for op in plan.ops:
+        if op.action == 'keep':
+            click.echo(f"Kept .runic/{op.path} ({op.reason}; use --force to replace it with a link)")
+        elif op.action != 'skip' and (dry_run or verbose):
+            click.echo(f"  {op.action}: .runic/{op.path}" + (f" ({op.reason})" if op.reason else ""))
+    verb = "Would change" if dry_run else "Changed"
+    links = sum(counts.get(action, 0) for action in ('create', 'relink', 'replace', 'remove'))
+    click.echo(f"{verb} {links} links ({counts.get('create', 0)} created, {counts.get('relink', 0)} relinked, "
+               f"{counts.get('replace', 0)} replaced, {counts.get('remove', 0)} removed), copied "
+               f"{counts.get('copy', 0)} memory templates; {counts.get('skip', 0)} files already in place.")
+    if counts.get('conflict'):
+        click.echo(f"Kept {counts['conflict']} memory files that another agent changed during the update; run it again to refresh them.")
+    return plan
+
+@click.command()
+@click.option('--dry-run', is_flag=True, help='Show what would be linked and copied without changing anything')
+@click.option('--verbose', is_flag=True, help='Show every link created and template copied')
+def init(dry_run, verbose):
+    """Initialize Runic in the current project"""
+    from runic.memory import MemoryManager
+    # Create .runic directory if it doesn't exist
+    if not os.path.exists('.runic') and not dry_run:
+        click.echo("Creating .runic directory.")
+        os.makedirs('.runic')
     
-    if memory_core_files_dir.exists():
-        # Copy the entire directory
-        shutil.copytree(str(memory_core_files_dir), str(memory_dir), dirs_exist_ok=True)
+    # Existing links and memory files are kept, so init can be run again safely
+    if _sync_runic(full=True, dry_run=dry_run, verbose=verbose) is None or dry_run:
+        return
     
     # Create memory directory structure
     memory_manager = MemoryManager()
@@ -229,177 +781,134 @@ def init():
 
     click.echo("✅ Runic initialized successfully!")
 
+def _snapshot_runic(reason):
+    """Snapshot .runic before it is changed and say how to undo the change."""
+    from runic.snapshot import SnapshotStore
+    snapshot = SnapshotStore('.runic').create(reason)
+    click.echo(f"Saved snapshot {snapshot.id} of .runic ({snapshot.files} files, {snapshot.new_bytes} new bytes); "
+               f"undo with 'runic snapshot restore {snapshot.id}'")
+    return snapshot
+
 @click.command()
 @click.option('--force', is_flag=True, help='Force update of memory files')
-def update(force):
+@click.option('--full', is_flag=True, help="Check every link even if the package hasn't changed since the last sync")
+@click.option('--dry-run', is_flag=True, help='Show what would change without changing anything')
+@click.option('--verbose', is_flag=True, help='Show every link changed')
+def update(force, full, dry_run, verbose):
     """Update Runic symlinks to point to the latest package files"""
     if not os.path.exists('.runic'):
         click.echo("No .runic directory found. Run 'runic init' first.")
         return
     
-    # Get the absolute path to the current file (cli.py)
-    cli_file_path = Path(__file__).resolve()
-    
-    # Get the absolute path to the .runic directory in the package
-    package_dir = cli_file_path.parent
-    core_files_dir = package_dir / '.runic'
+    def report_replaced(path):
+        click.echo(f"Replaced {path} with a link (the edited file is in the snapshot)")
     
-    click.echo(f"Core files directory: {core_files_dir}")
-    
-    # Check if the template directory exists
-    if not core_files_dir.exists():
-        click.echo(f"Error: Core files directory not found at {core_files_dir}")
-        return
+    def snapshot_changes(plan):
+        # Only replaced files and refreshed templates lose content; links are recreated from the package
+        if any(op.action in ('replace', 'copy') for op in plan.ops):
+            _snapshot_runic('update')
     
-    # Update symlinks
-    updated_links = 0
-    for root, dirs, files in os.walk(str(core_files_dir)):
-        # Skip memory.templates directory
-        if 'memory.templates' in root:
-            continue
-            
-        # Get the relative path from core_files_dir
-        rel_path = os.path.relpath(root, core_files_dir)
-        
-        # Get the corresponding directory in .runic
-        if rel_path != '.':
-            target_dir = os.path.join('.runic', rel_path)
-        else:
-            target_dir = '.runic'
-        
-        # Create the directory if it doesn't exist
-        os.makedirs(target_dir, exist_ok=True)
-        
-        # Update symlinks for all files in the current directory
-        for file in files:
-            src = os.path.join(root, file)
-            dst = os.path.join(target_dir, file)
-            
-            # If the destination exists and is a symlink, update it
-            if os.path.exists(dst):
-                if os.path.islink(dst):
-                    os.unlink(dst)
-                    create_symlink(src, dst)
-                    updated_links += 1
-                elif force:
-                    # If force is specified, backup and replace regular files
-                    backup = f"{dst}.bak"
-                    shutil.copy2(dst, backup)
-                    os.unlink(dst)
-                    create_symlink(src, dst)
-                    updated_links += 1
-                    click.echo(f"Backed up and replaced {dst} (backup at {backup})")
-            else:
-                # If the destination doesn't exist, create the symlink
-                create_symlink(src, dst)
-                updated_links += 1
-    
-    click.echo(f"Updated {updated_links} symlinks to point to the latest package files.")
-    
-    # Optionally update memory files if --force is specified
-    if force:
-        memory_core_files_dir = core_files_dir / 'memory.templates'
-        memory_dir = Path('.runic') / 'memory'
-        
-        # Backup memory directory
-        backup_dir = f"{memory_dir}.bak.{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        shutil.copytree(str(memory_dir), str(backup_dir))
-        click.echo(f"Backed up memory directory to {backup_dir}")
-        
-        # Copy new templates, preserving existing files
-        for root, dirs, files in os.walk(memory_core_files_dir):
-            rel_path = os.path.relpath(root, memory_core_files_dir)
-            target_dir = os.path.join(memory_dir, rel_path) if rel_path != '.' else memory_dir
-            os.makedirs(target_dir, exist_ok=True)
-            
-            for file in files:
-                src = os.path.join(root, file)
-                dst = os.path.join(target_dir, file)
-                
-                # Only copy if the file doesn't exist or is newer
-                if not os.path.exists(dst) or os.path.getmtime(src) > os.path.getmtime(dst):
-                    shutil.copy2(src, dst)
-                    click.echo(f"Updated {dst}")
-        
-        click.echo("Memory files have been updated. Previous versions are available in the backup directory.")
+    plan = _sync_runic(replace_files=force, refresh_templates=force, full=full, dry_run=dry_run, verbose=verbose,
+                       backup=report_replaced, before_apply=snapshot_changes if force else None)
+    if force and plan is not None and not dry_run and any(op.action == 'copy' for op in plan.ops):
+        click.echo("Memory files have been updated. Previous versions are available in the snapshot.")
 
 @click.command()
-def migrate():
+@click.option('--dry-run', is_flag=True, help='Show what would be replaced without changing anything')
+@click.option('--verbose', is_flag=True, help='Show every link changed')
+def migrate(dry_run, verbose):
     """Migrate an existing .runic directory to use symlinks"""
     if not os.path.exists('.runic'):
         click.echo("No .runic directory found. Run 'runic init' first.")
         return
     
-    # Backup existing .runic directory
-    backup_dir = f".runic.bak.{datetime.now().strftime('%Y%m%d%H%M%S')}"
-    shutil.copytree('.runic', str(backup_dir))
-    click.echo(f"Backed up .runic directory to {backup_dir}")
-    
-    # Get the absolute path to the current file (cli.py)
-    cli_file_path = Path(__file__).resolve()
-    
-    # Get the absolute path to the .runic directory in the package
-    package_dir = cli_file_path.parent
-    core_files_dir = package_dir / '.runic'
-    
-    click.echo(f"Using template directory: {core_files_dir}")
-    
-    # Check if the template directory exists
-    if not core_files_dir.exists():
-        click.echo(f"Error: Template directory not found at {core_files_dir}")
-        return
+    snapshots = []
     
     # Replace core files with symlinks
-    for root, dirs, files in os.walk(str(core_files_dir)):
-        # Skip memory.templates directory
-        if 'memory.templates' in root:
-            continue
-            
-        # Get the relative path from core_files_dir
-        rel_path = os.path.relpath(root, core_files_dir)
-        
-        # Get the corresponding directory in .runic
-        if rel_path != '.':
-            target_dir = os.path.join('.runic', rel_path)
+    plan = _sync_runic(replace_files=True, full=True, dry_run=dry_run, verbose=verbose,
+                       before_apply=lambda plan: snapshots.append(_snapshot_runic('migrate')))
+    if plan is None or dry_run:
+        return
+    if plan.changes():
+        click.echo("Migration complete. Core files have been replaced with symlinks.")
+        click.echo(f"Your original .runic directory is saved as snapshot {snapshots[0].id}")
+    else:
+        click.echo("Nothing to migrate: every core file is already a symlink to the package.")
+
+@click.group()
+def snapshot():
+    """Manage the snapshots of .runic taken before migrate and update --force"""
+    pass
+
+@snapshot.command(name="create")
+@click.option('--label', help='Name the snapshot; labeled snapshots are only removed by prune --remove')
+@click.option('--path', 'paths', multiple=True, help='Only snapshot this subdirectory of .runic (repeatable)')
+def snapshot_create(label, paths):
+    """Take a snapshot of .runic"""
+    from runic.snapshot import SnapshotStore
+    if not os.path.exists('.runic'):
+        click.echo("No .runic directory found. Run 'runic init' first.")
+        return
+    info = SnapshotStore('.runic').create('manual', label=label, paths=paths or None, prune=False)
+    click.echo(f"Saved snapshot {info.id} ({info.files} files, {info.size} bytes, {info.new_bytes} new bytes stored)")
+
+@snapshot.command(name="list")
+def snapshot_list():
+    """List the snapshots, oldest first"""
+    from runic.snapshot import SnapshotStore
+    snapshots = SnapshotStore('.runic').list()
+    if not snapshots:
+        click.echo("No snapshots found.")
+        return
+    for info in snapshots:
+        label = f" [{info.label}]" if info.label else ""
+        click.echo(f"{info.id}  {info.time}  {info.reason:<8} {info.files:>6} files {info.size:>10} bytes "
+                   f"{info.new_bytes:>10} new{label}")
+
+@snapshot.command(name="restore")
+@click.argument('snapshot_id')
+@click.option('--path', 'paths', multiple=True, help='Only restore this file or directory of .runic (repeatable)')
+@click.option('--dry-run', is_flag=True, help='Show what would be restored without changing anything')
+def snapshot_restore(snapshot_id, paths, dry_run):
+    """Restore the files of a snapshot (a unique prefix of its id is enough)"""
+    from runic.snapshot import SnapshotStore
+    try:
+        changes = SnapshotStore('.runic').restore(snapshot_id, paths or None, dry_run)
+    except KeyError:
+        click.echo(f"Error: No single snapshot matches '{snapshot_id}'. See 'runic snapshot list'.")
+        return
+    for path, action in changes:
+        if action == 'conflict':
+            click.echo(f"  skipped: .runic/{path} (changed by another writer during the restore; run the restore again)")
         else:
-            target_dir = '.runic'
-        
-        # Create the directory if it doesn't exist
-        os.makedirs(target_dir, exist_ok=True)
-        
-        # Replace files with symlinks
-        for file in files:
-            src = os.path.join(root, file)
-            dst = os.path.join(target_dir, file)
-            
-            # If the destination exists, replace it with a symlink
-            if os.path.exists(dst):
-                os.unlink(dst)
-            
-            # Create symlink
-            os.symlink(src, dst)
-    
-    click.echo("Migration complete. Core files have been replaced with symlinks.")
-    click.echo(f"Your original .runic directory has been backed up to {backup_dir}")
-
-def create_symlink(src, dst):
-    """Create a symlink with platform-specific handling"""
+            click.echo(f"  {action}: .runic/{path}")
+    verb = "Would restore" if dry_run else "Restored"
+    restored = sum(1 for _, action in changes if action != 'conflict')
+    click.echo(f"{verb} {restored} files; files created since the snapshot were left alone.")
+    if changes and not dry_run:
+        click.echo("The previous state was saved as a 'restore' snapshot.")
+
+@snapshot.command(name="prune")
+@click.option('--keep-last', type=int, default=10, show_default=True, help='Newest snapshots kept')
+@click.option('--keep-daily', type=int, default=7, show_default=True, help='Days for which the newest snapshot is kept')
+@click.option('--keep-weekly', type=int, default=4, show_default=True, help='Weeks for which the newest snapshot is kept')
+@click.option('--older-than', type=float, help='Only remove snapshots older than this many days')
+@click.option('--remove', 'remove', multiple=True, help='Also remove this snapshot (its id or a unique prefix), even if labeled (repeatable)')
+@click.option('--dry-run', is_flag=True, help='Show what would be removed without changing anything')
+def snapshot_prune(keep_last, keep_daily, keep_weekly, older_than, remove, dry_run):
+    """Remove snapshots outside the retention policy and the files only they used"""
+    from runic.snapshot import SnapshotStore
     try:
-        # For Windows, we need administrator privileges or developer mode enabled
-        if os.name == 'nt':  # Windows
-            # Check if running with admin privileges or in developer mode
-            try:
-                os.symlink(src, dst)
-            except OSError:
-                # Fall back to copying if symlink creation fails
-                shutil.copy2(src, dst)
-                click.echo(f"Note: Created copy instead of symlink for {dst} (Windows requires admin privileges or developer mode for symlinks)")
-        else:  # Unix-like systems
-            os.symlink(src, dst)
-    except Exception as e:
-        click.echo(f"Warning: Failed to create symlink {dst}: {e}")
-        # Fall back to copying
-        shutil.copy2(src, dst)
+        removed, freed = SnapshotStore('.runic').prune(keep_last, keep_daily, keep_weekly, older_than, remove, dry_run)
+    except KeyError as e:
+        click.echo(f"Error: No single snapshot matches '{e.args[0]}'. See 'runic snapshot list'.")
+        raise SystemExit(1)
+    for info in removed:
+        click.echo(f"  {'would remove' if dry_run else 'removed'}: {info.id} ({info.reason}, {info.time})")
+    if dry_run:
+        click.echo(f"Would remove {len(removed)} snapshots.")
+    else:
+        click.echo(f"Removed {len(removed)} snapshots, freeing {freed} bytes.")
 
 # Register commands
 cli.add_command(track)
@@ -408,6 +917,12 @@ cli.add_command(integrate)
 cli.add_command(init)
 cli.add_command(update)
 cli.add_command(migrate)
+cli.add_command(snapshot)
+cli.add_command(chat)
+cli.add_command(serve)
+cli.add_command(merge_queue)
+cli.add_command(compile_bundles)
+cli.add_command(bench)
 
 if __name__ == '__main__':
     cli()
@@ -0,0 +1,424 @@
+"""
+Compact module for Runic.
+
+This module provides `runic mem compact`, which keeps the hot memory files small. Old
+items of the history sections of `progress.md` and `active-context.md` files (such as
+'Completed Tasks') are moved to an append-only archive in `.runic/memory/archive/`. In
+their place the hot file keeps one rollup line pointing to the archive entry. With
+`--tracks`, the directories of tracks whose status says they are finished are moved to
+`archive/tracks/` as well.
+
+The archive is a markdown file per month, to which entries are only ever appended, and
+`archive/index.jsonl`, which gets one JSON line per entry with its id, source, archive file
+and line. Entry ids are derived from the archived content, so an entry is never archived
+twice, even when a compaction is interrupted and run again.
+
+Compaction also runs during `runic mem update` for the files that exceed the size or
+token thresholds.
+"""
+
+import os
+import re
+import json
+import datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from runic.locking import atomic_write, file_lock, read_versioned
+from runic.sections import MemoryDocument
+
+# Sections of hot files whose older items can be archived
+HISTORY_SECTIONS = ('Completed Tasks', 'Completed', 'Done', 'Recent Changes', 'Recent Decisions')
+
+# Hot files compacted; track files with these names are compacted too
+HOT_FILES = ('progress.md', 'active-context.md')
+
+# Items kept in each history section, newest (last) first
+DEFAULT_KEEP = 5
+
+# A hot file larger than this many bytes is compacted during `runic mem update`
+DEFAULT_MAX_BYTES = 8192
+
+# A hot file with more than this many tokens is compacted during `runic mem update`
+DEFAULT_MAX_TOKENS = 2000
+
+# 'Overall Status' values that mark a track as finished
+FINISHED_STATUS = re.compile(r'^\W*(complete|completed|done|finished|merged|archived)\b', re.IGNORECASE)
+
+# Core progress section listing archived tracks
+ARCHIVED_TRACKS_SECTION = 'Archived Tracks'
+
+# Approximate length of a rollup line; fewer bytes of items aren't worth archiving
+ROLLUP_SIZE = 100
+
+_ITEM = re.compile(r'^(?:[-*+]|\d+[.)])\s')
+_ROLLUP = re.compile(r'^- \[archived\] (\d+) earlier items?\b')
+_PLACEHOLDER = re.compile(r'^[-*+]\s+\[[^\]]*\]\s*$')
+
+class CompactResult(NamedTuple):
+    """What compaction did to one hot file or track."""
+    path: str
+    action: str  # 'compacted', 'archived-track' or 'skipped'
+    items: int
+    bytes_before: int
+    bytes_after: int
+    entry: Optional[str] = None
+
+def compaction_thresholds() -> Tuple[int, int]:
+    """Get the size and token thresholds for automatic compaction.
+
+    RUNIC_COMPACT_MAX_BYTES and RUNIC_COMPACT_MAX_TOKENS override the defaults; 0 disables
+    a threshold.
+
+    Returns:
+        The byte and token thresholds.
+    """
+    def read(name: str, default: int) -> int:
+        try:
+            return int(os.environ.get(name, default))
+        except ValueError:
+            return default
+    return read('RUNIC_COMPACT_MAX_BYTES', DEFAULT_MAX_BYTES), read('RUNIC_COMPACT_MAX_TOKENS', DEFAULT_MAX_TOKENS)
+
+def split_items(body: str) -> Tuple[List[str], List[str]]:
+    """Split a section body into its leading text and its top-level list items.
+
+    Lines that aren't list items (indented sub-items, continuation lines) belong to the
+    item above them.
+
+    Args:
+        body: The section body.
+
+    Returns:
+        The lines before the first item, and the items, each as one string.
+    """
+    preamble: List[str] = []
+    items: List[str] = []
+    for line in body.split('\n'):
+        if _ITEM.match(line):
+            items.append(line)
+        elif items and line.strip():
+            items[-1] += '\n' + line
+        elif not items:
+            preamble.append(line)
+    while preamble and not preamble[-1].strip():
+        preamble.pop()
+    return preamble, items
+
+class Archive:
+    """The append-only archive under .runic/memory/archive/."""
+
+    def __init__(self, memory_dir: Path):
+        """Initialize the archive.
+
+        Args:
+            memory_dir: The memory directory.
+        """
+        self.memory_dir = Path(memory_dir)
+        self.archive_dir = self.memory_dir / 'archive'
+        self.index_path = self.archive_dir / 'index.jsonl'
+
+    def entries(self) -> Dict[str, Dict]:
+        """Read the index, keyed by entry id."""
+        entries = {}
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash
+                        continue
+                    entries[entry['id']] = entry
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def append(self, source: str, section: str, kind: str, content: str, count: int, sequence: int = 0) -> Dict:
+        """Append an entry, unless an entry with the same content was archived before.
+
+        Args:
+            source: The archived file's path relative to the memory directory.
+            section: The section the content came from ('' for a whole file).
+            kind: 'items' or 'track'.
+            content: The archived markdown.
+            count: The number of items archived.
+            sequence: The number of items archived from the section before, so the same
+                content archived again later gets a new entry.
+
+        Returns:
+            The index record of the entry.
+        """
+        import hashlib
+        entry_id = hashlib.sha1(f"{source}\0{section}\0{sequence}\0{content}".encode('utf-8')).hexdigest()[:12]
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        with file_lock(str(self.index_path)):
+            existing = self.entries().get(entry_id)
+            if existing:
+                return existing
+
+            now = datetime.datetime.now()
+            archive_file = self.archive_dir / f"{now.strftime('%Y-%m')}.md"
+            try:
+                with open(archive_file, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                data = b''
+            if not data:
+                prefix = f"# Archive {now.strftime('%Y-%m')}\n\n"
+            else:
+                prefix = '' if data.endswith(b'\n\n') else '\n' if data.endswith(b'\n') else '\n\n'
+            # The 1-based line of the entry's heading
+            line = data.count(b'\n') + prefix.count('\n') + 1
+            title = source + (f" > {section}" if section else '')
+            # Headings inside archived content are demoted so each entry stays one section
+            body = re.sub(r'^(#{1,2}) ', lambda m: '#' * (len(m.group(1)) + 2) + ' ', content.strip(), flags=re.MULTILINE)
+            text = prefix + f"## {entry_id} · {title} · {now.strftime('%Y-%m-%d %H:%M:%S')}\n{body}\n\n"
+            with open(archive_file, 'ab') as f:
+                f.write(text.encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+
+            record = {'id': entry_id, 'time': now.strftime('%Y-%m-%d %H:%M:%S'), 'source': source,
+                      'section': section, 'kind': kind, 'items': count,
+                      'file': os.path.relpath(archive_file, str(self.memory_dir)), 'line': line}
+            # The index is written after the entry, so every indexed entry exists
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            return record
+
+class MemoryCompactor:
+    """Moves old history items and finished tracks from hot memory files to the archive."""
+
+    def __init__(self, memory_manager=None, keep: int = DEFAULT_KEEP, tokenizer: Optional[str] = None):
+        """Initialize the compactor.
+
+        Args:
+            memory_manager: The MemoryManager whose files are compacted. If None, a new one is created.
+            keep: The number of items kept in each history section.
+            tokenizer: The tokenizer used for the token threshold (see pack.get_tokenizer).
+        """
+        if memory_manager is None:
+            from runic.memory import MemoryManager
+            memory_manager = MemoryManager()
+        self.memory_manager = memory_manager
+        self.memory_dir = memory_manager.memory_dir
+        self.archive = Archive(self.memory_dir)
+        self.keep = max(0, keep)
+        self.tokenizer = tokenizer
+
+    def hot_files(self, track: Optional[str] = None) -> List[Path]:
+        """List the hot files: the core ones, then each track's, or only one track's."""
+        manager = self.memory_manager
+        if track:
+            files = []
+            for paths in manager.get_track_memory_files(track).values():
+                files.extend(paths)
+        else:
+            files = [path for path in manager.get_core_memory_files() if path.name in HOT_FILES]
+            for entry in sorted(manager.scan_tracks(), key=lambda entry: entry.dir_name):
+                files.extend(entry.memory_files())
+        return [path for path in files if path.name in HOT_FILES]
+
+    def over_threshold(self, data: bytes, max_bytes: int, max_tokens: int) -> bool:
+        """Check whether a file's content exceeds the size or token threshold (0 disables one)."""
+        if max_bytes and len(data) > max_bytes:
+            return True
+        if max_tokens:
+            from runic.pack import get_tokenizer
+            return get_tokenizer(self.tokenizer)(data.decode('utf-8', errors='replace')) > max_tokens
+        return False
+
+    def _rel(self, path: Path) -> str:
+        """Get a path relative to the memory directory."""
+        return os.path.relpath(str(path), str(self.memory_dir))
+
+    def _plan(self, body: str) -> Tuple[List[str], int, List[str], List[str]]:
+        """Plan the compaction of a history section.
+
+        Returns:
+            The section's leading lines, the item count of its rollup line (0 if none), the
+            items to archive, and the items to keep. Placeholder items like '- [None yet]'
+            are always kept.
+        """
+        preamble, items = split_items(body)
+        previous = 0
+        for index, item in enumerate(items):
+            match = _ROLLUP.match(item)
+            if match:
+                previous = int(match.group(1))
+                del items[index]
+                break
+        cut = max(0, len(items) - self.keep)
+        archivable = [item for item in items[:cut] if not _PLACEHOLDER.match(item)]
+        if sum(len(item) + 1 for item in archivable) <= ROLLUP_SIZE and not previous:
+            # Replacing a few short items with the rollup line wouldn't make the file smaller
+            archivable = []
+        kept = [item for item in items[:cut] if _PLACEHOLDER.match(item)] + items[cut:]
+        return preamble, previous, archivable, kept
+
+    def compact_file(self, path: Path, dry_run: bool = False) -> CompactResult:
+        """Archive the old items of a hot file's history sections.
+
+        The file's lock is held from reading the file until the compacted content is written,
+        so another agent's write waits for it (and is then re-applied to the new content)
+        instead of making the compaction plan again and archive the same items twice.
+
+        Args:
+            path: The hot file.
+            dry_run: Report what would be archived without changing anything.
+
+        Returns:
+            The result for the file.
+        """
+        rel = self._rel(path)
+        target = os.path.realpath(str(path))
+        if dry_run:
+            data, _ = read_versioned(target)
+            plans = self._plans(data)
+            size = len(data) if data is not None else 0
+            if not plans:
+                return CompactResult(rel, 'skipped', 0, size, size)
+            return CompactResult(rel, 'compacted', sum(len(plan[2]) for _, plan in plans), size, size)
+
+        with file_lock(target):
+            data, _ = read_versioned(target)
+            plans = self._plans(data)
+            if not plans:
+                size = len(data) if data is not None else 0
+                return CompactResult(rel, 'skipped', 0, size, size)
+
+            document = MemoryDocument(data)
+            entry = None
+            for heading, (preamble, previous, archivable, kept) in plans:
+                entry = self.archive.append(rel, heading, 'items', '\n'.join(archivable), len(archivable), previous)
+                line = (f"- [archived] {previous + len(archivable)} earlier items, "
+                        f"see archive/{os.path.basename(entry['file'])}:{entry['line']} (entry {entry['id']})")
+                document = document.replace(heading, '\n'.join(preamble + [line] + kept))
+            # The lock is already held, so the file is replaced directly rather than through compare_and_swap
+            atomic_write(target, document.data)
+        count = sum(len(plan[2]) for _, plan in plans)
+        return CompactResult(rel, 'compacted', count, len(data), len(document.data), entry['id'])
+
+    def _plans(self, data: Optional[bytes]) -> List[Tuple[str, Tuple[List[str], int, List[str], List[str]]]]:
+        """Plan the compaction of each history section of a file's content that has items to archive."""
+        if data is None:
+            return []
+        document = MemoryDocument(data)
+        plans = []
+        for heading in HISTORY_SECTIONS:
+            body = document.get(heading)
+            if body is not None:
+                plan = self._plan(body)
+                if plan[2]:
+                    plans.append((heading, plan))
+        return plans
+
+    def finished_tracks(self) -> List:
+        """List the tracks whose progress file's 'Overall Status' marks them as finished."""
+        finished = []
+        index = self.memory_manager.index
+        for entry in sorted(self.memory_manager.scan_tracks(), key=lambda entry: entry.dir_name):
+            progress_stat = entry.files.get('progress.md')
+            if progress_stat is None:
+                continue
+            index_entry = index.get(os.path.join(entry.path, 'progress.md'), progress_stat)
+            status = index_entry['status'] if index_entry else None
+            if status and FINISHED_STATUS.match(status):
+                finished.append(entry)
+        index.save()
+        return finished
+
+    def archive_track(self, track_entry, dry_run: bool = False) -> CompactResult:
+        """Move a finished track's directory to the archive and list it in the core progress file.
+
+        The whole directory is moved to archive/tracks/, so every file in it is kept, not only
+        its memory files; the archive index gets an entry listing the moved files.
+
+        Args:
+            track_entry: The track, as returned by MemoryManager.scan_tracks.
+            dry_run: Report what would be archived without changing anything.
+
+        Returns:
+            The result for the track.
+        """
+        track_dir = Path(track_entry.path)
+        files = sorted(path for path in track_dir.rglob('*') if path.is_file())
+        size = sum(path.stat().st_size for path in files)
+        rel = self._rel(track_dir)
+        if dry_run:
+            return CompactResult(rel, 'archived-track', len(files), size, 0)
+
+        tracks_archive = self.memory_dir / 'archive' / 'tracks'
+        destination = tracks_archive / track_entry.dir_name
+        suffix = 2
+        while destination.exists():
+            # A track of the same name was archived before
+            destination = tracks_archive / f"{track_entry.dir_name}-{suffix}"
+            suffix += 1
+        moved = self._rel(destination)
+        listing = '\n'.join(f"- {moved}/{path.relative_to(track_dir).as_posix()}" for path in files)
+        entry = self.archive.append(rel, '', 'track', f"Moved to {moved}/:\n{listing}", len(files))
+
+        progress = self.memory_dir / 'progress.md'
+        if progress.exists():
+            status = self.memory_manager.index.get_status(track_dir / 'progress.md') or 'Finished'
+            line = (f"- {track_entry.display_name}: {status}, see {moved}/ "
+                    f"(index: archive/index.jsonl, entry {entry['id']})")
+
+            def add_line(data: Optional[bytes]) -> Optional[bytes]:
+                if data is None:
+                    return None
+                document = MemoryDocument(data)
+                body = document.get(ARCHIVED_TRACKS_SECTION)
+                if body is None:
+                    return document.set(ARCHIVED_TRACKS_SECTION, line).data
+                if f"- {track_entry.display_name}:" in body:
+                    return None
+                return document.replace(ARCHIVED_TRACKS_SECTION, body + '\n' + line).data
+            self.memory_manager.update_memory_file(progress, add_line)
+
+        # The directory is moved last, so an interrupted run archives the track again (as no-ops)
+        tracks_archive.mkdir(parents=True, exist_ok=True)
+        os.rename(str(track_dir), str(destination))
+        self.memory_manager.scan_tracks(refresh=True)
+        return CompactResult(rel, 'archived-track', len(files), size, 0, entry['id'])
+
+    def compact(self, track: Optional[str] = None, tracks: bool = False, auto: bool = False,
+                max_bytes: Optional[int] = None, max_tokens: Optional[int] = None,
+                dry_run: bool = False) -> List[CompactResult]:
+        """Compact the hot files and, if asked, archive the finished tracks.
+
+        Args:
+            track: Only compact this track's files.
+            tracks: Also move finished tracks to the archive.
+            auto: Only compact files over the size or token threshold, and leave tracks alone.
+            max_bytes: The size threshold for auto. Defaults to compaction_thresholds().
+            max_tokens: The token threshold for auto. Defaults to compaction_thresholds().
+            dry_run: Report what would be archived without changing anything.
+
+        Returns:
+            One result per file or track that was (or would be) compacted.
+        """
+        default_bytes, default_tokens = compaction_thresholds()
+        max_bytes = default_bytes if max_bytes is None else max_bytes
+        max_tokens = default_tokens if max_tokens is None else max_tokens
+
+        results = []
+        if tracks and not auto and not track:
+            for entry in self.finished_tracks():
+                results.append(self.archive_track(entry, dry_run))
+
+        for path in self.hot_files(track):
+            if auto:
+                try:
+                    data = path.read_bytes()
+                except OSError:
+                    continue
+                if not self.over_threshold(data, max_bytes, max_tokens):
+                    continue
+            result = self.compact_file(path, dry_run)
+            if result.action != 'skipped':
+                results.append(result)
+        return results
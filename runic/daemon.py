@@ -0,0 +1,321 @@
+"""
+Daemon module for Runic.
+
+This module provides `runic serve`, a long-lived local process that keeps a warm
+MemoryManager index and an open Git repository, and answers chat commands and memory
+queries sent as JSON lines over a Unix domain socket.
+
+The CLI forwards its queries through query(), which uses a running daemon when one is
+listening on the project's socket and falls back to running the query in-process.
+Set RUNIC_NO_DAEMON=1 to always run in-process.
+"""
+
+import os
+import json
+from pathlib import Path
+from typing import Any, Dict, Optional, Union
+
+# Name of the daemon's socket inside the Runic base directory
+SOCKET_NAME = 'runic.sock'
+
+# Seconds a CLI call waits for the daemon's answer once the request is sent
+CLIENT_TIMEOUT = 30.0
+
+class DaemonError(Exception):
+    """Raised when a daemon request fails."""
+
+class DaemonUnavailable(DaemonError):
+    """Raised when no daemon could be reached, before anything was sent to it."""
+
+def socket_path(base_dir: Union[str, Path] = '.runic') -> str:
+    """Get the path of the daemon socket for a Runic base directory."""
+    return os.path.join(str(base_dir), SOCKET_NAME)
+
+def execute(memory_manager: Any, op: str, params: Dict[str, Any]) -> Any:
+    """Run one query against a memory manager.
+
+    This is the single implementation behind both the daemon and the in-process fallback,
+    so a forwarded call returns exactly what a direct call would.
+
+    Args:
+        memory_manager: The MemoryManager to query.
+        op: The query name.
+        params: The query parameters.
+
+    Returns:
+        The JSON-serializable result of the query.
+
+    Raises:
+        DaemonError: If the query is unknown.
+    """
+    if op == 'ping':
+        return {'pid': os.getpid()}
+
+    if op == 'chat':
+        from runic.chat_commands import handle_chat_command
+        return handle_chat_command(params.get('message', ''))
+
+    if op == 'chat_script':
+        from runic.chat_commands import handle_chat_script
+        return handle_chat_script(params.get('message', ''), params.get('stop_on_error'))
+
+    if op == 'mem_search':
+        # The index stays open in the daemon, so its postings remain mapped between searches
+        from runic.search import get_search_index
+        index = get_search_index(memory_manager.base_dir)
+        update = index.update()
+        hits = index.search(params.get('query', ''), int(params.get('limit') or 10), params.get('track'),
+                            params.get('section'), params.get('kind'))
+        return {'update': update, 'results': [hit._asdict() for hit in hits]}
+
+    if op == 'vector_query':
+        # The index stays open in the daemon, so its vectors remain mapped between queries
+        from runic.vector import get_vector_index
+        index = get_vector_index(memory_manager.base_dir, params.get('embedder'))
+        update = index.update()
+        results = index.query(params.get('queries') or [], int(params.get('k') or 5))
+        return {'update': update._asdict(), 'results': [[hit._asdict() for hit in hits] for hits in results]}
+
+    # Pick up tracks created or removed since the last query
+    memory_manager.forget_tracks()
+
+    if op == 'track_list':
+        return sorted(memory_manager.get_track_memory_files().keys())
+
+    if op == 'track_status':
+        return memory_manager.get_all_track_statuses()
+
+    if op == 'mem_next':
+        return memory_manager.get_next_steps()
+
+    if op == 'mem_reindex':
+        return memory_manager.reindex()
+
+    if op == 'mem_update':
+        track = params.get('track')
+        timestamp = params.get('timestamp')
+        if track:
+            track_dir = memory_manager.tracks_dir / memory_manager._get_track_dir_name(track)
+            if not track_dir.is_dir():
+                return {'found': False}
+            result = {
+                'found': True,
+                'display_name': memory_manager._to_title_case(track),
+                'updated': memory_manager.update_track_timestamps(track, timestamp)
+            }
+        else:
+            result = memory_manager.update_all_timestamps(timestamp)
+            result['results'] = [[str(r.path), r.status, r.error] for r in result['results']]
+        if params.get('compact', True):
+            # Hot files over the size or token threshold are compacted as part of the update
+            from runic.compact import MemoryCompactor
+            compacted = MemoryCompactor(memory_manager).compact(track, auto=True)
+            result['compacted'] = [r._asdict() for r in compacted]
+        return result
+
+    if op == 'mem_compact':
+        from runic.compact import DEFAULT_KEEP, MemoryCompactor
+        compactor = MemoryCompactor(memory_manager, int(params.get('keep', DEFAULT_KEEP)))
+        results = compactor.compact(params.get('track'), params.get('tracks', False), params.get('auto', False),
+                                    params.get('max_bytes'), params.get('max_tokens'), params.get('dry_run', False))
+        return [r._asdict() for r in results]
+
+    raise DaemonError(f"Unknown request: {op}")
+
+def send_request(op: str, params: Optional[Dict[str, Any]] = None, base_dir: Union[str, Path] = '.runic',
+                 timeout: float = CLIENT_TIMEOUT) -> Any:
+    """Send one request to a running daemon.
+
+    Args:
+        op: The query name.
+        params: The query parameters.
+        base_dir: The base directory for Runic files.
+        timeout: Seconds to wait for the daemon.
+
+    Returns:
+        The result of the query.
+
+    Raises:
+        DaemonUnavailable: If no daemon is reachable; the request wasn't sent.
+        DaemonError: If the request was sent but failed or timed out. The daemon may have
+            run it, so it must not be retried.
+    """
+    path = socket_path(base_dir)
+    if not os.path.exists(path):
+        raise DaemonUnavailable("No daemon running")
+
+    import socket
+    if not hasattr(socket, 'AF_UNIX'):
+        raise DaemonUnavailable("Unix domain sockets are not supported on this platform")
+
+    request = json.dumps({'op': op, 'params': params or {}}).encode('utf-8') + b'\n'
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(path)
+        except OSError as e:
+            # A stale socket file or a daemon that is shutting down
+            raise DaemonUnavailable(f"Daemon unreachable: {e}")
+        try:
+            sock.sendall(request)
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                if chunk.endswith(b'\n'):
+                    break
+        except socket.timeout:
+            raise DaemonError(f"The daemon didn't answer '{op}' within {timeout:g} seconds; "
+                              f"it may still be running it")
+        except OSError as e:
+            raise DaemonError(f"Lost the connection to the daemon during '{op}': {e}")
+
+    try:
+        response = json.loads(b''.join(chunks).decode('utf-8'))
+    except ValueError:
+        raise DaemonError("Malformed daemon response")
+    if not response.get('ok'):
+        raise DaemonError(response.get('error', 'Unknown daemon error'))
+    return response.get('result')
+
+def query(op: str, params: Optional[Dict[str, Any]] = None, base_dir: Union[str, Path] = '.runic') -> Any:
+    """Run a query through the daemon if one is running, or in-process otherwise.
+
+    Args:
+        op: The query name.
+        params: The query parameters.
+        base_dir: The base directory for Runic files.
+
+    Returns:
+        The result of the query.
+
+    Raises:
+        DaemonError: If the daemon received the query but failed; it is never run again
+            in-process, because the daemon may already have changed something.
+    """
+    if not os.environ.get('RUNIC_NO_DAEMON'):
+        try:
+            return send_request(op, params, base_dir)
+        except DaemonUnavailable:
+            pass
+
+    from runic.memory import MemoryManager
+    return execute(MemoryManager(str(base_dir)), op, params or {})
+
+class RunicDaemon:
+    """Serves memory queries and chat commands to many clients over a Unix socket."""
+
+    def __init__(self, base_dir: Union[str, Path] = '.runic'):
+        """Initialize the daemon.
+
+        Args:
+            base_dir: The base directory for Runic files.
+        """
+        from runic.memory import MemoryManager
+        self.base_dir = Path(base_dir)
+        self.socket_path = socket_path(base_dir)
+        self.memory_manager = MemoryManager(str(base_dir))
+        self._executor = None
+        self._server = None
+        self._stopping = None
+
+    def _execute(self, op: str, params: Dict[str, Any]) -> Any:
+        """Run a query in the worker thread."""
+        return execute(self.memory_manager, op, params)
+
+    async def _handle_client(self, reader: Any, writer: Any) -> None:
+        """Answer every request a client sends until it disconnects."""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line.decode('utf-8'))
+                    op = request.get('op', '')
+                    if op == 'shutdown':
+                        response = {'ok': True, 'result': None}
+                        self._stopping.set()
+                    else:
+                        # Memory files and the git working tree are shared state, so requests
+                        # run one at a time on a single worker thread while the event loop keeps
+                        # accepting and reading from other clients
+                        result = await loop.run_in_executor(self._executor, self._execute,
+                                                            op, request.get('params') or {})
+                        response = {'ok': True, 'result': result}
+                except Exception as e:
+                    response = {'ok': False, 'error': str(e)}
+                writer.write(json.dumps(response).encode('utf-8') + b'\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # Clients that disconnect early, or are still connected at shutdown
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self) -> None:
+        """Listen on the socket until a shutdown request or signal arrives."""
+        import asyncio
+        import signal
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self._stopping.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        # Warm the index and the repository before the first client arrives
+        await loop.run_in_executor(self._executor, self.memory_manager.get_all_track_statuses)
+
+        self._server = await asyncio.start_unix_server(self._handle_client, path=self.socket_path)
+        try:
+            await self._stopping.wait()
+        finally:
+            self._server.close()
+            await self._server.wait_closed()
+            self._executor.shutdown(wait=True)
+            from runic.git_context import close_repo_contexts
+            close_repo_contexts()
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+
+def is_running(base_dir: Union[str, Path] = '.runic') -> bool:
+    """Check whether a daemon is answering on the project's socket."""
+    try:
+        send_request('ping', base_dir=base_dir, timeout=2.0)
+        return True
+    except DaemonError:
+        return False
+
+def run_daemon(base_dir: Union[str, Path] = '.runic') -> None:
+    """Run the daemon in the foreground.
+
+    Args:
+        base_dir: The base directory for Runic files.
+
+    Raises:
+        DaemonError: If a daemon is already running or sockets are unsupported.
+    """
+    import asyncio
+    import socket
+    if not hasattr(socket, 'AF_UNIX'):
+        raise DaemonError("Unix domain sockets are not supported on this platform")
+
+    path = socket_path(base_dir)
+    if os.path.exists(path):
+        if is_running(base_dir):
+            raise DaemonError(f"A Runic daemon is already listening on {path}")
+        # Left behind by a daemon that didn't shut down cleanly
+        os.unlink(path)
+
+    asyncio.run(RunicDaemon(base_dir).serve())
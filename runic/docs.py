@@ -0,0 +1,596 @@
+"""
+Docs module for Runic.
+
+This module provides `runic integrate docs`, which ingests a documentation site (or a local
+mirror of one) into `.runic/docs/<name>/` so agents can read it without a browser. Pages
+go through a pipeline: they are fetched concurrently, converted from HTML to markdown-like
+text, split into section chunks, and written as content-addressed chunk files. A chunk
+that appears on many pages, such as a shared sidebar, is stored once.
+
+Fetching runs on asyncio with a bounded pool of keep-alive HTTP connections and a limit
+per host. Refreshes are incremental: every page is re-requested with its ETag and
+Last-Modified validators, and a page the server reports as unchanged is neither
+downloaded nor re-chunked. Only the Python standard library is used.
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urldefrag, urljoin, urlsplit
+
+# Requests in flight at once, across all hosts
+DEFAULT_CONCURRENCY = 32
+
+# Requests in flight at once to any one host
+DEFAULT_PER_HOST = 8
+
+# Pages ingested per run unless --max-pages says otherwise
+DEFAULT_MAX_PAGES = 1000
+
+# Seconds to wait for a server before a page counts as failed
+FETCH_TIMEOUT = 30.0
+
+# Redirects followed per page
+MAX_REDIRECTS = 5
+
+# Sections longer than this many characters are split into several chunks
+CHUNK_CHARS = 1500
+
+# The manifest is saved after this many pages, so an interrupted run keeps its progress
+SAVE_EVERY_PAGES = 100
+
+# Content types converted to text; other responses are skipped
+TEXT_TYPES = ('text/html', 'application/xhtml+xml', 'text/plain', 'text/markdown', 'text/x-markdown')
+
+USER_AGENT = 'runic-docs/1.0'
+
+# Bump this whenever the layout of the manifest or the chunk files changes
+DOCS_VERSION = 1
+
+class Response(NamedTuple):
+    """The result of fetching one URL."""
+    status: int
+    url: str
+    content_type: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    body: bytes
+
+class PageResult(NamedTuple):
+    """The outcome of ingesting one page."""
+    url: str
+    status: str  # 'new', 'changed', 'unchanged', 'duplicate', 'skipped' or 'failed'
+    chunks: int
+    detail: str = ''
+
+class IngestResult(NamedTuple):
+    """The outcome of one ingestion run."""
+    pages: List[PageResult]
+    chunks_written: int
+    chunks_removed: int
+    seconds: float
+
+_BLOCK_TAGS = {'p', 'div', 'section', 'article', 'main', 'header', 'table', 'tr', 'ul', 'ol', 'dl',
+               'dt', 'dd', 'blockquote', 'figure', 'figcaption', 'br', 'hr'}
+_SKIPPED_TAGS = {'script', 'style', 'noscript', 'template', 'svg', 'nav', 'footer', 'form', 'button', 'iframe'}
+_VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+
+class _TextConverter(HTMLParser):
+    """Converts HTML to markdown-like text and collects the page's title and links."""
+
+    def __init__(self, base_url: str):
+        """Initialize the converter for a page at base_url."""
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.title = ''
+        self.links: List[str] = []
+        self._parts: List[str] = []
+        self._skip_depth = 0
+        self._pre_depth = 0
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIPPED_TAGS:
+            if tag not in _VOID_TAGS:
+                self._skip_depth += 1
+            return
+        if tag == 'base':
+            href = dict(attrs).get('href')
+            if href:
+                self.base_url = urljoin(self.base_url, href)
+        if tag == 'a':
+            href = dict(attrs).get('href')
+            if href and not href.startswith(('mailto:', 'javascript:', 'tel:')):
+                self.links.append(urldefrag(urljoin(self.base_url, href))[0])
+        if self._skip_depth:
+            return
+        if tag == 'title':
+            self._in_title = True
+        elif re.fullmatch(r'h[1-6]', tag):
+            # h1 and h2 become sections; deeper headings stay inside their section
+            self._parts.append('\n\n' + '#' * min(int(tag[1]), 3) + ' ')
+        elif tag == 'li':
+            self._parts.append('\n- ')
+        elif tag == 'pre':
+            self._pre_depth += 1
+            self._parts.append('\n\n```\n')
+        elif tag == 'code' and not self._pre_depth:
+            self._parts.append('`')
+        elif tag in ('td', 'th'):
+            self._parts.append(' | ')
+        elif tag in _BLOCK_TAGS:
+            self._parts.append('\n\n' if tag != 'br' else '\n')
+
+    def handle_endtag(self, tag):
+        if tag in _SKIPPED_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+            return
+        if self._skip_depth:
+            return
+        if tag == 'title':
+            self._in_title = False
+        elif re.fullmatch(r'h[1-6]', tag):
+            self._parts.append('\n\n')
+        elif tag == 'pre':
+            self._pre_depth = max(0, self._pre_depth - 1)
+            self._parts.append('\n```\n\n')
+        elif tag == 'code' and not self._pre_depth:
+            self._parts.append('`')
+        elif tag in _BLOCK_TAGS:
+            self._parts.append('\n\n')
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+        if self._skip_depth or self._in_title:
+            return
+        if self._pre_depth:
+            self._parts.append(data)
+        else:
+            self._parts.append(re.sub(r'\s+', ' ', data))
+
+    def text(self) -> str:
+        """Get the converted text, with blank lines collapsed."""
+        text = ''.join(self._parts)
+        lines = []
+        in_fence = False
+        for line in text.split('\n'):
+            if line.startswith('```'):
+                in_fence = not in_fence
+            lines.append(line if in_fence else line.strip())
+        return re.sub(r'\n{3,}', '\n\n', '\n'.join(lines)).strip() + '\n'
+
+def html_to_text(html: str, base_url: str = '') -> Tuple[str, str, List[str]]:
+    """Convert an HTML page to markdown-like text.
+
+    Headings become '#' lines (h1, h2) or '###' lines (deeper), list items become '-'
+    bullets and preformatted blocks become fenced code. Scripts, styles, navigation and
+    footers are dropped.
+
+    Args:
+        html: The page's HTML.
+        base_url: The page's URL, against which relative links are resolved.
+
+    Returns:
+        The title, the text and the absolute URLs of the page's links.
+    """
+    converter = _TextConverter(base_url)
+    converter.feed(html)
+    converter.close()
+    return ' '.join(converter.title.split()), converter.text(), converter.links
+
+class ConnectionPool:
+    """Keep-alive HTTP connections shared by the fetching threads, bounded per host."""
+
+    def __init__(self, per_host: int = DEFAULT_PER_HOST, timeout: float = FETCH_TIMEOUT):
+        """Initialize the pool.
+
+        Args:
+            per_host: The number of idle connections kept per host.
+            timeout: The socket timeout of each connection.
+        """
+        self.per_host = per_host
+        self.timeout = timeout
+        self._idle: Dict[Tuple[str, str, int], List] = {}
+        self._lock = threading.Lock()
+
+    def _connect(self, scheme: str, host: str, port: int):
+        """Open a new connection to a host."""
+        import http.client
+        if scheme == 'https':
+            import ssl
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout, context=ssl.create_default_context())
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def request(self, url: str, headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+        """Send a GET request over a pooled connection.
+
+        A request that fails on a reused connection (which the server may have closed)
+        is retried once on a new one.
+
+        Args:
+            url: An http or https URL.
+            headers: The request headers.
+
+        Returns:
+            The status, the lowercased response headers and the (decoded) body.
+        """
+        import http.client
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parts.hostname or '', port)
+        target = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+
+        for attempt in range(2):
+            with self._lock:
+                idle = self._idle.get(key)
+                connection = idle.pop() if idle else None
+            reused = connection is not None
+            if connection is None:
+                connection = self._connect(*key)
+            try:
+                connection.request('GET', target, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            response_headers = {name.lower(): value for name, value in response.getheaders()}
+            if response.will_close:
+                connection.close()
+            else:
+                with self._lock:
+                    idle = self._idle.setdefault(key, [])
+                    if len(idle) < self.per_host:
+                        idle.append(connection)
+                    else:
+                        connection.close()
+            if response_headers.get('content-encoding') == 'gzip':
+                import gzip
+                body = gzip.decompress(body)
+            return response.status, response_headers, body
+        raise OSError(f"Couldn't fetch {url}")
+
+    def close(self) -> None:
+        """Close every idle connection."""
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle = {}
+
+def _fetch_file(url: str, validators: Dict[str, Optional[str]]) -> Response:
+    """Read a page of a local mirror, using its mtime and size as its ETag."""
+    from urllib.request import url2pathname
+    path = url2pathname(urlsplit(url).path)
+    if os.path.isdir(path):
+        path = os.path.join(path, 'index.html')
+        url = Path(path).as_uri()
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        return Response(404, url, '', None, None, b'')
+    etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+    if validators.get('etag') == etag:
+        return Response(304, url, '', etag, None, b'')
+    import mimetypes
+    content_type = mimetypes.guess_type(path)[0] or ('text/markdown' if path.endswith('.md') else 'text/plain')
+    with open(path, 'rb') as f:
+        return Response(200, url, content_type, etag, None, f.read())
+
+def fetch(pool: ConnectionPool, url: str, validators: Dict[str, Optional[str]]) -> Response:
+    """Fetch a page, conditionally if validators from an earlier fetch are given.
+
+    Args:
+        pool: The connection pool (unused for file URLs).
+        url: An http, https or file URL.
+        validators: The 'etag' and 'last_modified' of the earlier fetch, if any.
+
+    Returns:
+        The response; a status of 304 means the page is unchanged.
+    """
+    if url.startswith('file:'):
+        return _fetch_file(url, validators)
+
+    for _ in range(MAX_REDIRECTS + 1):
+        headers = {'User-Agent': USER_AGENT, 'Accept-Encoding': 'gzip',
+                   'Accept': 'text/html,application/xhtml+xml,text/markdown,text/plain;q=0.9,*/*;q=0.1'}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        status, response_headers, body = pool.request(url, headers)
+        if status in (301, 302, 303, 307, 308) and response_headers.get('location'):
+            url = urldefrag(urljoin(url, response_headers['location']))[0]
+            # Validators belong to the original URL
+            validators = {}
+            continue
+        return Response(status, url, response_headers.get('content-type', ''), response_headers.get('etag'),
+                        response_headers.get('last-modified'), body)
+    return Response(310, url, '', None, None, b'')
+
+def default_source_name(source: str) -> str:
+    """Derive a directory name for a doc source, e.g. 'docs.python.org-3-library'."""
+    parts = urlsplit(source)
+    if parts.scheme in ('http', 'https'):
+        raw = f"{parts.hostname}{parts.path}"
+    else:
+        raw = os.path.basename(os.path.abspath(source.rstrip('/'))) or 'docs'
+    name = re.sub(r'[^A-Za-z0-9._-]+', '-', raw).strip('-.')
+    return name or 'docs'
+
+class DocsIngester:
+    """Ingests one documentation source into .runic/docs/<name>/."""
+
+    def __init__(self, source: str, name: Optional[str] = None, base_dir='.runic',
+                 concurrency: int = DEFAULT_CONCURRENCY, per_host: int = DEFAULT_PER_HOST,
+                 max_pages: int = DEFAULT_MAX_PAGES):
+        """Initialize the ingester.
+
+        Args:
+            source: The start URL, or the path of a local mirror directory (or file).
+            name: The directory name under .runic/docs. Derived from the source if None.
+            base_dir: The base directory for Runic files.
+            concurrency: Requests in flight at once.
+            per_host: Requests in flight at once to one host.
+            max_pages: The maximum number of pages to ingest.
+        """
+        if urlsplit(source).scheme in ('http', 'https', 'file'):
+            self.start_url = urldefrag(source)[0]
+        else:
+            path = os.path.abspath(source)
+            if not os.path.exists(path):
+                raise ValueError(f"{source} is neither a URL nor an existing path")
+            self.start_url = Path(path).as_uri() + ('/' if os.path.isdir(path) else '')
+        # Links are followed only below the start page's directory
+        self.scope = self.start_url[:self.start_url.rfind('/') + 1]
+        self.name = name or default_source_name(source)
+        self.docs_dir = Path(base_dir) / 'docs' / self.name
+        self.chunks_dir = self.docs_dir / 'chunks'
+        self.manifest_path = self.docs_dir / 'manifest.json'
+        self.concurrency = max(1, concurrency)
+        self.per_host = max(1, per_host)
+        self.max_pages = max_pages
+
+    def _load_manifest(self) -> Dict:
+        """Load the manifest of the previous run, if any."""
+        try:
+            manifest = json.loads(self.manifest_path.read_text())
+            if manifest.get('version') == DOCS_VERSION:
+                return manifest
+        except (OSError, ValueError, AttributeError):
+            pass
+        return {'version': DOCS_VERSION, 'source': self.start_url, 'pages': {}}
+
+    def _save_manifest(self, manifest: Dict) -> None:
+        """Write the manifest atomically."""
+        from runic.locking import atomic_write
+        self.docs_dir.mkdir(parents=True, exist_ok=True)
+        atomic_write(self.manifest_path, json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8'))
+
+    def in_scope(self, url: str) -> bool:
+        """Check whether a link belongs to the documentation being ingested."""
+        return url.startswith(self.scope) and not re.search(r'\.(png|jpe?g|gif|svg|ico|css|js|pdf|zip|gz|woff2?)$',
+                                                             urlsplit(url).path, re.IGNORECASE)
+
+    def _process(self, url: str, response: Response, old: Optional[Dict]) -> Tuple[Optional[Dict], str, List[str]]:
+        """Convert and chunk a fetched page (in a worker thread).
+
+        Returns:
+            The page's manifest record (None if it isn't text), a status and its chunks' texts.
+        """
+        import hashlib
+        from runic.sections import split_chunks
+        content_type = response.content_type.split(';')[0].strip().lower()
+        if content_type and content_type not in TEXT_TYPES:
+            return None, f"not text ({content_type})", []
+        charset = re.search(r'charset=([\w-]+)', response.content_type or '', re.IGNORECASE)
+        try:
+            raw = response.body.decode(charset.group(1) if charset else 'utf-8', errors='replace')
+        except LookupError:
+            raw = response.body.decode('utf-8', errors='replace')
+
+        if content_type in ('text/html', 'application/xhtml+xml') or (not content_type and '<html' in raw[:1000].lower()):
+            title, text, links = html_to_text(raw, response.url)
+        else:
+            title, text, links = '', raw, []
+        digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        record = {'etag': response.etag, 'last_modified': response.last_modified, 'title': title,
+                  'hash': digest, 'links': sorted(set(link for link in links if self.in_scope(link))),
+                  'final_url': response.url}
+        # A duplicate's record has no chunks of its own, so its content is chunked again
+        if old and old.get('hash') == digest and old.get('chunks') and not old.get('duplicate_of'):
+            record['chunks'] = old['chunks']
+            return record, 'unchanged', []
+
+        texts = []
+        for chunk in split_chunks(text.encode('utf-8'), CHUNK_CHARS):
+            texts.append(chunk.text)
+        record['chunks'] = [hashlib.sha1(chunk.encode('utf-8')).hexdigest() for chunk in texts]
+        return record, 'changed' if old else 'new', texts
+
+    def _write_chunk(self, digest: str, text: str) -> bool:
+        """Write a chunk file unless a chunk with the same content exists. Returns True if written."""
+        path = self.chunks_dir / digest[:2] / f"{digest}.md"
+        if path.exists():
+            return False
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_text(text + '\n')
+        os.replace(tmp_path, path)
+        return True
+
+    def run(self, force: bool = False, progress: Optional[Callable[[PageResult], None]] = None) -> IngestResult:
+        """Ingest the documentation, re-fetching only what changed since the last run.
+
+        Args:
+            force: Fetch every page unconditionally.
+            progress: Called with each page's result as soon as it is known.
+
+        Returns:
+            The result of the run.
+        """
+        import asyncio
+        started = time.monotonic()
+        manifest = self._load_manifest()
+        state = {'written': 0, 'results': [], 'since_save': 0}
+        new_pages: Dict[str, Dict] = {}
+        asyncio.run(self._crawl(manifest, new_pages, state, force, progress))
+
+        # Pages no longer linked from the site are dropped, and so are chunks no page uses
+        manifest['pages'] = new_pages
+        manifest['source'] = self.start_url
+        removed = self._collect_garbage(manifest)
+        self._save_manifest(manifest)
+        self._write_toc(manifest)
+        return IngestResult(state['results'], state['written'], removed, time.monotonic() - started)
+
+    async def _crawl(self, manifest: Dict, new_pages: Dict[str, Dict], state: Dict, force: bool,
+                     progress: Optional[Callable[[PageResult], None]]) -> None:
+        """Fetch and process pages with a fixed number of workers sharing one queue."""
+        import asyncio
+        from concurrent.futures import ThreadPoolExecutor
+        loop = asyncio.get_running_loop()
+        old_pages = manifest['pages']
+        pool = ConnectionPool(self.per_host)
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='runic-docs')
+        host_limits: Dict[str, asyncio.Semaphore] = {}
+        queue: asyncio.Queue = asyncio.Queue()
+        seen = {self.start_url}
+        seen_hashes: Dict[str, str] = {}
+        queue.put_nowait(self.start_url)
+
+        def enqueue(links: List[str]) -> None:
+            for link in links:
+                if link not in seen and len(seen) < self.max_pages:
+                    seen.add(link)
+                    queue.put_nowait(link)
+
+        def report(result: PageResult) -> None:
+            state['results'].append(result)
+            if progress:
+                progress(result)
+
+        async def ingest(url: str) -> None:
+            old = old_pages.get(url)
+            # A duplicate is fetched in full: the page it duplicates may be gone or changed
+            validators = ({} if force or not old or old.get('duplicate_of')
+                          else {'etag': old.get('etag'), 'last_modified': old.get('last_modified')})
+            host = urlsplit(url).netloc
+            limit = host_limits.setdefault(host, asyncio.Semaphore(self.per_host))
+            try:
+                async with limit:
+                    response = await loop.run_in_executor(executor, fetch, pool, url, validators)
+            except Exception as e:
+                if old:
+                    # Keep what we had; the page may be back next time
+                    new_pages[url] = old
+                    enqueue(old.get('links', []))
+                report(PageResult(url, 'failed', 0, str(e)))
+                return
+
+            if response.status == 304 and old:
+                if old.get('chunks'):
+                    seen_hashes.setdefault(old['hash'], url)
+                new_pages[url] = old
+                enqueue(old.get('links', []))
+                report(PageResult(url, 'unchanged', len(old['chunks'])))
+                return
+            if response.status != 200:
+                if old and response.status >= 500:
+                    new_pages[url] = old
+                    enqueue(old.get('links', []))
+                report(PageResult(url, 'failed', 0, f"HTTP {response.status}"))
+                return
+            if response.url != url and not self.in_scope(response.url):
+                report(PageResult(url, 'skipped', 0, f"redirects outside the docs to {response.url}"))
+                return
+
+            record, status, texts = await loop.run_in_executor(executor, self._process, url, response, old)
+            if record is None:
+                report(PageResult(url, 'skipped', 0, status))
+                return
+            enqueue(record['links'])
+            if record['hash'] in seen_hashes and seen_hashes[record['hash']] != url:
+                # The same page under another URL (e.g. with and without index.html)
+                record['duplicate_of'] = seen_hashes[record['hash']]
+                record['chunks'] = []
+                new_pages[url] = record
+                report(PageResult(url, 'duplicate', 0, f"same content as {record['duplicate_of']}"))
+                return
+            # Only a page whose chunks are written claims its content; duplicates never do
+            if record['chunks']:
+                seen_hashes[record['hash']] = url
+            for digest, text in zip(record['chunks'], texts):
+                if self._write_chunk(digest, text):
+                    state['written'] += 1
+            new_pages[url] = record
+            report(PageResult(url, status, len(record['chunks'])))
+
+            state['since_save'] += 1
+            if state['since_save'] >= SAVE_EVERY_PAGES:
+                state['since_save'] = 0
+                # Checkpoint: pages processed so far plus everything from the last run
+                self._save_manifest({**manifest, 'pages': {**old_pages, **new_pages}})
+
+        async def worker() -> None:
+            while True:
+                url = await queue.get()
+                try:
+                    await ingest(url)
+                finally:
+                    queue.task_done()
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(self.concurrency)]
+        try:
+            await queue.join()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            executor.shutdown(wait=True)
+            pool.close()
+
+    def _collect_garbage(self, manifest: Dict) -> int:
+        """Delete chunk files no page refers to. Returns the number deleted."""
+        used = {digest for page in manifest['pages'].values() for digest in page.get('chunks', [])}
+        removed = 0
+        if not self.chunks_dir.is_dir():
+            return 0
+        for path in self.chunks_dir.glob('*/*.md'):
+            if path.stem not in used:
+                try:
+                    path.unlink()
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def _write_toc(self, manifest: Dict) -> None:
+        """Write toc.md, listing every page with its title and chunk files."""
+        from runic.locking import atomic_write
+        lines = [f"# Docs: {self.name}", '', f"Source: {manifest['source']}", '']
+        for url in sorted(manifest['pages']):
+            page = manifest['pages'][url]
+            if page.get('duplicate_of'):
+                continue
+            lines.append(f"## {page.get('title') or url}")
+            lines.append(url)
+            lines.extend(f"- chunks/{digest[:2]}/{digest}.md" for digest in page.get('chunks', []))
+            lines.append('')
+        data = ('\n'.join(lines) + '\n').encode('utf-8')
+        toc_path = self.docs_dir / 'toc.md'
+        try:
+            if toc_path.read_bytes() == data:
+                return
+        except OSError:
+            pass
+        atomic_write(toc_path, data)
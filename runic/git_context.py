@@ -0,0 +1,455 @@
+"""
+Git context module for Runic.
+
+This module provides a per-process handle on the Git repository used by chat commands.
+The repository is opened once, object lookups reuse one persistent `git cat-file --batch`
+process, and the branch list and default branch are cached until the refs change.
+"""
+
+import os
+from typing import Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+# One context per repository path, shared by every chat command in this process
+_contexts = {}
+
+# The first Git version with `git merge-tree --write-tree`; older ones merge in a temporary worktree
+MERGE_TREE_MIN_VERSION = (2, 38)
+
+# Fields read for every branch by iter_branches, separated by NUL bytes
+_BRANCH_FORMAT = '%(refname:short)%00%(objectname)%00%(committerdate:unix)%00%(upstream:short)'
+
+class Worktree(NamedTuple):
+    """A worktree as reported by `git worktree list --porcelain`."""
+    path: str
+    head: str
+    branch: Optional[str]
+    prunable: bool
+
+class MergeResult(NamedTuple):
+    """The outcome of an in-memory merge."""
+    tree: Optional[str]
+    conflicts: List[str]
+
+class BranchMerge(NamedTuple):
+    """The outcome of merging a commit into a branch or another commit."""
+    status: str  # 'up-to-date', 'fast-forward', 'merged' or 'conflict'
+    commit: Optional[str]
+    conflicts: List[str] = []
+
+class BranchRef(NamedTuple):
+    """A local branch as reported by `git for-each-ref`."""
+    name: str
+    sha: str
+    committer_date: int
+    upstream: str
+    ahead: Optional[int] = None
+    behind: Optional[int] = None
+
+class RepoContext:
+    """A Git repository opened once and reused across chat commands."""
+
+    def __init__(self, path: str = '.'):
+        """Open the repository.
+
+        Args:
+            path: The path to the repository's working tree.
+        """
+        import git
+        self.repo = git.Repo(path)
+        self.git = self.repo.git
+        self._fingerprint = None
+        self._branches = None
+        self._default_branch = None
+        self._ahead_behind_atom = True
+
+    def _refs_fingerprint(self) -> Tuple:
+        """Stat the files git rewrites whenever a branch is created, moved or deleted."""
+        common_dir = self.repo.common_dir
+        heads_dir = os.path.join(common_dir, 'refs', 'heads')
+        paths = [os.path.join(common_dir, 'packed-refs'), os.path.join(self.repo.git_dir, 'HEAD'), heads_dir]
+        # A branch such as feat/b is created in refs/heads/feat, which leaves refs/heads untouched
+        for root, dirs, _ in os.walk(heads_dir):
+            dirs.sort()
+            paths.extend(os.path.join(root, name) for name in dirs)
+        fingerprint = []
+        for path in paths:
+            try:
+                st = os.stat(path)
+                fingerprint.append((st.st_mtime_ns, st.st_size, st.st_ino))
+            except OSError:
+                fingerprint.append(None)
+        return tuple(fingerprint)
+
+    def _check_refs(self) -> None:
+        """Drop the cached refs if git changed them since they were read."""
+        fingerprint = self._refs_fingerprint()
+        if fingerprint != self._fingerprint:
+            self._branches = None
+            self._default_branch = None
+            self._fingerprint = fingerprint
+
+    def invalidate(self) -> None:
+        """Drop the cached refs, e.g. after a command created or moved a branch."""
+        self._fingerprint = None
+        self._branches = None
+        self._default_branch = None
+
+    def branch_names(self) -> List[str]:
+        """Get the names of all local branches.
+
+        Returns:
+            The branch names, sorted by git.
+        """
+        self._check_refs()
+        if self._branches is None:
+            output = self.git.for_each_ref('--format=%(refname:short)', 'refs/heads')
+            self._branches = [line for line in output.split('\n') if line]
+        return list(self._branches)
+
+    def iter_branches(self, patterns: Sequence[str] = (), sort: str = 'name',
+                      ahead_behind_base: Optional[str] = None) -> Iterator[BranchRef]:
+        """Stream local branches from a single `git for-each-ref` call.
+
+        Args:
+            patterns: for-each-ref patterns relative to refs/heads (e.g. 'api-*'). All branches if empty.
+            sort: 'name' for alphabetical order, or 'date' for the most recent commit first.
+            ahead_behind_base: If set, count the commits each branch is ahead of and behind this
+                branch. Git 2.41+ computes the counts inside the same for-each-ref call; older
+                versions fall back to one rev-list per branch actually read by the caller.
+
+        Yields:
+            One BranchRef per branch, in the requested order.
+        """
+        import git
+        args = ['--format=' + _BRANCH_FORMAT + ('%00%(ahead-behind:' + ahead_behind_base + ')'
+                                                if ahead_behind_base and self._ahead_behind_atom else '')]
+        if sort == 'date':
+            # The last --sort is the primary key, so equal dates stay in name order
+            args += ['--sort=refname', '--sort=-committerdate']
+        else:
+            args.append('--sort=refname')
+        args += ['refs/heads/' + pattern for pattern in patterns] or ['refs/heads']
+
+        proc = self.git.for_each_ref(*args, as_process=True)
+        finished = False
+        try:
+            for line in proc.proc.stdout:
+                fields = line.rstrip(b'\n').decode('utf-8', 'replace').split('\0')
+                if len(fields) < 4:
+                    continue
+                ahead = behind = None
+                if len(fields) > 4:
+                    ahead, behind = (int(n) for n in fields[4].split())
+                elif ahead_behind_base:
+                    ahead, behind = self.ahead_behind(fields[0], ahead_behind_base)
+                yield BranchRef(fields[0], fields[1], int(fields[2] or 0), fields[3], ahead, behind)
+            finished = True
+        finally:
+            if not finished and proc.proc.poll() is None:
+                # The caller stopped early (e.g. a page limit), so don't wait for the rest
+                proc.proc.kill()
+                proc.proc.wait()
+        try:
+            proc.wait()
+        except git.GitCommandError:
+            if ahead_behind_base and self._ahead_behind_atom:
+                # This git predates %(ahead-behind); remember that and count per branch instead
+                self._ahead_behind_atom = False
+                yield from self.iter_branches(patterns, sort, ahead_behind_base)
+                return
+            raise
+
+    def ahead_behind(self, branch: str, base: str) -> Tuple[int, int]:
+        """Count the commits a branch is ahead of and behind another branch.
+
+        Args:
+            branch: The branch to compare.
+            base: The branch to compare against.
+
+        Returns:
+            A tuple of (ahead, behind) commit counts.
+        """
+        behind, ahead = self.git.rev_list('--left-right', '--count', f"{base}...{branch}").split()
+        return int(ahead), int(behind)
+
+    def list_worktrees(self) -> List[Worktree]:
+        """List the repository's worktrees, the main one first.
+
+        Returns:
+            The worktrees.
+        """
+        worktrees = []
+        fields = {}
+        for line in self.git.worktree('list', '--porcelain').split('\n') + ['']:
+            if line:
+                key, _, value = line.partition(' ')
+                fields[key] = value
+                continue
+            if 'worktree' in fields:
+                branch = fields.get('branch')
+                if branch and branch.startswith('refs/heads/'):
+                    branch = branch[len('refs/heads/'):]
+                worktrees.append(Worktree(fields['worktree'], fields.get('HEAD', ''), branch, 'prunable' in fields))
+            fields = {}
+        return worktrees
+
+    def is_ancestor(self, ancestor: str, rev: str) -> bool:
+        """Check whether one commit is an ancestor of (or the same as) another.
+
+        Args:
+            ancestor: The possible ancestor.
+            rev: The descendant to check.
+
+        Returns:
+            True if ancestor is reachable from rev.
+        """
+        status, _, stderr = self.git.merge_base('--is-ancestor', ancestor, rev,
+                                                with_extended_output=True, with_exceptions=False)
+        if status > 1:
+            import git
+            raise git.GitCommandError(['git', 'merge-base', '--is-ancestor', ancestor, rev], status, stderr)
+        return status == 0
+
+    def merge_trees(self, ours: str, theirs: str) -> MergeResult:
+        """Merge two commits in memory with `git merge-tree --write-tree`.
+
+        Nothing in any working tree or index is touched; the merged tree is only written
+        to the object store. Git older than 2.38 lacks `--write-tree`, so there the merge
+        is done in a temporary worktree instead.
+
+        Args:
+            ours: The commit merged into.
+            theirs: The commit to merge.
+
+        Returns:
+            The merged tree id, or None and the conflicting paths if the merge conflicts.
+        """
+        # GitPython runs `git version` once per Git instance and caches the result
+        if self.git.version_info < MERGE_TREE_MIN_VERSION:
+            return self._merge_trees_in_worktree(ours, theirs)
+        status, stdout, stderr = self.git.merge_tree('--write-tree', '--name-only', '--no-messages', ours, theirs,
+                                                     with_extended_output=True, with_exceptions=False)
+        lines = stdout.split('\n')
+        if status == 0:
+            return MergeResult(lines[0].strip(), [])
+        if status == 1:
+            # The tree id comes first, then one line per conflicted path
+            return MergeResult(None, [line for line in lines[1:] if line])
+        import git
+        raise git.GitCommandError(['git', 'merge-tree', '--write-tree', ours, theirs], status, stderr)
+
+    def _merge_trees_in_worktree(self, ours: str, theirs: str) -> MergeResult:
+        """Merge two commits in a temporary worktree, for Git without `merge-tree --write-tree`."""
+        import git
+        import shutil
+        import tempfile
+        path = tempfile.mkdtemp(prefix='runic-merge-')
+        try:
+            self.git.worktree('add', '--detach', path, ours)
+            worktree = git.Git(path)
+            status, _, stderr = worktree.merge('--no-commit', '--no-ff', theirs,
+                                               with_extended_output=True, with_exceptions=False)
+            if status != 0:
+                conflicts = [line for line in worktree.diff('--name-only', '--diff-filter=U').split('\n') if line]
+                worktree.merge('--abort', with_exceptions=False)
+                if not conflicts:
+                    raise git.GitCommandError(['git', 'merge', '--no-commit', '--no-ff', theirs], status, stderr)
+                return MergeResult(None, conflicts)
+            return MergeResult(worktree.write_tree().strip(), [])
+        finally:
+            self.git.worktree('remove', '--force', path, with_exceptions=False)
+            shutil.rmtree(path, ignore_errors=True)
+            self.git.worktree('prune', with_exceptions=False)
+
+    def commit_tree(self, tree: str, parents: Sequence[str], message: str) -> str:
+        """Create a commit object for a tree without touching any branch or working tree.
+
+        Args:
+            tree: The tree id.
+            parents: The parent commit ids.
+            message: The commit message.
+
+        Returns:
+            The new commit id.
+        """
+        args = [tree]
+        for parent in parents:
+            args += ['-p', parent]
+        return self.git.commit_tree(*args, '-m', message).strip()
+
+    def merge_commits(self, ours: str, theirs: str, message: str) -> BranchMerge:
+        """Merge one commit into another without touching any branch or working tree.
+
+        Args:
+            ours: The commit merged into.
+            theirs: The commit to merge.
+            message: The message of the merge commit, if one is needed.
+
+        Returns:
+            The outcome, whose commit is the result of the merge (None on conflict).
+        """
+        if self.is_ancestor(theirs, ours):
+            return BranchMerge('up-to-date', ours)
+        if self.is_ancestor(ours, theirs):
+            return BranchMerge('fast-forward', theirs)
+        merged = self.merge_trees(ours, theirs)
+        if merged.tree is None:
+            return BranchMerge('conflict', None, merged.conflicts)
+        return BranchMerge('merged', self.commit_tree(merged.tree, [ours, theirs], message))
+
+    def merge_into(self, branch: str, rev: str, message: str) -> BranchMerge:
+        """Merge a commit into a branch in memory and move the branch to the result.
+
+        Args:
+            branch: The branch to merge into.
+            rev: The commit or branch to merge.
+            message: The message of the merge commit, if one is needed.
+
+        Returns:
+            The outcome. On conflict the branch is left unchanged.
+        """
+        old = self.resolve(f"refs/heads/{branch}")
+        theirs = self.resolve(rev)
+        if old is None or theirs is None:
+            raise ValueError(f"Unknown revision: {rev if old else branch}")
+        result = self.merge_commits(old, theirs, message)
+        if result.status in ('fast-forward', 'merged'):
+            self.advance_branch(branch, result.commit, old, message)
+        return result
+
+    def rebase_detached(self, rev: str, onto: str) -> Tuple[Optional[str], List[str]]:
+        """Rebase a commit onto another in a temporary worktree.
+
+        Only rebases need real files to apply commits one by one, so this is the one
+        operation that checks anything out, and it does so away from every agent's checkout.
+
+        Args:
+            rev: The tip of the commits to rebase.
+            onto: The commit to rebase them onto.
+
+        Returns:
+            The rebased tip and no conflicts, or None and the conflicting paths.
+        """
+        import git
+        import shutil
+        import tempfile
+        path = tempfile.mkdtemp(prefix='runic-rebase-')
+        try:
+            self.git.worktree('add', '--detach', path, rev)
+            worktree = git.Git(path)
+            status, _, _ = worktree.rebase(onto, with_extended_output=True, with_exceptions=False)
+            if status != 0:
+                conflicts = [line for line in worktree.diff('--name-only', '--diff-filter=U').split('\n') if line]
+                worktree.rebase('--abort', with_exceptions=False)
+                return None, conflicts
+            return worktree.rev_parse('HEAD').strip(), []
+        finally:
+            self.git.worktree('remove', '--force', path, with_exceptions=False)
+            shutil.rmtree(path, ignore_errors=True)
+            self.git.worktree('prune', with_exceptions=False)
+
+    def advance_branch(self, branch: str, new: str, old: str, message: str) -> None:
+        """Move a branch from one commit to another.
+
+        The ref is updated with `git update-ref`, which fails if another process moved the
+        branch in the meantime. If the branch is checked out in a worktree, that worktree is
+        brought along with a two-tree `git read-tree -m -u`, which only rewrites the files that
+        differ between the two commits and keeps uncommitted changes to other files. If the
+        ref update then fails, the worktree is moved back before the error is raised.
+
+        Args:
+            branch: The branch name.
+            new: The commit the branch should point to.
+            old: The commit the branch is expected to point to now.
+            message: The reflog message.
+        """
+        import git
+        checkout = None
+        for worktree in self.list_worktrees():
+            if worktree.branch == branch:
+                checkout = git.Git(worktree.path)
+                checkout.read_tree('-m', '-u', old, new)
+                break
+        try:
+            self.git.update_ref('-m', message, f"refs/heads/{branch}", new, old)
+        except git.GitCommandError:
+            # Another process moved the branch: put the worktree's files back so the
+            # checkout still matches the commit its branch points to
+            if checkout is not None:
+                checkout.read_tree('-m', '-u', new, old)
+            raise
+        finally:
+            self.invalidate()
+
+    def has_remote(self, name: str) -> bool:
+        """Check whether the repository has a remote with the given name."""
+        return name in self.git.remote().split()
+
+    def default_branch(self) -> str:
+        """Get the name of the main branch ('main' if it exists, 'master' otherwise).
+
+        Returns:
+            The branch name.
+        """
+        self._check_refs()
+        if self._default_branch is None:
+            self._default_branch = 'main' if 'main' in self.branch_names() else 'master'
+        return self._default_branch
+
+    def resolve(self, rev: str) -> Optional[str]:
+        """Resolve a revision to an object id through the persistent cat-file process.
+
+        Args:
+            rev: The revision to resolve, e.g. a branch name.
+
+        Returns:
+            The hex object id, or None if the revision doesn't exist.
+        """
+        import git
+        try:
+            hexsha, _, _ = self.git.get_object_header(rev)
+        except (git.GitCommandError, ValueError):
+            # cat-file reports unknown revisions as 'missing', which GitPython can't parse
+            return None
+        return hexsha.decode('ascii') if isinstance(hexsha, bytes) else hexsha
+
+    def cat_file(self, rev: str) -> Tuple[str, bytes]:
+        """Read an object through the persistent `git cat-file --batch` process.
+
+        Args:
+            rev: The revision or object id to read.
+
+        Returns:
+            A tuple of (object type, object data).
+        """
+        _, type_name, _, data = self.git.get_object_data(rev)
+        if isinstance(type_name, bytes):
+            type_name = type_name.decode('ascii')
+        return type_name, data
+
+    def close(self) -> None:
+        """Stop the persistent git processes and release the repository."""
+        self.git.clear_cache()
+        self.repo.close()
+
+def get_repo_context(path: str = '.') -> RepoContext:
+    """Get the shared context for a repository, opening it on first use.
+
+    Args:
+        path: The path to the repository's working tree.
+
+    Returns:
+        The repository context.
+    """
+    key = os.path.realpath(path)
+    context = _contexts.get(key)
+    if context is None:
+        context = RepoContext(path)
+        _contexts[key] = context
+    return context
+
+def close_repo_contexts() -> None:
+    """Close every open repository context."""
+    while _contexts:
+        _, context = _contexts.popitem()
+        context.close()
@@ -0,0 +1,226 @@
+"""
+Index module for Runic.
+
+This module provides a persistent cache of parsed memory files.
+Each entry is keyed by the file's path, modification time, size and content hash,
+so commands only re-read and re-parse the memory files that changed since the last run.
+"""
+
+import os
+import json
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Dict, Optional, Union, Any, Iterable
+
+if TYPE_CHECKING:
+    from runic.sections import MemoryDocument
+
+# Bump this whenever the layout of an index entry changes
+INDEX_VERSION = 3
+
+# Sections whose first line is kept in index entries (the fields of merge request files).
+# Keeping only these, not whole sections, lets the index of thousands of tracks load in
+# a few milliseconds
+INDEXED_FIELDS = ('Status', 'Priority', 'Date Requested')
+
+def _sha1(data: bytes) -> str:
+    """Hash file content; hashlib is only imported once a file actually has to be read."""
+    import hashlib
+    return hashlib.sha1(data).hexdigest()
+
+def _document_status(document: 'MemoryDocument') -> Optional[str]:
+    """Extract the status line from the 'Overall Status' section, if any."""
+    for heading, body in document.items():
+        if heading.startswith('Overall Status'):
+            # Older files put the status on the heading line itself
+            inline = heading[len('Overall Status'):].lstrip(':').strip()
+            if inline:
+                return inline
+            return body.split('\n', 1)[0].strip() or None
+    return None
+
+def _first_lines(document: 'MemoryDocument') -> Dict[str, str]:
+    """Map each of INDEXED_FIELDS to the first line of its section (the first section of a heading wins)."""
+    fields = {}
+    for heading, body in document.items():
+        if heading in INDEXED_FIELDS and heading not in fields:
+            fields[heading] = body.strip().split('\n', 1)[0].strip()
+    return fields
+
+def stat_markdown_files(directory: Union[str, Path]) -> Dict[str, os.stat_result]:
+    """Stat every markdown file under a directory, skipping hidden files and directories.
+
+    Args:
+        directory: The directory to walk, e.g. the memory directory.
+
+    Returns:
+        The stat result of each file, keyed by its path relative to the directory.
+    """
+    files = {}
+    directory = str(directory)
+    for root, dirs, names in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        for name in names:
+            if name.endswith('.md') and not name.startswith('.'):
+                path = os.path.join(root, name)
+                try:
+                    files[os.path.relpath(path, directory)] = os.stat(path)
+                except OSError:
+                    pass
+    return files
+
+class MemoryIndex:
+    """Persistent cache of parsed memory files stored under the Runic base directory."""
+
+    def __init__(self, base_dir: Union[str, Path] = '.runic'):
+        """Initialize the memory index.
+
+        Args:
+            base_dir: The base directory for Runic files.
+        """
+        self.base_dir = Path(base_dir)
+        self.index_path = self.base_dir / 'index.json'
+        self._prefix = os.path.join(str(self.base_dir), '')
+        self._entries = None
+        self._dirty = False
+
+    def _key(self, file_path: str) -> str:
+        """Get the index key for a memory file (its path relative to the base directory)."""
+        if file_path.startswith(self._prefix):
+            # Fast path for the paths MemoryManager builds from the base directory
+            return file_path[len(self._prefix):]
+        return os.path.relpath(file_path, str(self.base_dir))
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        """Load the index from disk on first use."""
+        if self._entries is None:
+            self._entries = {}
+            try:
+                data = json.loads(self.index_path.read_text())
+                if data.get('version') == INDEX_VERSION:
+                    self._entries = data.get('files', {})
+            except (OSError, ValueError, AttributeError):
+                # A missing or corrupt index is simply rebuilt
+                pass
+        return self._entries
+
+    def _parse(self, data: bytes) -> Dict[str, Any]:
+        """Parse the content of a memory file into an index entry."""
+        from runic.sections import MemoryDocument
+        document = MemoryDocument(data)
+        return {
+            'hash': _sha1(data),
+            'fields': _first_lines(document),
+            'status': _document_status(document),
+            'upcoming': document.bullets('Upcoming Tasks'),
+        }
+
+    def get(self, file_path: Union[str, Path], stat_result: Optional[os.stat_result] = None) -> Optional[Dict[str, Any]]:
+        """Get the parsed entry for a memory file, re-parsing it only if it changed.
+
+        Args:
+            file_path: The path to the memory file.
+            stat_result: The file's stat result, if the caller already has it.
+
+        Returns:
+            The index entry, or None if the file doesn't exist or can't be read.
+        """
+        file_path = str(file_path)
+        entries = self._load()
+        key = self._key(file_path)
+
+        try:
+            if stat_result is None:
+                stat_result = os.stat(file_path)
+        except OSError:
+            if entries.pop(key, None) is not None:
+                self._dirty = True
+            return None
+
+        entry = entries.get(key)
+        if entry and entry['mtime_ns'] == stat_result.st_mtime_ns and entry['size'] == stat_result.st_size:
+            return entry
+
+        try:
+            with open(file_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        digest = _sha1(data)
+        if not entry or entry['hash'] != digest:
+            entry = self._parse(data)
+        entry['mtime_ns'] = stat_result.st_mtime_ns
+        entry['size'] = stat_result.st_size
+        entries[key] = entry
+        self._dirty = True
+        return entry
+
+    def get_status(self, file_path: Union[str, Path]) -> Optional[str]:
+        """Get the 'Overall Status' line of a memory file.
+
+        Args:
+            file_path: The path to the memory file.
+
+        Returns:
+            The status string, or None if the file or its status doesn't exist.
+        """
+        entry = self.get(file_path)
+        return entry['status'] if entry else None
+
+    def get_upcoming_tasks(self, file_path: Union[str, Path]) -> Optional[List[str]]:
+        """Get the bullet lines of the 'Upcoming Tasks' section of a memory file.
+
+        Args:
+            file_path: The path to the memory file.
+
+        Returns:
+            The list of task lines, or None if the file or the section doesn't exist.
+        """
+        entry = self.get(file_path)
+        return entry['upcoming'] if entry else None
+
+    def clear(self) -> None:
+        """Drop every cached entry."""
+        self._entries = {}
+        self._dirty = True
+
+    def rebuild(self, file_paths: Iterable[Union[str, Path]]) -> int:
+        """Rebuild the index from scratch for the given memory files.
+
+        Args:
+            file_paths: The memory files to index.
+
+        Returns:
+            The number of files indexed.
+        """
+        self.clear()
+        indexed = 0
+        for file_path in file_paths:
+            if self.get(file_path) is not None:
+                indexed += 1
+        self.save()
+        return indexed
+
+    def save(self) -> bool:
+        """Write the index to disk if it changed.
+
+        Returns:
+            True if the index was written, False otherwise.
+        """
+        if not self._dirty or not self.base_dir.is_dir():
+            return False
+
+        tmp_path = self.index_path.with_name(f".{self.index_path.name}.{os.getpid()}.tmp")
+        try:
+            tmp_path.write_text(json.dumps({'version': INDEX_VERSION, 'files': self._entries}))
+            os.replace(str(tmp_path), str(self.index_path))
+        except OSError:
+            # The index is only a cache, so a read-only checkout still works without it
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+            return False
+
+        self._dirty = False
+        return True
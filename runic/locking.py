@@ -0,0 +1,362 @@
+"""
+Locking module for Runic.
+
+This module makes writes to memory files safe when several agents share one
+`.runic/memory` directory. Every write is a compare-and-swap: the new content is
+prepared in a temporary file first, and an advisory `fcntl` lock on the file is only
+held to check that the content is still the version the writer started from and to
+rename the temporary file into place. Locks are per file, so agents writing different
+files never wait for each other.
+
+When the content changed in the meantime, a write is either re-applied to the new
+content (update_file) or merged with it section by section (write_file). A writer
+that keeps losing the race backs off and finally makes its edit under the lock.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+# Number of times a write is retried after losing a compare-and-swap race
+MAX_WRITE_ATTEMPTS = 8
+
+# Directory of a .runic tree holding the lock files of the files under it
+LOCKS_DIR = 'locks'
+
+class WriteConflict(Exception):
+    """Raised when concurrent edits to a memory file changed the same section."""
+
+def content_version(data: Optional[bytes]) -> Optional[str]:
+    """Get the version of a file's content (None for a missing file).
+
+    Args:
+        data: The content, or None if the file doesn't exist.
+
+    Returns:
+        A hash of the content.
+    """
+    if data is None:
+        return None
+    import hashlib
+    return hashlib.sha1(data).hexdigest()
+
+def read_versioned(file_path: str) -> Tuple[Optional[bytes], Optional[str]]:
+    """Read a file together with its content version.
+
+    Args:
+        file_path: The path to the file.
+
+    Returns:
+        The content and its version, or (None, None) if the file doesn't exist.
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None, None
+    return data, content_version(data)
+
+def _lock_path(target: str) -> str:
+    """Get the path of the lock file guarding a file.
+
+    Files under a .runic directory are locked through .runic/locks/<hash of their path>, so
+    no lock files appear in the memory directories projects commit, and removing a track
+    directory never removes a lock another agent holds. Other files use a hidden
+    '.<name>.lock' next to them.
+    """
+    marker = os.sep + '.runic' + os.sep
+    position = target.rfind(marker)
+    if position < 0:
+        directory, name = os.path.split(target)
+        return os.path.join(directory, f".{name}.lock")
+    import hashlib
+    locks_dir = os.path.join(target[:position + len(marker)], LOCKS_DIR)
+    return os.path.join(locks_dir, hashlib.sha1(target.encode('utf-8')).hexdigest())
+
+def _make_locks_dir(directory: str) -> None:
+    """Create a locks directory that git ignores."""
+    os.makedirs(directory, exist_ok=True)
+    ignore_path = os.path.join(directory, '.gitignore')
+    if not os.path.exists(ignore_path):
+        with open(ignore_path, 'w') as f:
+            f.write('*\n')
+
+@contextmanager
+def file_lock(file_path: str) -> Iterator[None]:
+    """Hold an exclusive advisory lock on a file.
+
+    The lock is taken on a separate lock file (see _lock_path), because the file itself
+    is replaced (and so changes inode) on every write. Where fcntl isn't available the
+    lock is a no-op and writes fall back to plain compare-and-swap.
+
+    Args:
+        file_path: The path to the file to lock.
+    """
+    try:
+        import fcntl
+    except ImportError:
+        fcntl = None
+    lock_path = _lock_path(os.path.realpath(file_path))
+    try:
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    except FileNotFoundError:
+        _make_locks_dir(os.path.dirname(lock_path))
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        # Closing the descriptor releases the lock
+        os.close(fd)
+
+def write_temp(target: str, data: bytes) -> str:
+    """Write data to a durable temporary file next to a target file.
+
+    Args:
+        target: The real path of the file the data is meant for.
+        data: The content to write.
+
+    Returns:
+        The path of the temporary file, with the target's permissions.
+    """
+    directory, name = os.path.split(target)
+    tmp_path = os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(tmp_path, os.stat(target).st_mode & 0o7777)
+        except FileNotFoundError:
+            pass
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    return tmp_path
+
+def atomic_write(file_path: Union[str, 'os.PathLike'], data: bytes) -> None:
+    """Write a file atomically through a temporary file and os.replace.
+
+    Readers and other agents see either the old or the new content, never a
+    partial write. Symlinks are followed so the file they point to is replaced.
+    This overwrites unconditionally; use update_file or write_file for files
+    other agents may be editing.
+
+    Args:
+        file_path: The path to the file.
+        data: The new content of the file.
+    """
+    target = os.path.realpath(str(file_path))
+    tmp_path = write_temp(target, data)
+    try:
+        os.replace(tmp_path, target)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def compare_and_swap(file_path: str, data: bytes, version: Optional[str]) -> bool:
+    """Replace a file's content only if it still has the expected version.
+
+    Args:
+        file_path: The path to the file. Symlinks are followed.
+        data: The new content.
+        version: The content version the new content was derived from (see content_version),
+            or None if the file must not exist yet.
+
+    Returns:
+        True if the file was written, False if its version had changed.
+    """
+    target = os.path.realpath(file_path)
+    tmp_path = write_temp(target, data)
+    try:
+        with file_lock(target):
+            # Only this check and the rename happen under the lock
+            current, current_version = read_versioned(target)
+            if current_version != version:
+                return False
+            os.replace(tmp_path, target)
+            tmp_path = None
+            return True
+    finally:
+        if tmp_path is not None:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+
+def create_file(file_path: str, data: bytes) -> bool:
+    """Create a file, unless another writer created it first.
+
+    Args:
+        file_path: The path to the file.
+        data: The content of the file.
+
+    Returns:
+        True if the file was created, False if it already existed.
+    """
+    return compare_and_swap(file_path, data, None)
+
+def _write_locked(file_path: str, compute: Callable[[Optional[bytes]], Optional[bytes]]) -> Optional[bytes]:
+    """Read, compute and write a file while holding its lock; the fallback for contended files."""
+    target = os.path.realpath(file_path)
+    with file_lock(target):
+        current, _ = read_versioned(target)
+        new_data = compute(current)
+        if new_data is None or new_data == current:
+            return None
+        tmp_path = write_temp(target, new_data)
+        try:
+            os.replace(tmp_path, target)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        return new_data
+
+def _backoff(attempt: int) -> None:
+    """Sleep for a short, randomized, exponentially growing time before retrying a write."""
+    import random
+    import time
+    time.sleep(random.uniform(0, 0.0005 * (2 ** attempt)))
+
+def update_file(file_path: str, edit: Callable[[Optional[bytes]], Optional[bytes]],
+                attempts: int = MAX_WRITE_ATTEMPTS) -> Optional[bytes]:
+    """Apply an edit to a file's current content and write the result.
+
+    If another writer changes the file between the read and the write, the edit is
+    applied again to the new content, so edits such as setting one section never
+    overwrite someone else's change. After the given number of lost races, the edit
+    is made while holding the file's lock, so it always completes.
+
+    Args:
+        file_path: The path to the file.
+        edit: Called with the current content (None if the file doesn't exist); returns
+            the new content, or None to leave the file unchanged.
+        attempts: The number of lock-free attempts.
+
+    Returns:
+        The content written, or None if the edit left the file unchanged.
+    """
+    for attempt in range(attempts):
+        data, version = read_versioned(file_path)
+        new_data = edit(data)
+        if new_data is None or new_data == data:
+            return None
+        if compare_and_swap(file_path, new_data, version):
+            return new_data
+        _backoff(attempt)
+    return _write_locked(file_path, edit)
+
+def write_file(file_path: str, data: bytes, base: Optional[bytes],
+               attempts: int = MAX_WRITE_ATTEMPTS) -> bytes:
+    """Write a new version of a file that was derived from an earlier version.
+
+    If the file changed since base was read, the two versions are merged section by
+    section: sections changed on only one side are taken from that side.
+
+    Args:
+        file_path: The path to the file.
+        data: The new content.
+        base: The content data was derived from (None if the file didn't exist).
+        attempts: The number of lock-free attempts before merging under the file's lock.
+
+    Returns:
+        The content written, which includes concurrent edits to other sections.
+
+    Raises:
+        WriteConflict: If both versions changed the same section.
+    """
+    def merge(current: Optional[bytes]) -> bytes:
+        if current == base or current == data:
+            return data
+        merged = merge_sections(base or b'', data, current or b'')
+        if merged is None:
+            raise WriteConflict(f"{file_path} was changed concurrently in the same section")
+        return merged
+
+    for attempt in range(attempts):
+        current, version = read_versioned(file_path)
+        merged = merge(current)
+        if merged == current or compare_and_swap(file_path, merged, version):
+            return merged
+        _backoff(attempt)
+    written = _write_locked(file_path, merge)
+    return written if written is not None else read_versioned(file_path)[0]
+
+def _split_sections(data: bytes) -> List[Tuple[Tuple[str, int], bytes]]:
+    """Split markdown into keyed chunks: the text before the first heading, then each section."""
+    from runic.sections import parse_sections
+    sections = parse_sections(data)
+    chunks = [(('', 0), data[:sections[0].start] if sections else data)]
+    seen = {}
+    for section in sections:
+        # Repeated headings are told apart by their position among equal headings
+        occurrence = seen.get(section.heading, 0)
+        seen[section.heading] = occurrence + 1
+        chunks.append(((section.heading, occurrence), data[section.start:section.end]))
+    return chunks
+
+def merge_sections(base: bytes, ours: bytes, theirs: bytes) -> Optional[bytes]:
+    """Merge two edits of a markdown file section by section.
+
+    Args:
+        base: The common original content.
+        ours: One edited version.
+        theirs: The other edited version.
+
+    Returns:
+        The merged content, or None if both versions changed the same section differently.
+    """
+    base_chunks: Dict = dict(_split_sections(base))
+    our_chunks = _split_sections(ours)
+    ours_by_key: Dict = dict(our_chunks)
+    their_chunks = _split_sections(theirs)
+    theirs_by_key: Dict = dict(their_chunks)
+
+    def same(a: Optional[bytes], b: Optional[bytes]) -> bool:
+        # Appending a section after another changes the blank lines ending it, which isn't an edit
+        return a == b or (a is not None and b is not None and a.rstrip() == b.rstrip())
+
+    def resolve(key):
+        original, mine, other = base_chunks.get(key), ours_by_key.get(key), theirs_by_key.get(key)
+        if same(mine, other) or same(mine, original):
+            return True, other
+        if same(other, original):
+            return True, mine
+        return False, None
+
+    merged = []
+    for key, _ in their_chunks:
+        ok, chunk = resolve(key)
+        if not ok:
+            return None
+        merged.append((key, chunk))
+
+    # Sections only we added go after the section that precedes them in our version
+    previous = None
+    for key, chunk in our_chunks:
+        if key not in theirs_by_key:
+            ok, chunk = resolve(key)
+            if not ok:
+                return None
+            position = next((i + 1 for i, (k, _) in enumerate(merged) if k == previous), len(merged))
+            merged.insert(position, (key, chunk))
+        previous = key
+
+    parts = [chunk for _, chunk in merged if chunk]
+    for i in range(len(parts) - 1):
+        # Keep a blank line between sections, e.g. after what used to be the last one
+        if not parts[i].endswith(b'\n\n'):
+            parts[i] = parts[i].rstrip(b'\n') + b'\n\n'
+    return b''.join(parts)
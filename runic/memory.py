@@ -8,7 +8,54 @@ It focuses on the core functionality of creating, updating, and reading memory f
 import os
 import datetime
 from pathlib import Path
-from typing import List, Dict, Optional, Union
+from typing import List, Dict, Optional, Tuple, Union, Any, NamedTuple, Callable
+from runic.index import MemoryIndex
+from runic.locking import create_file, update_file
+from runic.sections import MemoryDocument
+
+# Upper bound on the number of memory files rewritten at the same time
+MAX_UPDATE_WORKERS = 16
+
+class TimestampUpdate(NamedTuple):
+    """The outcome of updating the timestamp in one memory file.
+    
+    status is one of 'updated', 'unchanged', 'missing' or 'error'.
+    """
+    path: Path
+    status: str
+    error: Optional[str] = None
+
+# Memory files every track directory may contain
+TRACK_FILE_NAMES = ('active-context.md', 'progress.md')
+
+class TrackEntry(NamedTuple):
+    """A track directory found by MemoryManager.scan_tracks.
+    
+    files maps the name of each memory file present in the track directory
+    to its stat result.
+    """
+    dir_name: str
+    display_name: str
+    path: str
+    files: Dict[str, os.stat_result]
+    
+    def memory_files(self) -> List[Path]:
+        """Get the paths of the track's memory files that exist."""
+        return [Path(self.path, name) for name in TRACK_FILE_NAMES if name in self.files]
+
+# Upcoming tasks written to the progress file of a new track
+NEW_TRACK_TASKS = ('[Future task 1]', '[Future task 2]')
+
+class NewTrack(NamedTuple):
+    """A track created by MemoryManager.create_track.
+    
+    upcoming_tasks holds the '-' bullet lines of the new progress file's
+    'Upcoming Tasks' section, so callers don't have to read the file back.
+    """
+    dir_name: str
+    display_name: str
+    path: Path
+    upcoming_tasks: List[str]
 
 class MemoryManager:
     """Manages memory files for Runic."""
@@ -22,6 +69,9 @@ class MemoryManager:
         self.base_dir = Path(base_dir)
         self.memory_dir = self.base_dir / 'memory'
         self.tracks_dir = self.memory_dir / 'tracks'
+        self.index = MemoryIndex(self.base_dir)
+        self._tracks = None
+        self._tracks_names = TRACK_FILE_NAMES
     
     def ensure_directories(self) -> None:
         """Ensure that all required directories exist."""
@@ -77,6 +127,58 @@ class MemoryManager:
         """
         return self._to_kebab_case(track_name)
     
+    def _stat_track_files(self, track_dir: str, names: Tuple[str, ...] = TRACK_FILE_NAMES) -> Dict[str, os.stat_result]:
+        """Stat the memory files of one track directory, skipping the missing ones."""
+        files = {}
+        prefix = track_dir + os.sep
+        for name in names:
+            try:
+                files[name] = os.stat(prefix + name)
+            except OSError:
+                pass
+        return files
+    
+    def scan_tracks(self, refresh: bool = False, names: Tuple[str, ...] = TRACK_FILE_NAMES) -> List['TrackEntry']:
+        """Enumerate all tracks in a single os.scandir pass over the tracks directory.
+        
+        The result is kept for the lifetime of the manager, so every query made
+        through it shares one enumeration.
+        
+        Args:
+            refresh: Rescan the tracks directory even if it was already scanned.
+            names: The memory files to stat in each track directory. Queries that need
+                fewer files pass only those, which halves the stat calls per track.
+            
+        Returns:
+            One entry per track directory, with the stat results of its memory files.
+        """
+        if self._tracks is not None and not refresh and set(names) <= set(self._tracks_names):
+            return self._tracks
+        
+        tracks = []
+        title_case = self._to_title_case
+        stat_files = self._stat_track_files
+        try:
+            with os.scandir(str(self.tracks_dir)) as entries:
+                for entry in entries:
+                    # is_dir() uses the directory entry type, so it costs no extra stat
+                    if not entry.is_dir():
+                        continue
+                    # For existing tracks, we use the directory name as is
+                    # but for display, we convert it back to Title Case
+                    display_name = title_case(entry.name.replace('-', ' '))
+                    tracks.append(TrackEntry(entry.name, display_name, entry.path, stat_files(entry.path, names)))
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+        
+        self._tracks = tracks
+        self._tracks_names = names
+        return tracks
+    
+    def forget_tracks(self) -> None:
+        """Drop the cached track scan, so the next query rescans the tracks directory."""
+        self._tracks = None
+    
     def get_track_memory_files(self, track: Optional[str] = None) -> Dict[str, List[Path]]:
         """Get a dictionary of track memory files.
         
@@ -88,29 +190,14 @@ class MemoryManager:
         """
         result = {}
         
-        if not self.tracks_dir.exists():
-            return result
-        
         if track:
             track_dir = self.tracks_dir / self._get_track_dir_name(track)
-            if track_dir.exists() and track_dir.is_dir():
-                track_files = [
-                    track_dir / 'active-context.md',
-                    track_dir / 'progress.md'
-                ]
-                result[track] = [f for f in track_files if f.exists()]
+            if track_dir.is_dir():
+                files = self._stat_track_files(str(track_dir))
+                result[track] = [track_dir / name for name in TRACK_FILE_NAMES if name in files]
         else:
-            for track_dir in self.tracks_dir.iterdir():
-                if track_dir.is_dir():
-                    # For existing tracks, we use the directory name as is
-                    # but for display, we convert it back to Title Case
-                    dir_name = track_dir.name
-                    display_name = self._to_title_case(dir_name.replace('-', ' '))
-                    track_files = [
-                        track_dir / 'active-context.md',
-                        track_dir / 'progress.md'
-                    ]
-                    result[display_name] = [f for f in track_files if f.exists()]
+            for entry in self.scan_tracks():
+                result[entry.display_name] = entry.memory_files()
         
         return result
     
@@ -125,6 +212,39 @@ class MemoryManager:
             'tracks': self.get_track_memory_files()
         }
     
+    def _update_timestamp_file(self, file_path: Path, timestamp: str) -> 'TimestampUpdate':
+        """Update the timestamp in one memory file and report what happened."""
+        def set_timestamp(data: Optional[bytes]) -> Optional[bytes]:
+            if data is None:
+                raise FileNotFoundError(str(file_path))
+            # Rewrite only the 'Last Updated' section, adding it at the end if missing
+            return MemoryDocument(data).set('Last Updated', timestamp).data
+        
+        try:
+            if self.update_memory_file(file_path, set_timestamp) is None:
+                return TimestampUpdate(file_path, 'unchanged')
+            return TimestampUpdate(file_path, 'updated')
+        except FileNotFoundError:
+            return TimestampUpdate(file_path, 'missing')
+        except Exception as e:
+            return TimestampUpdate(file_path, 'error', str(e))
+    
+    def update_memory_file(self, file_path: Union[str, Path],
+                           edit: Callable[[Optional[bytes]], Optional[bytes]]) -> Optional[bytes]:
+        """Apply an edit to a memory file that other agents may be writing at the same time.
+        
+        The edit is re-applied to the latest content if another agent wrote the file first.
+        
+        Args:
+            file_path: The path to the memory file.
+            edit: Called with the current content (None if the file doesn't exist); returns
+                the new content, or None to leave the file unchanged.
+            
+        Returns:
+            The content written, or None if the file was left unchanged.
+        """
+        return update_file(str(file_path), edit)
+    
     def update_timestamp(self, file_path: Union[str, Path], timestamp: Optional[str] = None) -> bool:
         """Update the timestamp in a memory file.
         
@@ -133,67 +253,69 @@ class MemoryManager:
             timestamp: The timestamp to use. If None, use the current time.
             
         Returns:
-            True if the file was updated, False otherwise.
+            True if the file is up to date, False otherwise.
         """
-        file_path = Path(file_path)
-        if not file_path.exists():
-            return False
-        
         if timestamp is None:
             timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        try:
-            content = file_path.read_text()
-            
-            # Check if file already has a timestamp section
-            if "## Last Updated" in content:
-                # Update existing timestamp
-                lines = content.split('\n')
-                for i, line in enumerate(lines):
-                    if line.startswith("## Last Updated"):
-                        if i + 1 < len(lines):
-                            lines[i + 1] = timestamp
-                        else:
-                            lines.append(timestamp)
-                        break
-                updated_content = '\n'.join(lines)
-            else:
-                # Add timestamp at the end
-                updated_content = content.rstrip() + f"\n\n## Last Updated\n{timestamp}\n"
-            
-            file_path.write_text(updated_content)
-            return True
-        except Exception as e:
-            print(f"Error updating timestamp in {file_path}: {e}")
-            return False
+        result = self._update_timestamp_file(Path(file_path), timestamp)
+        if result.status == 'error':
+            print(f"Error updating timestamp in {file_path}: {result.error}")
+        return result.status in ('updated', 'unchanged')
     
-    def update_all_timestamps(self, timestamp: Optional[str] = None) -> Dict[str, int]:
-        """Update timestamps in all memory files.
+    def update_timestamps(self, file_paths: List[Path], timestamp: Optional[str] = None,
+                          max_workers: int = MAX_UPDATE_WORKERS) -> List['TimestampUpdate']:
+        """Update the timestamps in many memory files concurrently.
+        
+        Each file is rewritten atomically, and files whose content would not change
+        are left untouched.
         
         Args:
+            file_paths: The paths to the memory files.
             timestamp: The timestamp to use. If None, use the current time.
+            max_workers: The maximum number of files to update at the same time.
             
         Returns:
-            A dictionary with 'core' and 'tracks' keys mapping to the number of files updated.
+            One result per file, in the same order as file_paths.
         """
         if timestamp is None:
             timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        core_updated = 0
-        for file_path in self.get_core_memory_files():
-            if self.update_timestamp(file_path, timestamp):
-                core_updated += 1
+        file_paths = [Path(f) for f in file_paths]
+        if len(file_paths) <= 1:
+            return [self._update_timestamp_file(f, timestamp) for f in file_paths]
         
-        tracks_updated = 0
-        track_files = self.get_track_memory_files()
-        for track_name, files in track_files.items():
-            for file_path in files:
-                if self.update_timestamp(file_path, timestamp):
-                    tracks_updated += 1
+        from concurrent.futures import ThreadPoolExecutor
+        workers = max(1, min(max_workers, len(file_paths)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda f: self._update_timestamp_file(f, timestamp), file_paths))
+    
+    def update_all_timestamps(self, timestamp: Optional[str] = None) -> Dict[str, Any]:
+        """Update timestamps in all memory files.
+        
+        Args:
+            timestamp: The timestamp to use. If None, use the current time.
+            
+        Returns:
+            A dictionary with 'core' and 'tracks' keys mapping to the number of files updated,
+            'unchanged' and 'errors' counts, and 'results' with the per-file results.
+        """
+        core_files = self.get_core_memory_files()
+        track_files = []
+        for track_name, files in self.get_track_memory_files().items():
+            track_files.extend(files)
+        
+        # One pool for every file, so the update takes about as long as the slowest file
+        results = self.update_timestamps(core_files + track_files, timestamp)
+        core_results = results[:len(core_files)]
+        track_results = results[len(core_files):]
         
         return {
-            'core': core_updated,
-            'tracks': tracks_updated
+            'core': sum(1 for r in core_results if r.status == 'updated'),
+            'tracks': sum(1 for r in track_results if r.status == 'updated'),
+            'unchanged': sum(1 for r in results if r.status == 'unchanged'),
+            'errors': sum(1 for r in results if r.status == 'error'),
+            'results': results
         }
     
     def update_track_timestamps(self, track: str, timestamp: Optional[str] = None) -> int:
@@ -206,26 +328,25 @@ class MemoryManager:
         Returns:
             The number of files updated.
         """
-        if timestamp is None:
-            timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        updated = 0
-        track_files = self.get_track_memory_files(track)
-        for track_name, files in track_files.items():
-            for file_path in files:
-                if self.update_timestamp(file_path, timestamp):
-                    updated += 1
-        
-        return updated
+        file_paths = []
+        for track_name, files in self.get_track_memory_files(track).items():
+            file_paths.extend(files)
+        
+        results = self.update_timestamps(file_paths, timestamp)
+        for result in results:
+            if result.status == 'error':
+                print(f"Error updating timestamp in {result.path}: {result.error}")
+        return sum(1 for r in results if r.status == 'updated')
     
-    def create_track(self, track_name: str) -> bool:
+    def create_track(self, track_name: str) -> Optional['NewTrack']:
         """Create a new track with the given name.
         
         Args:
             track_name: The name of the track to create.
             
         Returns:
-            True if the track was created, False if it already exists.
+            The created track, including the upcoming tasks written to its progress
+            file, or None if the track already exists.
         """
         # Convert track name to kebab-case for directory
         track_dir_name = self._get_track_dir_name(track_name)
@@ -233,41 +354,45 @@ class MemoryManager:
         display_name = self._to_title_case(track_name)
         
         track_dir = self.tracks_dir / track_dir_name
-        if track_dir.exists():
-            return False
-        
-        track_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            # Creating the directory claims the track, so two agents can't both create it
+            track_dir.mkdir(parents=True)
+        except FileExistsError:
+            return None
+        # The cached track scan no longer matches the tracks directory
+        self.forget_tracks()
         
         # Create active-context.md
-        active_context_path = track_dir / 'active-context.md'
-        with active_context_path.open('w') as f:
-            f.write(f"# {display_name} - Active Context\n\n")
-            f.write("## Purpose\n[Description of track purpose]\n\n")
-            f.write("## Current Focus\n[Description of current focus]\n\n")
-            f.write("## Special Identity\n")
-            f.write(f"You are a {display_name} Specialist with deep expertise in this domain. ")
-            f.write("You excel at implementing solutions in this area, particularly ")
-            f.write("using relevant tools and frameworks. You understand the intricacies ")
-            f.write("of the challenges in this domain.\n\n")
-            f.write("Your knowledge includes:\n")
-            f.write("- [Key technology/API] (latest version X.X.X)\n")
-            f.write("- [Related pattern/practice]\n")
-            f.write("- [Domain-specific concept]\n")
-            f.write("- [Important technique]\n")
-            f.write("- [Integration knowledge]\n\n")
-            f.write(f"When addressing {display_name} implementation, you focus on [key quality attributes] ")
-            f.write("to ensure [desired outcome].\n")
+        create_file(str(track_dir / 'active-context.md'), (
+            f"# {display_name} - Active Context\n\n"
+            "## Purpose\n[Description of track purpose]\n\n"
+            "## Current Focus\n[Description of current focus]\n\n"
+            "## Special Identity\n"
+            f"You are a {display_name} Specialist with deep expertise in this domain. "
+            "You excel at implementing solutions in this area, particularly "
+            "using relevant tools and frameworks. You understand the intricacies "
+            "of the challenges in this domain.\n\n"
+            "Your knowledge includes:\n"
+            "- [Key technology/API] (latest version X.X.X)\n"
+            "- [Related pattern/practice]\n"
+            "- [Domain-specific concept]\n"
+            "- [Important technique]\n"
+            "- [Integration knowledge]\n\n"
+            f"When addressing {display_name} implementation, you focus on [key quality attributes] "
+            "to ensure [desired outcome].\n"
+        ).encode('utf-8'))
         
         # Create progress.md
-        progress_path = track_dir / 'progress.md'
-        with progress_path.open('w') as f:
-            f.write(f"# {display_name} - Progress\n\n")
-            f.write("## Overall Status\n[Brief status description]\n\n")
-            f.write("## Completed Tasks\n- [None yet]\n\n")
-            f.write("## In Progress\n- [Initial setup]\n\n")
-            f.write("## Upcoming Tasks\n- [Future task 1]\n- [Future task 2]\n")
-        
-        return True
+        upcoming_tasks = [f"- {task}" for task in NEW_TRACK_TASKS]
+        create_file(str(track_dir / 'progress.md'), (
+            f"# {display_name} - Progress\n\n"
+            "## Overall Status\n[Brief status description]\n\n"
+            "## Completed Tasks\n- [None yet]\n\n"
+            "## In Progress\n- [Initial setup]\n\n"
+            "## Upcoming Tasks\n" + "".join(f"{task}\n" for task in upcoming_tasks)
+        ).encode('utf-8'))
+        
+        return NewTrack(track_dir_name, display_name, track_dir, upcoming_tasks)
     
     def get_track_status(self, track_name: str) -> Optional[str]:
         """Get the status of a track from its progress file.
@@ -280,19 +405,9 @@ class MemoryManager:
         """
         track_dir_name = self._get_track_dir_name(track_name)
         progress_path = self.tracks_dir / track_dir_name / 'progress.md'
-        if not progress_path.exists():
-            return None
-        
-        try:
-            content = progress_path.read_text()
-            status_match = content.split("## Overall Status", 1)
-            if len(status_match) > 1:
-                status = status_match[1].split("\n", 1)[0].strip()
-                return status
-        except Exception as e:
-            print(f"Error reading track status: {e}")
-        
-        return None
+        status = self.index.get_status(progress_path)
+        self.index.save()
+        return status
     
     def get_all_track_statuses(self) -> Dict[str, Optional[str]]:
         """Get the status of all tracks.
@@ -301,14 +416,59 @@ class MemoryManager:
             A dictionary mapping track names to their status strings.
         """
         result = {}
+        # Only progress.md holds the status, so active-context.md isn't statted
+        for entry in self.scan_tracks(names=('progress.md',)):
+            progress_stat = entry.files.get('progress.md')
+            if progress_stat is None:
+                result[entry.display_name] = None
+                continue
+            # Hand the stat result from the scan to the index so it doesn't stat again
+            index_entry = self.index.get(os.path.join(entry.path, 'progress.md'), progress_stat)
+            result[entry.display_name] = index_entry['status'] if index_entry else None
+        
+        self.index.save()
+        return result
+    
+    def get_upcoming_tasks(self, file_path: Union[str, Path]) -> Optional[List[str]]:
+        """Get the upcoming tasks listed in a progress file.
         
-        if not self.tracks_dir.exists():
-            return result
+        Args:
+            file_path: The path to the progress file.
+            
+        Returns:
+            The task lines of the 'Upcoming Tasks' section, or None if the file
+            or the section doesn't exist.
+        """
+        tasks = self.index.get_upcoming_tasks(file_path)
+        self.index.save()
+        return tasks
+    
+    def get_next_steps(self) -> Dict[str, Any]:
+        """Collect what 'mem next' needs to recommend next steps.
         
-        for track_dir in self.tracks_dir.iterdir():
-            if track_dir.is_dir():
-                dir_name = track_dir.name
-                display_name = self._to_title_case(dir_name.replace('-', ' '))
-                result[display_name] = self.get_track_status(display_name)
+        Returns:
+            A dictionary with 'has_memory' (whether any memory file exists),
+            'progress_exists', 'upcoming' (the upcoming task lines of progress.md,
+            or None if it has no such section) and 'tracks' (track names mapped to
+            their status strings).
+        """
+        memory_files = self.get_all_memory_files()
+        progress_file = self.memory_dir / 'progress.md'
+        progress_exists = progress_file.exists()
+        return {
+            'has_memory': bool(memory_files['core'] or memory_files['tracks']),
+            'progress_exists': progress_exists,
+            'upcoming': self.get_upcoming_tasks(progress_file) if progress_exists else None,
+            'tracks': self.get_all_track_statuses() if memory_files['tracks'] else {}
+        }
+    
+    def reindex(self) -> int:
+        """Rebuild the parsed-memory index from scratch.
         
-        return result 
+        Returns:
+            The number of memory files indexed.
+        """
+        file_paths = list(self.get_core_memory_files())
+        for files in self.get_track_memory_files().values():
+            file_paths.extend(files)
+        return self.index.rebuild(file_paths)
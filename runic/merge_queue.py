@@ -0,0 +1,234 @@
+"""
+Merge queue module for Runic.
+
+This module provides `runic merge-queue`, which processes the merge requests that
+`$branch ready` leaves in `.runic/memory/merge-requests/`. Pending requests are merged in
+batches onto a scratch ref, optionally tested there, and landed on main in one step. A batch
+that fails is split in half until the failing request is found, and every request's
+`## Status` section records the outcome.
+"""
+
+import os
+import datetime
+from typing import Callable, List, NamedTuple, Optional
+from runic.git_context import get_repo_context
+from runic.locking import update_file
+from runic.memory import MemoryManager
+from runic.sections import MemoryDocument
+
+# Ref the queue builds and tests each batch on, so no branch moves until a batch passes
+SCRATCH_REF = 'refs/runic/merge-queue'
+
+# Number of requests merged and tested together unless --batch-size is given
+DEFAULT_BATCH_SIZE = 4
+
+# Seconds a test command may run before the batch counts as failed
+DEFAULT_TEST_TIMEOUT = 1800
+
+class MergeRequest(NamedTuple):
+    """A merge request file written by `$branch ready`."""
+    branch: str
+    path: str
+    requested: str
+    priority: int
+    status: str
+
+class QueueResult(NamedTuple):
+    """The outcome of one merge request in a queue run."""
+    branch: str
+    status: str  # 'merged' or 'failed'
+    detail: str
+
+class MergeQueue:
+    """Orders and processes the pending merge requests of a project."""
+
+    def __init__(self, memory_manager: Optional[MemoryManager] = None, context=None):
+        """Initialize the merge queue.
+
+        Args:
+            memory_manager: The MemoryManager whose memory holds the requests. If None, a new one is created.
+            context: The repository context. If None, the current repository is used.
+        """
+        self.memory_manager = memory_manager or MemoryManager()
+        self.requests_dir = self.memory_manager.memory_dir / 'merge-requests'
+        self.context = context or get_repo_context()
+
+    def requests(self, order: str = 'time', include_all: bool = False) -> List[MergeRequest]:
+        """List the merge requests, read through the memory index.
+
+        Args:
+            order: 'time' for the oldest request first, or 'priority' for the highest
+                '## Priority' first (then oldest first).
+            include_all: Include requests that are no longer pending.
+
+        Returns:
+            The requests in processing order.
+        """
+        requests = []
+        try:
+            with os.scandir(str(self.requests_dir)) as entries:
+                files = [(entry.name, entry.path, entry.stat()) for entry in entries
+                         if entry.name.endswith('.md') and entry.is_file()]
+        except FileNotFoundError:
+            return []
+
+        for name, path, stat_result in files:
+            entry = self.memory_manager.index.get(path, stat_result)
+            if entry is None:
+                continue
+            fields = entry['fields']
+            status = fields.get('Status') or 'Pending'
+            if not include_all and not status.lower().startswith('pending'):
+                continue
+            try:
+                priority = int(fields.get('Priority') or 0)
+            except ValueError:
+                priority = 0
+            requests.append(MergeRequest(name[:-len('.md')], path, fields.get('Date Requested') or '',
+                                         priority, status))
+        self.memory_manager.index.save()
+
+        if order == 'priority':
+            requests.sort(key=lambda request: (-request.priority, request.requested, request.branch))
+        else:
+            requests.sort(key=lambda request: (request.requested, request.branch))
+        return requests
+
+    def set_status(self, request: MergeRequest, status: str) -> None:
+        """Replace the '## Status' section of a merge request file.
+
+        Args:
+            request: The merge request.
+            status: The new section body; its first line is the status keyword.
+        """
+        # Other agents may be adding notes to the same request
+        update_file(request.path, lambda data: MemoryDocument(data).set('Status', status).data
+                    if data is not None else None)
+
+    def run(self, batch_size: int = DEFAULT_BATCH_SIZE, order: str = 'time', test_command: Optional[str] = None,
+            test_timeout: int = DEFAULT_TEST_TIMEOUT, dry_run: bool = False,
+            progress: Optional[Callable[[QueueResult], None]] = None) -> List[QueueResult]:
+        """Merge every pending request into main, a batch at a time.
+
+        Each batch is merged onto the scratch ref, on top of main, with in-memory merges.
+        If it merges cleanly and the test command (if any) passes on the result, main is
+        moved to it in one step. Otherwise the batch is split in half and each half is
+        tried again, until the requests that fail on their own are isolated.
+
+        Args:
+            batch_size: The number of requests tried together.
+            order: 'time' or 'priority' (see requests()).
+            test_command: A shell command run in a checkout of each candidate; a non-zero
+                exit status fails the candidate.
+            test_timeout: Seconds the test command may run.
+            dry_run: Test the batches but don't move main or update the request files.
+            progress: Called with each result as soon as it is known.
+
+        Returns:
+            One result per request.
+        """
+        context = self.context
+        main_branch = context.default_branch()
+        self._base = context.resolve(f"refs/heads/{main_branch}")
+        if self._base is None:
+            raise ValueError(f"Branch '{main_branch}' not found")
+        self._results = []
+        self._progress = progress
+        self._dry_run = dry_run
+        self._test_command = test_command
+        self._test_timeout = test_timeout
+        self._worktree = None
+
+        pending = []
+        for request in self.requests(order):
+            branch_sha = context.resolve(f"refs/heads/{request.branch}")
+            if branch_sha is None:
+                self._finish(request, 'failed', f"Branch '{request.branch}' not found")
+            else:
+                pending.append((request, branch_sha))
+
+        try:
+            for i in range(0, len(pending), max(1, batch_size)):
+                self._process(pending[i:i + max(1, batch_size)], main_branch)
+        finally:
+            if self._worktree:
+                context.git.worktree('remove', '--force', self._worktree, with_exceptions=False)
+                import shutil
+                shutil.rmtree(self._worktree, ignore_errors=True)
+                context.git.worktree('prune', with_exceptions=False)
+            context.git.update_ref('-d', SCRATCH_REF, with_exceptions=False)
+        return self._results
+
+    def _process(self, batch: List, main_branch: str) -> None:
+        """Try a batch on top of main, bisecting it if it fails."""
+        commit, reason = self._build(batch)
+        if commit is not None:
+            reason = self._test(commit)
+        if reason is None:
+            if not self._dry_run and commit != self._base:
+                self.context.advance_branch(main_branch, commit, self._base, f"runic merge-queue: merge {len(batch)} branch(es)")
+            self._base = commit
+            when = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            detail = (f"Would merge into {main_branch}" if self._dry_run
+                      else f"Merged into {main_branch} at {when} as {commit[:10]}")
+            for request, _ in batch:
+                self._finish(request, 'merged', detail)
+            return
+
+        if len(batch) == 1:
+            self._finish(batch[0][0], 'failed', reason)
+            return
+        middle = len(batch) // 2
+        self._process(batch[:middle], main_branch)
+        self._process(batch[middle:], main_branch)
+
+    def _build(self, batch: List):
+        """Merge a batch onto the scratch ref, starting from main.
+
+        Returns:
+            The resulting commit and None, or None and the reason the batch can't merge.
+        """
+        commit = self._base
+        for request, branch_sha in batch:
+            result = self.context.merge_commits(commit, branch_sha, f"Merge branch '{request.branch}'")
+            if result.status == 'conflict':
+                return None, f"Conflicts in: {', '.join(result.conflicts)}"
+            commit = result.commit
+        self.context.git.update_ref(SCRATCH_REF, commit)
+        return commit, None
+
+    def _test(self, commit: str) -> Optional[str]:
+        """Run the test command on a commit in the queue's own worktree.
+
+        Returns:
+            None if the commit passes, or the reason it fails.
+        """
+        if not self._test_command:
+            return None
+        import git
+        import subprocess
+        import tempfile
+        if self._worktree is None:
+            self._worktree = tempfile.mkdtemp(prefix='runic-merge-queue-')
+            self.context.git.worktree('add', '--detach', self._worktree, commit)
+        else:
+            # Switching an existing worktree only rewrites the files that differ
+            git.Git(self._worktree).checkout('--detach', '--force', commit)
+        try:
+            result = subprocess.run(self._test_command, shell=True, cwd=self._worktree, capture_output=True,
+                                    text=True, timeout=self._test_timeout)
+        except subprocess.TimeoutExpired:
+            return f"Tests timed out after {self._test_timeout}s"
+        if result.returncode != 0:
+            output = [line.strip() for line in (result.stdout + result.stderr).strip().split('\n')[-5:] if line.strip()]
+            return f"Tests failed (exit {result.returncode})" + (f": {' | '.join(output)}" if output else "")
+        return None
+
+    def _finish(self, request: MergeRequest, status: str, detail: str) -> None:
+        """Record the outcome of a request in its file and in the results."""
+        if not self._dry_run:
+            self.set_status(request, f"{status.capitalize()}\n{detail}")
+        result = QueueResult(request.branch, status, detail)
+        self._results.append(result)
+        if self._progress:
+            self._progress(result)
@@ -0,0 +1,330 @@
+"""
+Pack module for Runic.
+
+This module provides `runic mem pack`, which builds one context bundle for an agent role
+(and track) that fits a token budget. Every section of the role's instructions, the
+framework docs and the memory files is a candidate; candidates are ranked by how central
+they are to the role, how recently their file changed and how well they match an optional
+query, and the bundle keeps the best-ranked sections that fit, in their original order.
+
+Token counts are cached per section content hash in `.runic/token-cache.json`, so
+repacking after a small edit only counts the sections that changed.
+"""
+
+import os
+import re
+import json
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Union
+
+# Tokenizer used unless --tokenizer or RUNIC_TOKENIZER says otherwise
+DEFAULT_TOKENIZER = 'approx'
+
+# Token cache entries kept per tokenizer; the least recently packed are dropped first
+TOKEN_CACHE_LIMIT = 50000
+
+# How fast the recency bonus of a file fades, in days
+RECENCY_HALF_LIFE_DAYS = 3.0
+
+# Base weight of each kind of section before the recency and relevance bonuses
+WEIGHTS = {
+    'role': 100.0,
+    'own-track': 80.0,
+    'core-active': 60.0,
+    'core-context': 40.0,
+    'merge-request': 35.0,
+    'framework': 30.0,
+    'track-status': 25.0,
+    'other-track': 10.0,
+    'timestamp': 5.0,
+}
+
+# Core memory files that describe the current state rather than background
+ACTIVE_CORE_FILES = ('active-context.md', 'progress.md')
+
+_WORD = re.compile(r"\w+|[^\w\s]")
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the number of tokens in text.
+
+    Counts words and punctuation marks, with long words counted as several tokens. This is
+    within a few percent of BPE tokenizers on English prose and markdown, and needs no
+    dependency.
+
+    Args:
+        text: The text to measure.
+
+    Returns:
+        The estimated token count.
+    """
+    return sum(1 + len(match) // 8 for match in _WORD.findall(text))
+
+def get_tokenizer(name: Optional[str] = None) -> Callable[[str], int]:
+    """Get a token counting function.
+
+    Args:
+        name: 'approx' for the built-in estimate, 'tiktoken' or 'tiktoken:<encoding>' for an
+            exact count with the optional tiktoken package, or 'module:function' for any
+            function taking a string and returning a token count. Defaults to the
+            RUNIC_TOKENIZER environment variable, then 'approx'.
+
+    Returns:
+        The token counting function.
+
+    Raises:
+        ValueError: If the tokenizer can't be loaded.
+    """
+    name = name or os.environ.get('RUNIC_TOKENIZER') or DEFAULT_TOKENIZER
+    if name == 'approx':
+        return estimate_tokens
+    if name == 'tiktoken' or name.startswith('tiktoken:'):
+        try:
+            import tiktoken
+        except ImportError:
+            raise ValueError("The tiktoken tokenizer needs the tiktoken package (pip install tiktoken)")
+        encoding = tiktoken.get_encoding(name.partition(':')[2] or 'cl100k_base')
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+    module_name, _, function_name = name.partition(':')
+    if not function_name:
+        raise ValueError(f"Unknown tokenizer: {name}. Use 'approx', 'tiktoken' or 'module:function'")
+    try:
+        import importlib
+        return getattr(importlib.import_module(module_name), function_name)
+    except (ImportError, AttributeError) as e:
+        raise ValueError(f"Can't load tokenizer {name}: {e}")
+
+class TokenCache:
+    """Token counts of section content, keyed by tokenizer and content hash."""
+
+    def __init__(self, path: Optional[Union[str, Path]], tokenizer_name: str, count: Callable[[str], int]):
+        """Initialize the cache.
+
+        Args:
+            path: The cache file, or None to keep counts in memory only.
+            tokenizer_name: The tokenizer's name; counts of different tokenizers are kept apart.
+            count: The token counting function.
+        """
+        self.path = str(path) if path else None
+        self.tokenizer_name = tokenizer_name
+        self._count = count
+        self._counts = None
+        self._dirty = False
+
+    def _load(self) -> Dict[str, int]:
+        """Load the counts of this tokenizer on first use."""
+        if self._counts is None:
+            self._data = {}
+            if self.path:
+                try:
+                    with open(self.path) as f:
+                        self._data = json.load(f)
+                except (OSError, ValueError):
+                    self._data = {}
+            self._counts = self._data.setdefault(self.tokenizer_name, {})
+        return self._counts
+
+    def count(self, text: str) -> int:
+        """Count the tokens in text, reusing the count of identical earlier text.
+
+        Args:
+            text: The text to measure.
+
+        Returns:
+            The token count.
+        """
+        import hashlib
+        counts = self._load()
+        key = hashlib.sha1(text.encode('utf-8')).hexdigest()
+        tokens = counts.pop(key, None)
+        if tokens is None:
+            tokens = self._count(text)
+            self._dirty = True
+        # Re-inserting keeps the dict ordered from least to most recently used
+        counts[key] = tokens
+        return tokens
+
+    def save(self) -> None:
+        """Write the cache if new counts were added, dropping the least recently used."""
+        if not self._dirty or not self.path:
+            return
+        counts = self._load()
+        for key in list(counts)[:max(0, len(counts) - TOKEN_CACHE_LIMIT)]:
+            del counts[key]
+        from runic.locking import atomic_write
+        try:
+            atomic_write(self.path, json.dumps(self._data).encode('utf-8'))
+            self._dirty = False
+        except OSError:
+            # The cache only saves time, so a read-only checkout still packs
+            pass
+
+class PackItem(NamedTuple):
+    """A section that can go into a context bundle."""
+    path: str
+    heading: str
+    text: str
+    order: int
+    kind: str
+    score: float
+    tokens: int
+
+class PackResult(NamedTuple):
+    """A context bundle and what went into it."""
+    text: str
+    tokens: int
+    included: List[PackItem]
+    dropped: List[PackItem]
+
+class ContextPacker:
+    """Builds token-budgeted context bundles from the framework and memory files."""
+
+    def __init__(self, memory_manager=None, tokenizer: Optional[str] = None):
+        """Initialize the packer.
+
+        Args:
+            memory_manager: The MemoryManager whose files are packed. If None, a new one is created.
+            tokenizer: The tokenizer name (see get_tokenizer).
+        """
+        if memory_manager is None:
+            from runic.memory import MemoryManager
+            memory_manager = MemoryManager()
+        self.memory_manager = memory_manager
+        self.base_dir = memory_manager.base_dir
+        name = tokenizer or os.environ.get('RUNIC_TOKENIZER') or DEFAULT_TOKENIZER
+        self._titles = {}
+        self.cache = TokenCache(self.base_dir / 'token-cache.json' if self.base_dir.is_dir() else None,
+                                name, get_tokenizer(name))
+
+    def _sources(self, role: str, track: Optional[str]) -> List[tuple]:
+        """List the files to pack as (path, kind) pairs, in bundle order."""
+        manager = self.memory_manager
+        sources = []
+        role_file = self.base_dir / f"{role}.md"
+        if role_file.exists():
+            sources.append((role_file, 'role'))
+        framework_dir = self.base_dir / 'core'
+        if framework_dir.is_dir():
+            sources.extend((path, 'framework') for path in sorted(framework_dir.glob('*.md')))
+
+        for path in manager.get_core_memory_files():
+            sources.append((path, 'core-active' if path.name in ACTIVE_CORE_FILES else 'core-context'))
+
+        own_dir = manager._get_track_dir_name(track) if track else None
+        for entry in sorted(manager.scan_tracks(), key=lambda entry: (entry.dir_name != own_dir, entry.dir_name)):
+            for path in entry.memory_files():
+                sources.append((Path(path), 'own-track' if entry.dir_name == own_dir else 'other-track'))
+
+        if role == 'orchestrator':
+            requests_dir = manager.memory_dir / 'merge-requests'
+            if requests_dir.is_dir():
+                sources.extend((path, 'merge-request') for path in sorted(requests_dir.glob('*.md')))
+        return sources
+
+    def candidates(self, role: str, track: Optional[str] = None, query: Optional[str] = None) -> List[PackItem]:
+        """Split the role's files into scored sections.
+
+        Args:
+            role: 'orchestrator' or 'specialist'.
+            track: The specialist's track.
+            query: Text whose words make matching sections more relevant.
+
+        Returns:
+            Every candidate section, in bundle order.
+        """
+        from runic.sections import parse_sections
+        terms = {word.lower() for word in re.findall(r"\w{3,}", query or '')}
+        if track:
+            terms.add(track.lower())
+        now = time.time()
+
+        self._titles = {}
+        items = []
+        for path, kind in self._sources(role, track):
+            try:
+                data = path.read_bytes()
+                age_days = max(0.0, now - path.stat().st_mtime) / 86400.0
+            except OSError:
+                continue
+            recency = 20.0 * 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+            sections = parse_sections(data)
+            spans = [(section.heading, section.start, section.end) for section in sections]
+            if not sections or sections[0].start > 0:
+                spans.insert(0, ('', 0, sections[0].start if sections else len(data)))
+
+            for section in sections:
+                if section.level == 1 and not data[section.body_start:section.end].strip():
+                    # A bare title travels with the file header instead of competing for the budget
+                    self._titles[str(path)] = data[section.start:section.body_start].decode('utf-8', errors='replace').strip()
+                    spans.remove((section.heading, section.start, section.end))
+
+            for heading, start, end in spans:
+                text = data[start:end].decode('utf-8', errors='replace').strip()
+                if not text:
+                    continue
+                section_kind = kind
+                if heading == 'Last Updated':
+                    section_kind = 'timestamp'
+                elif kind == 'other-track' and heading.startswith('Overall Status'):
+                    section_kind = 'track-status'
+                score = WEIGHTS[section_kind] + (recency if section_kind not in ('role', 'timestamp') else 0.0)
+                if terms:
+                    words = {word.lower() for word in re.findall(r"\w{3,}", text)}
+                    score += 30.0 * len(terms & words) / len(terms)
+                items.append(PackItem(str(path), heading, text, len(items), section_kind, score,
+                                      self.cache.count(text)))
+        return items
+
+    def pack(self, role: str, budget: int, track: Optional[str] = None, query: Optional[str] = None) -> PackResult:
+        """Build the context bundle for a role under a token budget.
+
+        Sections are taken from the highest score down, skipping any that no longer fit,
+        and written out in their original order under one header per file.
+
+        Args:
+            role: 'orchestrator' or 'specialist'.
+            budget: The maximum number of tokens in the bundle.
+            track: The specialist's track.
+            query: Text whose words make matching sections more relevant.
+
+        Returns:
+            The bundle.
+        """
+        items = self.candidates(role, track, query)
+        headers = {}
+        for item in items:
+            if item.path not in headers:
+                headers[item.path] = self.cache.count(self._file_header(item.path))
+
+        used = 0
+        chosen = set()
+        files_started = set()
+        for item in sorted(items, key=lambda item: (-item.score, item.order)):
+            cost = item.tokens + (0 if item.path in files_started else headers[item.path])
+            if used + cost > budget:
+                continue
+            used += cost
+            chosen.add(item.order)
+            files_started.add(item.path)
+        self.cache.save()
+
+        included = [item for item in items if item.order in chosen]
+        dropped = [item for item in items if item.order not in chosen]
+        parts = []
+        current = None
+        for item in included:
+            if item.path != current:
+                parts.append(self._file_header(item.path))
+                current = item.path
+            parts.append(item.text)
+        return PackResult('\n\n'.join(parts) + ('\n' if parts else ''), used, included, dropped)
+
+    def _file_header(self, path: str) -> str:
+        """Get the line that introduces a file's sections in the bundle."""
+        title = self._titles.get(path)
+        try:
+            path = os.path.relpath(path)
+        except ValueError:
+            pass
+        return f"<!-- {path} -->" + (f"\n{title}" if title else "")
@@ -0,0 +1,411 @@
+"""
+Search module for Runic.
+
+This module provides `runic mem search`, a BM25 full-text search over everything under
+`.runic/memory`: core files, tracks, merge requests and archives. Files are split into
+section chunks, and the index in `.runic/search/` maps every term to the chunks that
+contain it.
+
+The index is a set of immutable segments. Each segment is a postings file, holding
+(chunk id, term frequency) pairs as packed 32-bit integers that queries read through
+mmap, and a term dictionary giving each term's offset and length in that file. An update
+only tokenizes the sections whose text changed and writes their postings as a new
+segment. Postings of removed or changed sections stay behind until the segments are
+merged, and are skipped at query time because their chunk ids no longer exist.
+"""
+
+import os
+import re
+import json
+import math
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+
+# Bump this whenever the layout of the manifest or the segment files changes
+SEARCH_INDEX_VERSION = 1
+
+# BM25 parameters: term frequency saturation and document length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Segments are merged into one when there are more than this many
+MAX_SEGMENTS = 8
+
+# Sections longer than this many characters are split into several chunks
+CHUNK_CHARS = 1500
+
+# Lines of context shown around the best matching line of a result
+SNIPPET_LINES = 1
+
+_TERM = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lowercase search terms.
+
+    Args:
+        text: The text to tokenize.
+
+    Returns:
+        The terms in order, with repeats.
+    """
+    return _TERM.findall(text.lower())
+
+def chunk_kind(rel_path: str) -> str:
+    """Get the kind of memory a file holds: 'core', 'track', 'merge-request' or 'archive'."""
+    top = rel_path.replace(os.sep, '/').split('/', 1)[0]
+    return {'tracks': 'track', 'merge-requests': 'merge-request', 'archive': 'archive'}.get(top, 'core')
+
+def chunk_track(rel_path: str) -> Optional[str]:
+    """Get the track directory a memory file belongs to, if any."""
+    parts = rel_path.replace(os.sep, '/').split('/')
+    return parts[1] if len(parts) > 2 and parts[0] == 'tracks' else None
+
+class SearchHit(NamedTuple):
+    """A section found by a search, with the lines that best match the query."""
+    score: float
+    file: str
+    heading: str
+    line: int
+    end_line: int
+    snippet: str
+
+class SearchIndex:
+    """A segmented on-disk inverted index over the chunks of the memory files."""
+
+    def __init__(self, base_dir='.runic'):
+        """Initialize the index.
+
+        Args:
+            base_dir: The base directory for Runic files.
+        """
+        self.base_dir = Path(base_dir)
+        self.memory_dir = self.base_dir / 'memory'
+        self.index_dir = self.base_dir / 'search'
+        self.manifest_path = self.index_dir / 'manifest.json'
+        self._manifest = None
+        self._manifest_mtime = None
+        self._segments = {}
+        self._stale_files: List[Path] = []
+
+    def _refresh(self) -> None:
+        """Drop the loaded manifest if another process wrote a new one since it was loaded."""
+        try:
+            mtime = self.manifest_path.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        if self._manifest is not None and mtime != self._manifest_mtime:
+            self._manifest = None
+            self._close_segments()
+
+    def _load(self) -> Dict[str, Any]:
+        """Load the manifest on first use."""
+        if self._manifest is None:
+            try:
+                self._manifest_mtime = self.manifest_path.stat().st_mtime_ns
+            except OSError:
+                self._manifest_mtime = None
+            manifest = None
+            try:
+                manifest = json.loads(self.manifest_path.read_text())
+                if manifest.get('version') != SEARCH_INDEX_VERSION:
+                    manifest = None
+            except (OSError, ValueError, AttributeError):
+                # A missing or corrupt manifest means a full rebuild
+                pass
+            if manifest is None:
+                self._stale_files = sorted(self.index_dir.glob('seg-*'))
+                manifest = {'version': SEARCH_INDEX_VERSION, 'next_id': 0, 'next_segment': 0,
+                            'segments': [], 'files': {}, 'chunks': {}, 'total_length': 0}
+                manifest['next_segment'] = max((int(path.name.split('-')[1].split('.')[0])
+                                                for path in self._stale_files), default=-1) + 1
+            self._manifest = manifest
+        return self._manifest
+
+    def update(self) -> Dict[str, int]:
+        """Bring the index up to date with the memory files.
+
+        Returns:
+            The number of files re-read, sections indexed, sections removed and sections in the index.
+        """
+        self._refresh()
+        try:
+            return self._update()
+        except BaseException:
+            # The manifest may be half updated; the next call reloads it from disk
+            self._manifest = None
+            self._close_segments()
+            raise
+
+    def _update(self) -> Dict[str, int]:
+        """Update the loaded manifest and write a segment for new sections; see update()."""
+        from runic.index import stat_markdown_files
+        from runic.sections import split_chunks
+        import hashlib
+        manifest = self._load()
+        indexed, chunks = manifest['files'], manifest['chunks']
+        current = stat_markdown_files(self.memory_dir)
+        removed = []
+        postings: Dict[str, List[int]] = {}
+        added = 0
+        files_read = 0
+
+        for rel in sorted(set(indexed) - set(current)):
+            removed.extend(indexed.pop(rel)['chunks'])
+
+        for rel, stat_result in sorted(current.items()):
+            entry = indexed.get(rel)
+            if entry and entry['mtime_ns'] == stat_result.st_mtime_ns and entry['size'] == stat_result.st_size:
+                continue
+            try:
+                data = (self.memory_dir / rel).read_bytes()
+            except OSError:
+                continue
+            files_read += 1
+            old_ids: Dict[str, List[str]] = {}
+            for chunk_id in (entry or {}).get('chunks', []):
+                old_ids.setdefault(chunks[chunk_id]['hash'], []).append(chunk_id)
+
+            ids = []
+            for chunk in split_chunks(data, CHUNK_CHARS):
+                digest = hashlib.sha1(chunk.text.encode('utf-8')).hexdigest()
+                lines = chunk.text.count('\n') + 1
+                reusable = old_ids.get(digest)
+                if reusable:
+                    # An unchanged section keeps its postings, even if it moved within the file
+                    chunk_id = reusable.pop()
+                    chunks[chunk_id].update(line=chunk.line, lines=lines, heading=chunk.heading)
+                    ids.append(chunk_id)
+                    continue
+                chunk_id = str(manifest['next_id'])
+                manifest['next_id'] += 1
+                counts: Dict[str, int] = {}
+                terms = tokenize(chunk.text)
+                for term in terms:
+                    counts[term] = counts.get(term, 0) + 1
+                for term, count in counts.items():
+                    postings.setdefault(term, []).extend((int(chunk_id), count))
+                chunks[chunk_id] = {'file': rel, 'heading': chunk.heading, 'line': chunk.line, 'lines': lines,
+                                    'length': len(terms), 'hash': digest}
+                manifest['total_length'] += len(terms)
+                ids.append(chunk_id)
+                added += 1
+            for leftovers in old_ids.values():
+                removed.extend(leftovers)
+            indexed[rel] = {'mtime_ns': stat_result.st_mtime_ns, 'size': stat_result.st_size, 'chunks': ids}
+
+        for chunk_id in removed:
+            manifest['total_length'] -= chunks.pop(chunk_id)['length']
+            # The postings stay in their segment until it is merged; they are skipped meanwhile
+            manifest['dead'] = manifest.get('dead', 0) + 1
+
+        if postings:
+            self._write_segment(postings)
+        if postings or removed or files_read:
+            if len(manifest['segments']) > MAX_SEGMENTS or manifest.get('dead', 0) > max(1000, len(chunks)):
+                self._merge_segments()
+            self._save()
+        return {'files': files_read, 'indexed': added, 'removed': len(removed), 'sections': len(chunks)}
+
+    def _write_segment(self, postings: Dict[str, List[int]]) -> None:
+        """Write postings as a new segment: a packed postings file and its term dictionary."""
+        manifest = self._load()
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        name = f"seg-{manifest['next_segment']}"
+        manifest['next_segment'] += 1
+        terms = {}
+        packed = array('I')
+        for term in sorted(postings):
+            terms[term] = [len(packed), len(postings[term])]
+            packed.extend(postings[term])
+        with open(self.index_dir / f"{name}.post", 'wb') as f:
+            packed.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        from runic.locking import atomic_write
+        atomic_write(self.index_dir / f"{name}.terms", json.dumps(terms, separators=(',', ':')).encode('utf-8'))
+        manifest['segments'].append(name)
+
+    def _merge_segments(self) -> None:
+        """Merge every segment into one, dropping the postings of removed sections."""
+        manifest = self._load()
+        live = manifest['chunks']
+        merged: Dict[str, List[int]] = {}
+        for name in manifest['segments']:
+            terms, postings = self._segment(name)
+            for term, (offset, length) in terms.items():
+                values = postings[offset:offset + length]
+                target = merged.setdefault(term, [])
+                for i in range(0, length, 2):
+                    if str(values[i]) in live:
+                        target.extend((values[i], values[i + 1]))
+        old = manifest['segments']
+        manifest['segments'] = []
+        self._close_segments()
+        self._write_segment({term: values for term, values in merged.items() if values})
+        manifest['dead'] = 0
+        self._stale_files.extend(self.index_dir / f"{name}.{ext}" for name in old for ext in ('post', 'terms'))
+
+    def _segment(self, name: str):
+        """Open a segment: its term dictionary and its postings as a memory-mapped integer view."""
+        if name not in self._segments:
+            import mmap
+            terms = json.loads((self.index_dir / f"{name}.terms").read_text())
+            with open(self.index_dir / f"{name}.post", 'rb') as f:
+                if os.fstat(f.fileno()).st_size:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    postings = memoryview(mapped).cast('I')
+                else:
+                    mapped, postings = None, memoryview(array('I'))
+            self._segments[name] = (terms, postings, mapped)
+        terms, postings, _ = self._segments[name]
+        return terms, postings
+
+    def _close_segments(self) -> None:
+        """Unmap every open segment."""
+        for _, postings, mapped in self._segments.values():
+            postings.release()
+            if mapped is not None:
+                mapped.close()
+        self._segments = {}
+
+    def _save(self) -> None:
+        """Write the manifest atomically, then delete the files it no longer uses."""
+        from runic.locking import atomic_write
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        atomic_write(self.manifest_path, json.dumps(self._load(), separators=(',', ':')).encode('utf-8'))
+        self._manifest_mtime = self.manifest_path.stat().st_mtime_ns
+        for path in self._stale_files:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+        self._stale_files = []
+
+    def search(self, query: str, limit: int = 10, track: Optional[str] = None, section: Optional[str] = None,
+               kind: Optional[str] = None) -> List[SearchHit]:
+        """Rank the sections matching a query with BM25.
+
+        Args:
+            query: The words to search for.
+            limit: The maximum number of results.
+            track: Only search the files of this track directory.
+            section: Only search sections whose heading contains this text (case-insensitive).
+            kind: Only search 'core', 'track', 'merge-request' or 'archive' files.
+
+        Returns:
+            The best matching sections, best first, each with a snippet of its best lines.
+        """
+        self._refresh()
+        manifest = self._load()
+        chunks = manifest['chunks']
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not chunks:
+            return []
+        section = section.lower() if section else None
+
+        def allowed(chunk: Dict) -> bool:
+            if track is not None and chunk_track(chunk['file']) != track:
+                return False
+            if kind is not None and chunk_kind(chunk['file']) != kind:
+                return False
+            return section is None or section in chunk['heading'].lower()
+
+        count = len(chunks)
+        average_length = max(1.0, manifest['total_length'] / count)
+        scores: Dict[str, float] = {}
+        filtered: Dict[str, bool] = {}
+        for term in terms:
+            matches = []
+            for name in manifest['segments']:
+                segment_terms, postings = self._segment(name)
+                location = segment_terms.get(term)
+                if location is None:
+                    continue
+                offset, length = location
+                values = postings[offset:offset + length]
+                for i in range(0, length, 2):
+                    chunk_id = str(values[i])
+                    if chunk_id in chunks:
+                        matches.append((chunk_id, values[i + 1]))
+            if not matches:
+                continue
+            # Document frequency counts every live section, so filters don't change the ranking
+            idf = math.log(1.0 + (count - len(matches) + 0.5) / (len(matches) + 0.5))
+            for chunk_id, frequency in matches:
+                ok = filtered.get(chunk_id)
+                if ok is None:
+                    ok = filtered[chunk_id] = allowed(chunks[chunk_id])
+                if not ok:
+                    continue
+                norm = BM25_K1 * (1.0 - BM25_B + BM25_B * chunks[chunk_id]['length'] / average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (BM25_K1 + 1.0) / (frequency + norm)
+
+        import heapq
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -int(item[0])))
+        return [self._hit(chunks[chunk_id], score, set(terms)) for chunk_id, score in best]
+
+    def _hit(self, chunk: Dict, score: float, terms: set) -> SearchHit:
+        """Build a result, picking the lines of the section that match the most query terms."""
+        path = self.memory_dir / chunk['file']
+        first = chunk['line']
+        try:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                lines = [line.rstrip('\n') for number, line in enumerate(f, 1)
+                         if first <= number < first + chunk['lines']]
+        except OSError:
+            lines = []
+        if not lines:
+            return SearchHit(score, str(path), chunk['heading'], first, first, '')
+
+        best, best_matches = 0, -1
+        for i, line in enumerate(lines):
+            matches = len(terms.intersection(tokenize(line)))
+            if matches > best_matches:
+                best, best_matches = i, matches
+        start = max(0, best - SNIPPET_LINES)
+        end = min(len(lines), best + SNIPPET_LINES + 1)
+        return SearchHit(score, str(path), chunk['heading'], first + start, first + end - 1,
+                         '\n'.join(lines[start:end]))
+
+    def stats(self) -> Dict[str, Any]:
+        """Describe the index: files, sections, segments and size on disk."""
+        self._refresh()
+        manifest = self._load()
+        size = 0
+        for path in self.index_dir.glob('*'):
+            try:
+                size += path.stat().st_size
+            except OSError:
+                pass
+        return {
+            'files': len(manifest['files']),
+            'sections': len(manifest['chunks']),
+            'segments': len(manifest['segments']),
+            'removed_postings': manifest.get('dead', 0),
+            'bytes': size,
+        }
+
+    def clear(self) -> None:
+        """Delete the index."""
+        import shutil
+        self._close_segments()
+        shutil.rmtree(str(self.index_dir), ignore_errors=True)
+        self._manifest = self._manifest_mtime = None
+
+# Indexes kept open between searches in a long-running process (the daemon)
+_open_indexes: Dict[str, SearchIndex] = {}
+
+def get_search_index(base_dir='.runic') -> SearchIndex:
+    """Get the search index of a Runic base directory, reusing one already open in this process.
+
+    Args:
+        base_dir: The base directory for Runic files.
+
+    Returns:
+        The index.
+    """
+    key = os.path.abspath(str(base_dir))
+    if key not in _open_indexes:
+        _open_indexes[key] = SearchIndex(base_dir)
+    return _open_indexes[key]
@@ -0,0 +1,312 @@
+"""
+Sections module for Runic.
+
+This module provides a single-pass parser for the markdown memory files.
+A memory file is read once into an ordered list of sections with byte offsets,
+so callers can read any number of sections, or patch one of them,
+without rescanning or re-joining the whole file.
+"""
+
+import re
+from pathlib import Path
+from typing import List, Dict, Optional, Union, NamedTuple, Iterator, Tuple
+
+class Section(NamedTuple):
+    """A '#' or '##' heading and the byte span of its body."""
+    heading: str
+    level: int
+    start: int
+    body_start: int
+    end: int
+
+def parse_sections(data: bytes) -> List[Section]:
+    """Parse markdown into its level-one and level-two sections in a single pass.
+
+    A section starts at a '# ' or '## ' heading line and ends where the next such
+    heading starts, or at the end of the file. Deeper headings belong to the body of
+    the enclosing section, and headings inside fenced code blocks are ignored.
+
+    Args:
+        data: The raw content of the markdown file.
+
+    Returns:
+        The sections in file order.
+    """
+    sections = []
+    heading = None
+    level = start = body_start = 0
+    in_fence = False
+    pos = 0
+    length = len(data)
+
+    while pos < length:
+        newline = data.find(b'\n', pos)
+        line_end = length if newline == -1 else newline + 1
+        line = data[pos:line_end]
+
+        if line.startswith(b'```') or line.startswith(b'~~~'):
+            in_fence = not in_fence
+        elif not in_fence and (line.startswith(b'# ') or line.startswith(b'## ')):
+            if heading is not None:
+                sections.append(Section(heading, level, start, body_start, pos))
+            level = 1 if line.startswith(b'# ') else 2
+            heading = line[level + 1:].decode('utf-8', errors='replace').strip()
+            start = pos
+            body_start = line_end
+
+        pos = line_end
+
+    if heading is not None:
+        sections.append(Section(heading, level, start, body_start, length))
+    return sections
+
+class Chunk(NamedTuple):
+    """A piece of a markdown file small enough to index on its own."""
+    heading: str
+    line: int
+    text: str
+
+def split_chunks(data: bytes, max_chars: int = 1500) -> List[Chunk]:
+    """Split markdown into chunks along its sections.
+
+    Each section becomes one chunk, including its heading line. Sections longer than
+    max_chars are split between paragraphs (or, for a single huge paragraph, between
+    lines), and every piece keeps the section heading. The text before the first
+    heading is a chunk with an empty heading.
+
+    Args:
+        data: The raw content of the markdown file.
+        max_chars: The size above which a section is split.
+
+    Returns:
+        The non-empty chunks in file order, with their 1-based starting line.
+    """
+    sections = parse_sections(data)
+    spans = [('', 0, sections[0].start if sections else len(data))]
+    spans += [(section.heading, section.start, section.end) for section in sections]
+
+    chunks = []
+    line = 1
+    position = 0
+    for heading, start, end in spans:
+        line += data.count(b'\n', position, start)
+        position = start
+        text = data[start:end].decode('utf-8', errors='replace')
+        if not text.strip():
+            continue
+        if len(text) <= max_chars:
+            chunks.append(Chunk(heading, line, text.strip()))
+            continue
+
+        piece, piece_line, offset = '', line, 0
+        for block in re.split(r'(\n\s*\n)', text) if '\n\n' in text else text.splitlines(True):
+            if piece.strip() and len(piece) + len(block) > max_chars:
+                chunks.append(Chunk(heading, piece_line, piece.strip()))
+                piece_line = line + text.count('\n', 0, offset)
+                piece = ''
+            if not piece.strip():
+                # Pieces start at their first non-blank line
+                piece_line = line + text.count('\n', 0, offset + len(block) - len(block.lstrip('\n')))
+            piece += block
+            offset += len(block)
+        if piece.strip():
+            chunks.append(Chunk(heading, piece_line, piece.strip()))
+    return chunks
+
+class MemoryDocument:
+    """A markdown memory file parsed once into its sections."""
+
+    def __init__(self, data: Union[bytes, str]):
+        """Initialize the document.
+
+        Args:
+            data: The raw content of the markdown file.
+        """
+        self.data = data.encode('utf-8') if isinstance(data, str) else data
+        self.sections = parse_sections(self.data)
+        self._by_heading = {}
+        for section in self.sections:
+            self._by_heading.setdefault(section.heading, section)
+
+    @classmethod
+    def read(cls, file_path: Union[str, Path]) -> 'MemoryDocument':
+        """Read and parse a memory file.
+
+        Args:
+            file_path: The path to the memory file.
+
+        Returns:
+            The parsed document.
+        """
+        return cls(Path(file_path).read_bytes())
+
+    @property
+    def text(self) -> str:
+        """The full content of the document as text."""
+        return self.data.decode('utf-8', errors='replace')
+
+    def find(self, heading: str) -> Optional[Section]:
+        """Find the first section with the given heading.
+
+        Args:
+            heading: The heading text, without the leading '#' characters.
+
+        Returns:
+            The section, or None if the document has no such heading.
+        """
+        return self._by_heading.get(heading)
+
+    def get(self, heading: str) -> Optional[str]:
+        """Get the body of a section, stripped of surrounding whitespace.
+
+        Args:
+            heading: The heading text, without the leading '#' characters.
+
+        Returns:
+            The section body, or None if the document has no such heading.
+        """
+        section = self.find(heading)
+        if section is None:
+            return None
+        return self.data[section.body_start:section.end].decode('utf-8', errors='replace').strip()
+
+    def first_line(self, heading: str) -> Optional[str]:
+        """Get the first non-empty line of a section.
+
+        Args:
+            heading: The heading text, without the leading '#' characters.
+
+        Returns:
+            The stripped line, or None if the section is missing or empty.
+        """
+        body = self.get(heading)
+        if not body:
+            return None
+        return body.split('\n', 1)[0].strip()
+
+    def bullets(self, heading: str) -> Optional[List[str]]:
+        """Get the '-' bullet lines of a section.
+
+        Args:
+            heading: The heading text, without the leading '#' characters.
+
+        Returns:
+            The stripped bullet lines, or None if the document has no such heading.
+        """
+        body = self.get(heading)
+        if body is None:
+            return None
+        return [line.strip() for line in body.split('\n') if line.strip().startswith('-')]
+
+    def items(self, level: Optional[int] = 2) -> Iterator[Tuple[str, str]]:
+        """Iterate over (heading, body) pairs in file order.
+
+        Args:
+            level: Only yield sections of this heading level. If None, yield all sections.
+
+        Yields:
+            The heading and stripped body of each section.
+        """
+        for section in self.sections:
+            if level is None or section.level == level:
+                body = self.data[section.body_start:section.end].decode('utf-8', errors='replace')
+                yield section.heading, body.strip()
+
+    def to_dict(self) -> Dict[str, str]:
+        """Map each level-two heading to its body, keeping the first of any duplicates."""
+        result = {}
+        for heading, body in self.items():
+            result.setdefault(heading, body)
+        return result
+
+    def replace(self, heading: str, body: str) -> 'MemoryDocument':
+        """Replace the body of a section, patching only that byte span.
+
+        Blank lines that separated the old body from the next heading are kept.
+
+        Args:
+            heading: The heading text, without the leading '#' characters.
+            body: The new section body.
+
+        Returns:
+            A new document with the section replaced.
+
+        Raises:
+            KeyError: If the document has no such heading.
+        """
+        section = self.find(heading)
+        if section is None:
+            raise KeyError(heading)
+
+        old_body = self.data[section.body_start:section.end]
+        trailing = old_body[len(old_body.rstrip()):]
+        if b'\n' not in trailing:
+            trailing = b'\n'
+        new_body = body.rstrip().encode('utf-8') + trailing
+        if not body.strip():
+            new_body = trailing
+        if not self.data.endswith(b'\n') and section.body_start == len(self.data):
+            # The heading is the last line and has no newline of its own
+            return MemoryDocument(self.data + b'\n' + new_body)
+
+        return self._patched(section.body_start, section.end, new_body)
+
+    def append(self, heading: str, body: str) -> 'MemoryDocument':
+        """Append a new level-two section at the end of the document.
+
+        Args:
+            heading: The heading text, without the leading '#' characters.
+            body: The body of the new section.
+
+        Returns:
+            A new document with the section appended.
+        """
+        content = self.data.rstrip()
+        separator = b'\n\n' if content else b''
+        tail = separator + f"## {heading}\n{body.rstrip()}\n".encode('utf-8')
+        return self._patched(len(content), len(self.data), tail)
+
+    def set(self, heading: str, body: str) -> 'MemoryDocument':
+        """Replace the body of a section, or append the section if it is missing.
+
+        Args:
+            heading: The heading text, without the leading '#' characters.
+            body: The new section body.
+
+        Returns:
+            A new document with the section set.
+        """
+        if self.find(heading) is None:
+            return self.append(heading, body)
+        return self.replace(heading, body)
+
+    def _patched(self, start: int, end: int, replacement: bytes) -> 'MemoryDocument':
+        """Build a new document with data[start:end] replaced, shifting later offsets."""
+        data = self.data[:start] + replacement + self.data[end:]
+        delta = len(replacement) - (end - start)
+
+        # Patches always start on a line boundary and only the patched span can
+        # contain new headings, so splice its sections in instead of re-parsing
+        before = [s for s in self.sections if s.start < start]
+        after = [
+            s._replace(start=s.start + delta, body_start=s.body_start + delta, end=s.end + delta)
+            for s in self.sections if s.start >= end
+        ]
+        middle = [
+            s._replace(start=s.start + start, body_start=s.body_start + start, end=s.end + start)
+            for s in parse_sections(replacement)
+        ]
+
+        sections = before + middle + after
+        for i, section in enumerate(sections):
+            next_start = sections[i + 1].start if i + 1 < len(sections) else len(data)
+            if section.end != next_start:
+                sections[i] = section._replace(end=next_start)
+
+        document = MemoryDocument.__new__(MemoryDocument)
+        document.data = data
+        document.sections = sections
+        document._by_heading = {}
+        for section in sections:
+            document._by_heading.setdefault(section.heading, section)
+        return document
@@ -0,0 +1,388 @@
+"""
+Snapshot module for Runic.
+
+This module keeps backups of the `.runic` directory as content-addressed snapshots in
+`.runic/snapshots/`. File contents are stored once per hash in `objects/`, so a snapshot
+writes only the files that changed since any earlier one, and the snapshot itself is a small
+JSON manifest of paths, hashes and symlink targets. Files whose size and mtime are unchanged
+since the last snapshot aren't read again. Large files are cloned with a reflink where the
+filesystem supports it (btrfs, XFS), which shares their blocks until either copy changes.
+
+`runic migrate` and `runic update --force` take a snapshot before they change anything, and
+`runic snapshot list/restore/prune` manage them. Automatic snapshots are pruned by a
+retention policy; labeled snapshots are kept until removed explicitly.
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from runic.locking import file_lock
+
+# Entries of .runic that are never snapshotted: the store itself, locks, sockets, and
+# caches and indexes that are rebuilt from the memory files
+EXCLUDED_ENTRIES = ('snapshots', 'locks', 'runic.sock', 'index.json', 'token-cache.json', 'watch-state.json',
+                    'search', 'vectors', 'build')
+
+# Files larger than this are cloned into the store instead of read into memory
+CLONE_MIN_SIZE = 1 << 20
+
+# Automatic snapshots kept by the default retention policy: the newest ones, then the
+# newest of each day and of each week
+DEFAULT_KEEP_LAST = 10
+DEFAULT_KEEP_DAILY = 7
+DEFAULT_KEEP_WEEKLY = 4
+
+# Linux ioctl that makes a file share another file's blocks (a reflink)
+_FICLONE = 0x40049409
+
+class SnapshotInfo(NamedTuple):
+    """A snapshot, as listed by SnapshotStore.list."""
+    id: str
+    time: str
+    reason: str
+    label: Optional[str]
+    files: int
+    size: int
+    new_bytes: int
+
+class SnapshotStore:
+    """The content-addressed snapshots of a .runic directory."""
+
+    def __init__(self, base_dir: str = '.runic'):
+        """Initialize the store.
+
+        Args:
+            base_dir: The .runic directory that is snapshotted.
+        """
+        self.base_dir = Path(base_dir)
+        self.store_dir = self.base_dir / 'snapshots'
+        self.objects_dir = self.store_dir / 'objects'
+        self.cache_path = self.store_dir / 'stat-cache.json'
+        self._reflink = True
+
+    def _object_path(self, sha: str) -> Path:
+        """Get where the blob of a hash is stored."""
+        return self.objects_dir / sha[:2] / sha[2:]
+
+    def _walk(self, paths: Optional[Iterable[str]] = None) -> Iterable[Tuple[str, os.DirEntry]]:
+        """Yield the snapshotted entries of .runic (or of some of its subdirectories), relative paths first."""
+        stack = list(paths) if paths else ['']
+        while stack:
+            rel_dir = stack.pop()
+            try:
+                entries = list(os.scandir(self.base_dir / rel_dir))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                if entry.name.startswith('.') or (not rel_dir and entry.name in EXCLUDED_ENTRIES):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(rel)
+                else:
+                    yield rel, entry
+
+    def _clone(self, src: str, dst: str) -> None:
+        """Copy a file, sharing its blocks with a reflink when the filesystem allows."""
+        if self._reflink:
+            try:
+                import fcntl
+                with open(src, 'rb') as source, open(dst, 'wb') as target:
+                    fcntl.ioctl(target.fileno(), _FICLONE, source.fileno())
+                return
+            except (ImportError, OSError):
+                # Not Linux, or a filesystem without reflinks: don't try again
+                self._reflink = False
+        shutil.copyfile(src, dst)
+
+    def _store(self, path: str, size: int) -> Tuple[str, int]:
+        """Add a file's content to the objects, unless a blob with its hash exists.
+
+        Returns:
+            The content hash and the number of bytes written to the store.
+        """
+        temp = self.objects_dir / f"tmp-{os.getpid()}"
+        if size < CLONE_MIN_SIZE:
+            with open(path, 'rb') as f:
+                data = f.read()
+            sha = hashlib.sha256(data).hexdigest()
+            if self._object_path(sha).exists():
+                return sha, 0
+            temp.write_bytes(data)
+        else:
+            # The clone is hashed rather than the file, so the blob matches its hash even
+            # if the file changes meanwhile
+            self._clone(path, str(temp))
+            digest = hashlib.sha256()
+            with open(temp, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+            sha = digest.hexdigest()
+            if self._object_path(sha).exists():
+                os.unlink(temp)
+                return sha, 0
+        target = self._object_path(sha)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.chmod(temp, 0o444)
+        os.replace(temp, target)
+        return sha, os.path.getsize(target)
+
+    def _load_cache(self) -> Dict[str, List]:
+        """Read the stat cache: path -> [size, mtime_ns, inode, sha]."""
+        try:
+            with open(self.cache_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def create(self, reason: str = 'manual', label: Optional[str] = None,
+               paths: Optional[Iterable[str]] = None, prune: bool = True) -> SnapshotInfo:
+        """Take a snapshot.
+
+        Args:
+            reason: Why the snapshot was taken ('manual', 'migrate', 'update', 'restore').
+            label: A name for the snapshot; labeled snapshots are never pruned by retention.
+            paths: Only snapshot these subdirectories of .runic (e.g. ['memory']).
+            prune: Apply the default retention policy to automatic snapshots afterwards.
+
+        Returns:
+            The new snapshot.
+        """
+        from runic.locking import atomic_write
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        with file_lock(str(self.store_dir / 'store')):
+            cache = self._load_cache()
+            new_cache = {}
+            entries = {}
+            size = 0
+            new_bytes = 0
+            for rel, entry in self._walk(paths):
+                if entry.is_symlink():
+                    entries[rel] = {'link': os.readlink(entry.path)}
+                    continue
+                if not entry.is_file():
+                    continue
+                stat_result = entry.stat()
+                key = [stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino]
+                cached = cache.get(rel)
+                if cached and cached[:3] == key and self._object_path(cached[3]).exists():
+                    sha = cached[3]
+                else:
+                    sha, written = self._store(entry.path, stat_result.st_size)
+                    new_bytes += written
+                new_cache[rel] = key + [sha]
+                entries[rel] = {'sha': sha, 'size': stat_result.st_size, 'mode': stat_result.st_mode & 0o777}
+                size += stat_result.st_size
+
+            now = datetime.datetime.now()
+            digest = hashlib.sha1(json.dumps(entries, sort_keys=True).encode('utf-8')).hexdigest()
+            snapshot_id = f"{now.strftime('%Y%m%d-%H%M%S')}-{digest[:6]}"
+            suffix = 1
+            while (self.store_dir / f"{snapshot_id}.json").exists():
+                # The same content snapshotted again within a second
+                snapshot_id = f"{now.strftime('%Y%m%d-%H%M%S')}-{digest[:6]}-{suffix}"
+                suffix += 1
+            manifest = {'id': snapshot_id, 'time': now.strftime('%Y-%m-%d %H:%M:%S'), 'reason': reason,
+                        'label': label, 'paths': sorted(paths) if paths else None, 'size': size,
+                        'new_bytes': new_bytes, 'entries': entries}
+            atomic_write(self.store_dir / f"{snapshot_id}.json", json.dumps(manifest).encode('utf-8'))
+            if paths:
+                # Keep the cache entries of the parts that weren't walked
+                new_cache = dict(cache, **new_cache)
+            atomic_write(self.cache_path, json.dumps(new_cache).encode('utf-8'))
+
+        if prune:
+            self.prune()
+        return SnapshotInfo(snapshot_id, manifest['time'], reason, label, len(entries), size, new_bytes)
+
+    def _manifests(self) -> List[Path]:
+        """List the snapshot manifests, oldest first."""
+        try:
+            paths = [path for path in self.store_dir.glob('*.json') if path.name != self.cache_path.name]
+            # Ids start with the time to the second; snapshots taken within one are ordered by mtime
+            return sorted(paths, key=lambda path: (path.name[:15], path.stat().st_mtime_ns))
+        except FileNotFoundError:
+            return []
+
+    def resolve(self, snapshot_id: str) -> str:
+        """Find the snapshot an id refers to: the snapshot with that id, or else the only one it is a prefix of.
+
+        Raises:
+            KeyError: If no snapshot, or more than one, matches.
+        """
+        ids = [path.stem for path in self._manifests()]
+        if snapshot_id in ids:
+            return snapshot_id
+        matches = [existing for existing in ids if snapshot_id and existing.startswith(snapshot_id)]
+        if len(matches) != 1:
+            raise KeyError(snapshot_id)
+        return matches[0]
+
+    def load(self, snapshot_id: str) -> Dict:
+        """Read a snapshot's manifest; a unique prefix of its id is enough.
+
+        Raises:
+            KeyError: If no snapshot, or more than one, matches.
+        """
+        with open(self.store_dir / f"{self.resolve(snapshot_id)}.json", encoding='utf-8') as f:
+            return json.load(f)
+
+    def list(self) -> List[SnapshotInfo]:
+        """List the snapshots, oldest first."""
+        snapshots = []
+        for path in self._manifests():
+            try:
+                with open(path, encoding='utf-8') as f:
+                    manifest = json.load(f)
+            except ValueError:
+                continue
+            snapshots.append(SnapshotInfo(manifest['id'], manifest['time'], manifest['reason'], manifest.get('label'),
+                                          len(manifest['entries']), manifest['size'], manifest['new_bytes']))
+        return snapshots
+
+    def restore(self, snapshot_id: str, paths: Optional[Iterable[str]] = None, dry_run: bool = False) -> List[Tuple[str, str]]:
+        """Bring the files of a snapshot back into .runic.
+
+        Files that differ from the snapshot are rewritten and missing ones recreated; files
+        created since the snapshot are left alone. Unless dry_run is set, a snapshot of the
+        current state is taken first, so a restore can itself be undone.
+
+        Args:
+            snapshot_id: The snapshot, or a unique prefix of its id.
+            paths: Only restore these files or directories (relative to .runic).
+            dry_run: Only report what would be restored.
+
+        Returns:
+            (path, 'restored', 'relinked' or 'conflict') for each file that was (or would be)
+            changed; 'conflict' means another writer changed the same sections meanwhile.
+
+        Raises:
+            KeyError: If the snapshot doesn't exist.
+        """
+        from runic.locking import WriteConflict, write_file
+        manifest = self.load(snapshot_id)
+        prefixes = [path.strip('/') for path in paths] if paths else None
+        cache = self._load_cache()
+        changes = []
+        for rel, item in sorted(manifest['entries'].items()):
+            if prefixes and not any(rel == prefix or rel.startswith(prefix + '/') for prefix in prefixes):
+                continue
+            dst = self.base_dir / rel
+            if 'link' in item:
+                if not (os.path.islink(dst) and os.readlink(dst) == item['link']):
+                    changes.append((rel, 'relinked', item, None))
+                continue
+            current = None
+            if not os.path.islink(dst) and dst.is_file():
+                stat_result = dst.stat()
+                cached = cache.get(rel)
+                if cached and cached[:3] == [stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino]:
+                    if cached[3] == item['sha']:
+                        continue
+                if item['size'] < CLONE_MIN_SIZE:
+                    # Kept as the base the restored content replaces, see below
+                    current = dst.read_bytes()
+                    if hashlib.sha256(current).hexdigest() == item['sha']:
+                        continue
+            changes.append((rel, 'restored', item, current))
+
+        if dry_run or not changes:
+            return [(rel, action) for rel, action, _, _ in changes]
+
+        self.create('restore', prune=False)
+        results = []
+        for rel, action, item, current in changes:
+            dst = self.base_dir / rel
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            if action == 'relinked':
+                temp = dst.with_name(f".{dst.name}.restore-{os.getpid()}")
+                if os.path.lexists(temp):
+                    os.unlink(temp)
+                os.symlink(item['link'], temp)
+                os.replace(temp, dst)
+            else:
+                if os.path.islink(dst):
+                    os.unlink(dst)
+                blob = self._object_path(item['sha'])
+                if item['size'] >= CLONE_MIN_SIZE:
+                    temp = dst.with_name(f".{dst.name}.restore-{os.getpid()}")
+                    self._clone(str(blob), str(temp))
+                    os.replace(temp, dst)
+                else:
+                    # An agent may edit a memory file while it is restored: edits to other
+                    # sections are merged in, and a file changed in the same sections is skipped
+                    try:
+                        write_file(str(dst), blob.read_bytes(), current)
+                    except WriteConflict:
+                        results.append((rel, 'conflict'))
+                        continue
+                os.chmod(dst, item.get('mode', 0o644))
+            results.append((rel, action))
+        return results
+
+    def select_prunable(self, keep_last: int = DEFAULT_KEEP_LAST, keep_daily: int = DEFAULT_KEEP_DAILY,
+                        keep_weekly: int = DEFAULT_KEEP_WEEKLY, older_than_days: Optional[float] = None) -> List[SnapshotInfo]:
+        """Pick the snapshots a retention policy removes.
+
+        The newest keep_last snapshots are kept, then the newest snapshot of each of the last
+        keep_daily days and keep_weekly weeks that have one. Labeled snapshots are always kept.
+        With older_than_days, only snapshots older than that are removed.
+        """
+        snapshots = self.list()
+        kept = set()
+        unlabeled = [snapshot for snapshot in reversed(snapshots) if not snapshot.label]
+        kept.update(snapshot.id for snapshot in unlabeled[:keep_last])
+        for count, period in ((keep_daily, lambda t: t.date()), (keep_weekly, lambda t: t.isocalendar()[:2])):
+            seen = set()
+            for snapshot in unlabeled:
+                key = period(datetime.datetime.strptime(snapshot.time, '%Y-%m-%d %H:%M:%S'))
+                if key not in seen and len(seen) < count:
+                    seen.add(key)
+                    kept.add(snapshot.id)
+        cutoff = None
+        if older_than_days is not None:
+            cutoff = datetime.datetime.now() - datetime.timedelta(days=older_than_days)
+        return [snapshot for snapshot in unlabeled if snapshot.id not in kept and
+                (cutoff is None or datetime.datetime.strptime(snapshot.time, '%Y-%m-%d %H:%M:%S') < cutoff)]
+
+    def prune(self, keep_last: int = DEFAULT_KEEP_LAST, keep_daily: int = DEFAULT_KEEP_DAILY,
+              keep_weekly: int = DEFAULT_KEEP_WEEKLY, older_than_days: Optional[float] = None,
+              remove: Iterable[str] = (), dry_run: bool = False) -> Tuple[List[SnapshotInfo], int]:
+        """Remove the snapshots a retention policy (or remove) selects, then the blobs nothing uses.
+
+        Args:
+            keep_last, keep_daily, keep_weekly, older_than_days: The retention policy, see select_prunable.
+            remove: Snapshots to remove as well, labeled or not; each must name exactly one
+                snapshot (see resolve).
+            dry_run: Only report what would be removed.
+
+        Returns:
+            The removed snapshots and the number of bytes freed.
+
+        Raises:
+            KeyError: If one of remove matches no snapshot or several; nothing is removed then.
+        """
+        with file_lock(str(self.store_dir / 'store')):
+            removed_ids = {self.resolve(ref) for ref in remove}
+            doomed = self.select_prunable(keep_last, keep_daily, keep_weekly, older_than_days)
+            doomed += [snapshot for snapshot in self.list() if snapshot.id in removed_ids and snapshot not in doomed]
+            if dry_run or not doomed:
+                return doomed, 0
+
+            for snapshot in doomed:
+                os.unlink(self.store_dir / f"{snapshot.id}.json")
+
+            referenced = set()
+            for path in self._manifests():
+                with open(path, encoding='utf-8') as f:
+                    referenced.update(item['sha'] for item in json.load(f)['entries'].values() if 'sha' in item)
+            freed = 0
+            for blob in self.objects_dir.glob('*/*'):
+                if blob.parent.name + blob.name not in referenced:
+                    freed += blob.stat().st_size
+                    blob.unlink()
+            return doomed, freed
@@ -0,0 +1,285 @@
+"""
+Sync module for Runic.
+
+This module links a project's `.runic` directory to the core files of the installed
+package; `runic init`, `update` and `migrate` all run it. The package's core files are
+described by a manifest (path, content hash, link target), from which a plan of the minimal
+operations is computed: create missing links, relink links that point elsewhere, replace
+copies with links, remove links to files the package no longer has, and copy memory
+templates that don't exist yet. Everything already in place is skipped.
+
+The manifest applied last is recorded in `.runic/sync-state.json` together with a stat
+signature of the package's core files. While the signature matches, a sync is a no-op that
+reads that file and stats the package's few core files without looking at the checkout, so
+refreshing many checkouts after a package upgrade only does work where something changed.
+"""
+
+import os
+import json
+import hashlib
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# The sync state of a checkout, relative to its .runic directory
+STATE_FILE = 'sync-state.json'
+
+# Package directory holding the templates of the memory files
+TEMPLATES_DIR = 'memory.templates'
+
+# Bumped when the state file format changes, which makes the next sync a full one
+STATE_VERSION = 1
+
+class ManifestEntry(NamedTuple):
+    """A core file of the package."""
+    path: str    # relative to .runic ('core/rules.md', or 'memory/progress.md' for templates)
+    kind: str    # 'link' or 'template'
+    target: str  # the absolute path of the package file
+    sha: str
+    size: int
+    mtime_ns: int
+
+class SyncOp(NamedTuple):
+    """One operation of a sync plan."""
+    action: str  # 'create', 'relink', 'replace' (a changed file), 'remove', 'copy', 'keep' or 'skip'
+    path: str    # relative to .runic
+    target: Optional[str] = None
+    reason: str = ''
+
+class SyncPlan(NamedTuple):
+    """The operations that bring a checkout in line with the package manifest."""
+    ops: List[SyncOp]
+    manifest_hash: str
+    up_to_date: bool  # True if the signature matched and nothing was checked
+
+    def changes(self) -> List[SyncOp]:
+        """Get the operations that change something."""
+        return [op for op in self.ops if op.action not in ('skip', 'keep')]
+
+def default_package_dir() -> Path:
+    """Get the `.runic` directory shipped in the package."""
+    return Path(__file__).resolve().parent / '.runic'
+
+def _sha1_file(path: str) -> str:
+    """Hash a file's content."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class SyncEngine:
+    """Plans and applies the links from a checkout's .runic directory to the package."""
+
+    def __init__(self, base_dir: str = '.runic', package_dir: Optional[str] = None):
+        """Initialize the engine.
+
+        Args:
+            base_dir: The checkout's .runic directory.
+            package_dir: The package's .runic directory. Defaults to the installed package's.
+        """
+        self.base_dir = Path(base_dir)
+        self.package_dir = Path(package_dir) if package_dir else default_package_dir()
+        self.state_path = self.base_dir / STATE_FILE
+        self._state = None
+
+    def load_state(self) -> Dict:
+        """Read the state of the last sync (empty if none)."""
+        if self._state is None:
+            try:
+                with open(self.state_path, encoding='utf-8') as f:
+                    state = json.load(f)
+                self._state = state if state.get('version') == STATE_VERSION else {}
+            except (FileNotFoundError, ValueError):
+                self._state = {}
+        return self._state
+
+    def _stat_package(self) -> List[Tuple[str, str, str, os.stat_result]]:
+        """Stat the package's core files.
+
+        Returns:
+            (path relative to .runic, kind, absolute package path, stat result) per file,
+            sorted by path.
+        """
+        files = []
+        root = str(self.package_dir)
+        stack = ['']
+        while stack:
+            rel_dir = stack.pop()
+            with os.scandir(os.path.join(root, rel_dir)) as entries:
+                for entry in entries:
+                    rel = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                    if entry.is_dir():
+                        stack.append(rel)
+                    elif entry.is_file():
+                        if rel.startswith(TEMPLATES_DIR + os.sep):
+                            files.append(('memory' + rel[len(TEMPLATES_DIR):], 'template', entry.path, entry.stat()))
+                        else:
+                            files.append((rel, 'link', entry.path, entry.stat()))
+        return sorted(files)
+
+    def signature(self, files: Optional[List] = None) -> str:
+        """Get a fingerprint of the package's core files from their stat results alone."""
+        files = self._stat_package() if files is None else files
+        digest = hashlib.sha1(str(self.package_dir.resolve()).encode('utf-8'))
+        for rel, kind, target, stat_result in files:
+            digest.update(f"\0{rel}\0{kind}\0{target}\0{stat_result.st_size}\0{stat_result.st_mtime_ns}".encode('utf-8'))
+        return digest.hexdigest()
+
+    def manifest(self, files: Optional[List] = None) -> Dict[str, ManifestEntry]:
+        """Build the package manifest, hashing only files whose size or mtime changed since the last sync."""
+        files = self._stat_package() if files is None else files
+        known = self.load_state().get('entries', {})
+        manifest = {}
+        for rel, kind, target, stat_result in files:
+            previous = known.get(rel)
+            if (previous and previous['target'] == target and previous['size'] == stat_result.st_size
+                    and previous['mtime_ns'] == stat_result.st_mtime_ns):
+                sha = previous['sha']
+            else:
+                sha = _sha1_file(target)
+            manifest[rel] = ManifestEntry(rel, kind, target, sha, stat_result.st_size, stat_result.st_mtime_ns)
+        return manifest
+
+    @staticmethod
+    def manifest_hash(manifest: Dict[str, ManifestEntry]) -> str:
+        """Hash the paths, kinds, link targets and contents of a manifest."""
+        digest = hashlib.sha1()
+        for rel in sorted(manifest):
+            entry = manifest[rel]
+            digest.update(f"{rel}\0{entry.kind}\0{entry.target}\0{entry.sha}\n".encode('utf-8'))
+        return digest.hexdigest()
+
+    def plan(self, replace_files: bool = False, refresh_templates: bool = False, full: bool = False) -> SyncPlan:
+        """Compute the operations that bring the checkout in line with the package.
+
+        Args:
+            replace_files: Replace regular files that differ from the package file with links
+                (copies identical to the package file are always relinked).
+            refresh_templates: Copy memory templates over memory files older than them.
+            full: Check every file even if the package signature matches the last sync.
+
+        Returns:
+            The plan.
+        """
+        files = self._stat_package()
+        state = self.load_state()
+        signature = self.signature(files)
+        if (not full and not replace_files and not refresh_templates and state.get('signature') == signature
+                and self.base_dir.is_dir()):
+            return SyncPlan([], state.get('manifest_hash', ''), True)
+
+        manifest = self.manifest(files)
+        ops = []
+        for rel, entry in manifest.items():
+            dst = self.base_dir / rel
+            if entry.kind == 'template':
+                if not os.path.lexists(dst):
+                    ops.append(SyncOp('copy', rel, entry.target, 'missing'))
+                elif refresh_templates and os.path.getmtime(entry.target) > os.path.getmtime(dst):
+                    ops.append(SyncOp('copy', rel, entry.target, 'template is newer'))
+                else:
+                    ops.append(SyncOp('skip', rel, entry.target))
+                continue
+
+            if os.path.islink(dst):
+                if os.readlink(dst) == entry.target:
+                    ops.append(SyncOp('skip', rel, entry.target))
+                else:
+                    ops.append(SyncOp('relink', rel, entry.target, f"pointed to {os.readlink(dst)}"))
+            elif dst.is_file():
+                if dst.stat().st_size == entry.size and _sha1_file(str(dst)) == entry.sha:
+                    # Nothing is lost, so identical copies are relinked without --force
+                    ops.append(SyncOp('relink', rel, entry.target, 'copy of the package file'))
+                elif replace_files:
+                    ops.append(SyncOp('replace', rel, entry.target, 'local changes'))
+                else:
+                    ops.append(SyncOp('keep', rel, entry.target, 'local changes'))
+            elif os.path.lexists(dst):
+                ops.append(SyncOp('keep', rel, entry.target, 'not a file'))
+            else:
+                ops.append(SyncOp('create', rel, entry.target, 'missing'))
+
+        # Links to package files that are gone; anything else in .runic belongs to the project
+        for rel, previous in state.get('entries', {}).items():
+            if rel in manifest or previous.get('kind') != 'link':
+                continue
+            dst = self.base_dir / rel
+            if os.path.islink(dst) and os.readlink(dst) == previous['target']:
+                ops.append(SyncOp('remove', rel, previous['target'], 'no longer in the package'))
+
+        return SyncPlan(ops, self.manifest_hash(manifest), False)
+
+    def apply(self, plan: SyncPlan, dry_run: bool = False, backup=None) -> Dict[str, int]:
+        """Carry out a plan and record the synced manifest.
+
+        Args:
+            plan: The plan from plan().
+            dry_run: Only count the operations.
+            backup: Called with the path of each regular file before it is replaced.
+
+        Returns:
+            The number of operations per action, plus 'conflict' for memory files that
+            another writer changed in the same sections while their template was copied.
+        """
+        from runic.locking import atomic_write
+        counts: Dict[str, int] = {}
+        for op in plan.ops:
+            counts[op.action] = counts.get(op.action, 0) + 1
+        if dry_run or plan.up_to_date:
+            return counts
+
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        for op in plan.ops:
+            dst = self.base_dir / op.path
+            if op.action in ('create', 'relink', 'replace'):
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                if op.action == 'replace' and backup is not None:
+                    # Only changed files are backed up; links and identical copies lose nothing
+                    backup(str(dst))
+                # The link is created beside the file and renamed over it, so the file is never missing
+                temp = dst.with_name(f".{dst.name}.sync-{os.getpid()}")
+                if os.path.lexists(temp):
+                    os.unlink(temp)
+                if not _symlink(op.target, str(temp)):
+                    import shutil
+                    shutil.copy2(op.target, str(temp))
+                os.replace(str(temp), str(dst))
+            elif op.action == 'remove':
+                os.unlink(dst)
+            elif op.action == 'copy':
+                from runic.locking import WriteConflict, read_versioned, write_file
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                with open(op.target, 'rb') as f:
+                    data = f.read()
+                # Templates are copied over memory files other agents may be writing, so a
+                # concurrent edit is merged in, or the file is kept if it touched the same sections
+                base, _ = read_versioned(str(dst))
+                try:
+                    write_file(str(dst), data, base)
+                except WriteConflict:
+                    counts['conflict'] = counts.get('conflict', 0) + 1
+
+        # The state is recomputed from the package, which is what the links now point to
+        files = self._stat_package()
+        manifest = self.manifest(files)
+        self._state = {
+            'version': STATE_VERSION,
+            'signature': self.signature(files),
+            'manifest_hash': self.manifest_hash(manifest),
+            'package_dir': str(self.package_dir),
+            'entries': {rel: {'kind': entry.kind, 'target': entry.target, 'sha': entry.sha,
+                              'size': entry.size, 'mtime_ns': entry.mtime_ns}
+                        for rel, entry in manifest.items()},
+        }
+        atomic_write(self.state_path, json.dumps(self._state, indent=1).encode('utf-8'))
+        return counts
+
+def _symlink(src: str, dst: str) -> bool:
+    """Create a symlink, returning False where the platform doesn't allow it (Windows without privileges)."""
+    try:
+        os.symlink(src, dst)
+        return True
+    except OSError:
+        if os.name == 'nt':
+            return False
+        raise
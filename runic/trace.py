@@ -0,0 +1,335 @@
+"""
+Trace module for Runic.
+
+This module provides the `--timings` and `--trace` options of `runic`. While a tracer is
+active it records a span for every module import, every call of the instrumented functions
+(MemoryManager, the chat command handlers, the Git context, the file locking helpers and
+GitPython's command runner), and counts stat, directory listing, open, rename, unlink and
+fsync calls and spawned processes.
+
+Nothing is instrumented until a tracer starts: the functions and system calls are wrapped
+by start_tracing() and restored by stop_tracing(), so a run without --timings or --trace
+executes exactly the code it would if this module didn't exist.
+"""
+
+import os
+import sys
+import json
+import time
+import fnmatch
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+# Functions that get a span, per module; 'Class.*' matches the public methods of a class
+INSTRUMENTED = {
+    'runic.memory': ('MemoryManager.*',),
+    'runic.index': ('MemoryIndex.get', 'MemoryIndex.save', 'MemoryIndex.rebuild', 'MemoryIndex._load'),
+    'runic.chat_commands': ('handle_*',),
+    'runic.git_context': ('RepoContext.*', 'get_repo_context'),
+    'runic.locking': ('update_file', 'compare_and_swap', 'write_file', 'create_file'),
+    'runic.daemon': ('send_request', 'execute'),
+    'git.cmd': ('Git.execute',),
+}
+
+# Span names shown by the --timings summary
+SUMMARY_LIMIT = 25
+
+_tracer = None
+
+class Span(NamedTuple):
+    """A timed call, with perf_counter start and end times."""
+    name: str
+    category: str
+    start: float
+    end: float
+    thread: int
+    args: Optional[Dict[str, Any]] = None
+
+class SpanStats(NamedTuple):
+    """The calls of all spans with one name."""
+    name: str
+    calls: int
+    total_ms: float
+    self_ms: float
+
+def _span_name(module_name: str, qualname: str, args: Tuple) -> str:
+    """Name a span after the function called, or after the git subcommand GitPython runs."""
+    if module_name == 'git.cmd':
+        command = args[1] if len(args) > 1 else None
+        if isinstance(command, (list, tuple)) and len(command) > 1:
+            return f"git {command[1]}"
+        return 'git'
+    if '.' in qualname:
+        return qualname
+    return f"{module_name.rsplit('.', 1)[-1]}.{qualname}"
+
+class Tracer:
+    """Records spans and system call counters while it is installed."""
+
+    def __init__(self, name: str = 'runic'):
+        """Initialize the tracer.
+
+        Args:
+            name: The name of the outermost span, usually the command line.
+        """
+        self.name = name
+        self.spans: List[Span] = []
+        self.counters: Counter = Counter()
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self._patches: List[Tuple[Any, str, Any]] = []
+        self._instrumented = set()
+
+    def record(self, name: str, category: str, start: float, end: float, args: Optional[Dict[str, Any]] = None) -> None:
+        """Add a finished span."""
+        self.spans.append(Span(name, category, start, end, threading.get_ident(), args))
+
+    def _patch(self, owner: Any, attribute: str, replacement: Any) -> None:
+        """Replace an attribute, remembering the original for uninstall()."""
+        self._patches.append((owner, attribute, owner.__dict__[attribute] if isinstance(owner, type) else getattr(owner, attribute)))
+        setattr(owner, attribute, replacement)
+
+    def _timed(self, function: Callable, module_name: str, qualname: str, category: str) -> Callable:
+        """Wrap a function so each call records a span."""
+        import functools
+        tracer = self
+
+        @functools.wraps(function)
+        def traced(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                tracer.record(_span_name(module_name, qualname, args), category, start, time.perf_counter())
+        return traced
+
+    def _instrument_loaded(self) -> None:
+        """Wrap the instrumented functions of every module that finished importing."""
+        import inspect
+        for module_name, patterns in INSTRUMENTED.items():
+            module = sys.modules.get(module_name)
+            if module is None or module_name in self._instrumented:
+                continue
+            if getattr(getattr(module, '__spec__', None), '_initializing', False):
+                # Its classes may not exist yet; it is instrumented once its import returns
+                continue
+            self._instrumented.add(module_name)
+            category = 'git' if module_name.startswith('git.') else 'runic'
+            for pattern in patterns:
+                owner_name, _, member = pattern.rpartition('.')
+                owner = getattr(module, owner_name, None) if owner_name else module
+                if owner is None:
+                    continue
+                for name, value in list(vars(owner).items()):
+                    explicit = name == member
+                    if not explicit and (name.startswith('_') or not fnmatch.fnmatchcase(name, member)):
+                        continue
+                    if not inspect.isfunction(value) or inspect.isgeneratorfunction(inspect.unwrap(value)):
+                        # Generators and context managers return before their work is done
+                        continue
+                    qualname = f"{owner_name}.{name}" if owner_name else name
+                    self._patch(owner, name, self._timed(value, module_name, qualname, category))
+
+    def _install_counters(self) -> None:
+        """Count stat, directory listing, open, rename, unlink and fsync calls and spawned processes."""
+        import io
+        import builtins
+        import subprocess
+        counters = self.counters
+
+        def counting(function: Callable, counter: str) -> Callable:
+            def counted(*args, **kwargs):
+                counters[counter] += 1
+                return function(*args, **kwargs)
+            return counted
+
+        for name, counter in (('stat', 'stat'), ('lstat', 'stat'), ('scandir', 'listdir'), ('listdir', 'listdir'),
+                              ('replace', 'rename'), ('rename', 'rename'), ('unlink', 'unlink'), ('fsync', 'fsync')):
+            self._patch(os, name, counting(getattr(os, name), counter))
+
+        original_open = io.open
+
+        def traced_open(file, mode='r', *args, **kwargs):
+            counters['open (write)' if any(flag in mode for flag in 'wax+') else 'open (read)'] += 1
+            return original_open(file, mode, *args, **kwargs)
+        self._patch(io, 'open', traced_open)
+        self._patch(builtins, 'open', traced_open)
+
+        original_os_open = os.open
+        write_flags = os.O_WRONLY | os.O_RDWR | os.O_CREAT
+
+        def traced_os_open(path, flags, *args, **kwargs):
+            counters['open (write)' if flags & write_flags else 'open (read)'] += 1
+            return original_os_open(path, flags, *args, **kwargs)
+        self._patch(os, 'open', traced_os_open)
+
+        original_popen_init = subprocess.Popen.__init__
+
+        def traced_popen_init(popen, args, *rest, **kwargs):
+            counters['processes'] += 1
+            program = args[0] if isinstance(args, (list, tuple)) and args else args
+            if os.path.basename(str(program)).split('.')[0] == 'git':
+                counters['git processes'] += 1
+            return original_popen_init(popen, args, *rest, **kwargs)
+        self._patch(subprocess.Popen, '__init__', traced_popen_init)
+
+    def _install_imports(self) -> None:
+        """Record a span for every import that loads new modules."""
+        import builtins
+        original_import = builtins.__import__
+        tracer = self
+
+        def traced_import(name, globals=None, locals=None, fromlist=(), level=0):
+            loaded = len(sys.modules)
+            start = time.perf_counter()
+            module = original_import(name, globals, locals, fromlist, level)
+            if len(sys.modules) != loaded:
+                if level:
+                    # Name relative imports after the module they resolve to
+                    package = (globals or {}).get('__package__') or ''
+                    base = package.rsplit('.', level - 1)[0]
+                    name = f"{base}.{name}" if name else base
+                tracer.record(f"import {name}", 'import', start, time.perf_counter())
+                tracer._instrument_loaded()
+            return module
+        self._patch(builtins, '__import__', traced_import)
+
+    def _install_click(self) -> None:
+        """Record a span for each click command run."""
+        import click
+        original_invoke = click.Command.invoke
+        tracer = self
+
+        def traced_invoke(command, ctx):
+            if not isinstance(command, click.Group):
+                # The outermost span is named after the command that actually ran
+                tracer.name = ctx.command_path
+            start = time.perf_counter()
+            try:
+                return original_invoke(command, ctx)
+            finally:
+                tracer.record(ctx.command_path, 'cli', start, time.perf_counter())
+        self._patch(click.Command, 'invoke', traced_invoke)
+
+    def install(self) -> None:
+        """Start recording."""
+        self._install_counters()
+        self._install_imports()
+        self._install_click()
+        self._instrument_loaded()
+
+    def uninstall(self) -> None:
+        """Stop recording and restore every wrapped function."""
+        self.end = time.perf_counter()
+        while self._patches:
+            owner, attribute, original = self._patches.pop()
+            setattr(owner, attribute, original)
+        self._instrumented.clear()
+
+    def summary(self) -> List[SpanStats]:
+        """Aggregate the spans by name, slowest self time first.
+
+        Self time is a span's duration minus that of the spans nested in it on the same
+        thread, so it shows where the time was actually spent.
+        """
+        calls: Counter = Counter()
+        total: Counter = Counter()
+        own: Counter = Counter()
+        by_thread: Dict[int, List[Span]] = {}
+        for span in self.spans:
+            by_thread.setdefault(span.thread, []).append(span)
+        for spans in by_thread.values():
+            stack: List[Span] = []
+            for span in sorted(spans, key=lambda span: (span.start, -span.end)):
+                while stack and stack[-1].end <= span.start:
+                    stack.pop()
+                duration = span.end - span.start
+                if stack:
+                    own[stack[-1].name] -= duration
+                calls[span.name] += 1
+                total[span.name] += duration
+                own[span.name] += duration
+                stack.append(span)
+        stats = [SpanStats(name, calls[name], total[name] * 1000.0, own[name] * 1000.0) for name in calls]
+        return sorted(stats, key=lambda stats: -stats.self_ms)
+
+    def self_time_by_category(self) -> Dict[str, float]:
+        """Sum the self times of the spans per category ('import', 'runic', 'git', 'cli'), in milliseconds."""
+        categories = {span.name: span.category for span in self.spans}
+        result: Counter = Counter()
+        for entry in self.summary():
+            result[categories[entry.name]] += entry.self_ms
+        return dict(result)
+
+    def format_summary(self, limit: int = SUMMARY_LIMIT) -> List[str]:
+        """Format the --timings table: the slowest spans, then the counters."""
+        end = self.end if self.end is not None else time.perf_counter()
+        stats = self.summary()
+        by_category = sorted(self.self_time_by_category().items(), key=lambda item: -item[1])
+        lines = [f"{self.name}: {(end - self.start) * 1000.0:.1f} ms "
+                 f"({', '.join(f'{category} {ms:.1f} ms' for category, ms in by_category)})",
+                 f"  {'self ms':>9} {'total ms':>9} {'calls':>6}  span"]
+        for entry in stats[:limit]:
+            lines.append(f"  {entry.self_ms:9.2f} {entry.total_ms:9.2f} {entry.calls:6d}  {entry.name}")
+        if len(stats) > limit:
+            lines.append(f"  ... {len(stats) - limit} more spans (see --trace)")
+        if len({span.thread for span in self.spans}) > 1:
+            lines.append("  (spans ran on several threads, so self times can add up to more than the wall time)")
+        if self.counters:
+            lines.append("  counts: " + ', '.join(f"{name} {count}" for name, count in sorted(self.counters.items())))
+        return lines
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """Build a trace in the Chrome trace event format (chrome://tracing, Perfetto)."""
+        pid = os.getpid()
+        end = self.end if self.end is not None else time.perf_counter()
+
+        def micros(moment: float) -> float:
+            return round((moment - self.start) * 1e6, 3)
+
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': self.name}},
+                  {'name': self.name, 'cat': 'cli', 'ph': 'X', 'ts': 0, 'dur': micros(end), 'pid': pid,
+                   'tid': threading.main_thread().ident}]
+        for span in self.spans:
+            event = {'name': span.name, 'cat': span.category, 'ph': 'X', 'ts': micros(span.start),
+                     'dur': micros(span.end) - micros(span.start), 'pid': pid, 'tid': span.thread}
+            if span.args:
+                event['args'] = span.args
+            events.append(event)
+        events.append({'name': 'counts', 'ph': 'C', 'ts': micros(end), 'pid': pid, 'tid': 0,
+                       'args': dict(self.counters)})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'command': self.name}}
+
+    def write_trace(self, path: str) -> None:
+        """Write the Chrome trace to a file."""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.chrome_trace(), f)
+
+def start_tracing(name: str = 'runic') -> Tracer:
+    """Start recording spans and counters for the rest of the process (or until stop_tracing).
+
+    Args:
+        name: The name of the outermost span, usually the command line.
+
+    Returns:
+        The active tracer.
+    """
+    global _tracer
+    if _tracer is not None:
+        return _tracer
+    _tracer = Tracer(name)
+    _tracer.install()
+    return _tracer
+
+def stop_tracing() -> Optional[Tracer]:
+    """Stop recording and restore the instrumented functions.
+
+    Returns:
+        The tracer that was active, if any.
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.uninstall()
+    return tracer
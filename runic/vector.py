@@ -0,0 +1,499 @@
+"""
+Vector module for Runic.
+
+This module provides the built-in vector index behind `runic integrate vector-db`. Every
+memory file is split into section chunks, each chunk is embedded, and the vectors are kept
+in `.runic/vectors/`: a raw float32 matrix that is memory-mapped rather than loaded, and
+a JSON manifest mapping rows to chunks. Queries are answered with a blocked matrix product
+over the mapped rows, so only the pages being scanned are touched.
+
+The index is updated incrementally: files whose size and mtime are unchanged are skipped,
+and within a changed file only chunks whose text changed are embedded again.
+
+The default embedder hashes words and word pairs into a fixed number of dimensions, which
+needs no model and runs offline. Any function mapping a list of strings to a 2-D array can
+be used instead. NumPy is an optional dependency (pip install 'runic[vector]').
+"""
+
+import os
+import re
+import json
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+# Bump this whenever the layout of the manifest or the vector file changes
+VECTOR_INDEX_VERSION = 1
+
+# Embedder used unless --embedder or RUNIC_EMBEDDER says otherwise
+DEFAULT_EMBEDDER = 'hashing'
+
+# Dimensions of the hashing embedder unless 'hashing:<dim>' says otherwise
+DEFAULT_HASHING_DIM = 512
+
+# Sections longer than this many characters are split into several chunks
+CHUNK_CHARS = 1500
+
+# Rows scored per matrix product when querying, bounding the memory a query needs
+QUERY_BLOCK_ROWS = 16384
+
+# Characters of each chunk kept in the manifest to show with results
+PREVIEW_CHARS = 160
+
+# Sections that carry no content worth finding
+SKIPPED_HEADINGS = ('Last Updated',)
+
+_WORD = re.compile(r"\w+")
+
+def _require_numpy():
+    """Import NumPy, explaining how to install it if it's missing."""
+    try:
+        import numpy
+    except ImportError:
+        raise ValueError("The vector index needs NumPy (pip install 'runic[vector]')")
+    return numpy
+
+def hashing_embedder(dim: int = DEFAULT_HASHING_DIM) -> Callable[[List[str]], Any]:
+    """Get the default embedder, which hashes words and word pairs into dim dimensions.
+
+    Each feature adds its log-scaled count to one dimension with a hash-derived sign,
+    and every vector is normalized to unit length, so texts sharing vocabulary have a
+    high cosine similarity. It needs no model and gives the same vectors on every machine.
+
+    Args:
+        dim: The number of dimensions.
+
+    Returns:
+        A function mapping a list of texts to a (len(texts), dim) float32 array.
+    """
+    np = _require_numpy()
+    from math import log
+    from zlib import crc32
+    # Features seen before skip the hashing; the cache is bounded by the vocabulary
+    features: Dict[str, tuple] = {}
+
+    def feature(name: str) -> tuple:
+        h = crc32(name.encode('utf-8'))
+        # Pairs count half as much as words; the sign bit is independent of the bucket
+        weight = (0.5 if ' ' in name else 1.0) * (-1.0 if (h >> 31) & 1 else 1.0)
+        features[name] = (h % dim, weight)
+        return features[name]
+
+    def embed(texts: List[str]) -> Any:
+        cells, values = [], []
+        for row, text in enumerate(texts):
+            words = _WORD.findall(text.lower())
+            counts: Dict[str, int] = {}
+            for word in words:
+                counts[word] = counts.get(word, 0) + 1
+            for pair in map('{} {}'.format, words, words[1:]):
+                counts[pair] = counts.get(pair, 0) + 1
+            offset = row * dim
+            for name, count in counts.items():
+                column, weight = features.get(name) or feature(name)
+                cells.append(offset + column)
+                values.append(weight * (1.0 + log(count)))
+
+        flat = np.bincount(np.array(cells, dtype=np.int64), weights=np.array(values),
+                           minlength=len(texts) * dim)
+        vectors = flat.astype(np.float32).reshape(len(texts), dim)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    return embed
+
+def get_embedder(name: Optional[str] = None) -> Callable[[List[str]], Any]:
+    """Get an embedding function.
+
+    Args:
+        name: 'hashing' or 'hashing:<dim>' for the built-in embedder, or 'module:function'
+            for any function taking a list of strings and returning a 2-D array with one
+            row per string. Defaults to the RUNIC_EMBEDDER environment variable, then 'hashing'.
+
+    Returns:
+        The embedding function.
+
+    Raises:
+        ValueError: If the embedder can't be loaded.
+    """
+    name = name or os.environ.get('RUNIC_EMBEDDER') or DEFAULT_EMBEDDER
+    if name == 'hashing' or name.startswith('hashing:'):
+        try:
+            dim = int(name.partition(':')[2] or DEFAULT_HASHING_DIM)
+        except ValueError:
+            raise ValueError(f"Invalid embedder dimension: {name}")
+        return hashing_embedder(dim)
+
+    module_name, _, function_name = name.partition(':')
+    if not function_name:
+        raise ValueError(f"Unknown embedder: {name}. Use 'hashing', 'hashing:<dim>' or 'module:function'")
+    try:
+        import importlib
+        return getattr(importlib.import_module(module_name), function_name)
+    except (ImportError, AttributeError) as e:
+        raise ValueError(f"Can't load embedder {name}: {e}")
+
+class VectorHit(NamedTuple):
+    """A chunk returned by a vector query."""
+    score: float
+    file: str
+    heading: str
+    line: int
+    preview: str
+
+class IndexUpdate(NamedTuple):
+    """What an index update changed."""
+    files: int
+    embedded: int
+    removed: int
+    chunks: int
+
+class VectorIndex:
+    """A memory-mapped vector index over the chunks of the memory files."""
+
+    def __init__(self, base_dir='.runic', embedder: Optional[str] = None):
+        """Initialize the index.
+
+        Args:
+            base_dir: The base directory for Runic files.
+            embedder: The embedder name (see get_embedder).
+        """
+        self.base_dir = Path(base_dir)
+        self.memory_dir = self.base_dir / 'memory'
+        self.index_dir = self.base_dir / 'vectors'
+        self.manifest_path = self.index_dir / 'manifest.json'
+        self.embedder_name = embedder or os.environ.get('RUNIC_EMBEDDER') or DEFAULT_EMBEDDER
+        self._embed = None
+        self._manifest = None
+        self._manifest_mtime = None
+        self._matrix = None
+        self._rows = None
+        self._stale_files: List[Path] = []
+
+    @property
+    def embed(self) -> Callable[[List[str]], Any]:
+        """The embedding function, loaded on first use."""
+        if self._embed is None:
+            self._embed = get_embedder(self.embedder_name)
+        return self._embed
+
+    @property
+    def vectors_path(self) -> Path:
+        """The vector file the manifest points to."""
+        return self.index_dir / self._load()['file']
+
+    def _refresh(self) -> None:
+        """Drop the loaded manifest if another process wrote a new one since it was loaded."""
+        try:
+            mtime = self.manifest_path.stat().st_mtime_ns
+        except OSError:
+            mtime = None
+        if self._manifest is not None and mtime != self._manifest_mtime:
+            self._manifest = self._matrix = self._rows = None
+
+    def _load(self) -> Dict[str, Any]:
+        """Load the manifest on first use, starting over if it was made by another embedder."""
+        if self._manifest is None:
+            try:
+                self._manifest_mtime = self.manifest_path.stat().st_mtime_ns
+            except OSError:
+                self._manifest_mtime = None
+            manifest = None
+            try:
+                manifest = json.loads(self.manifest_path.read_text())
+                if manifest.get('version') != VECTOR_INDEX_VERSION or manifest.get('embedder') != self.embedder_name:
+                    manifest = None
+            except (OSError, ValueError, AttributeError):
+                # A missing or corrupt manifest means a full rebuild
+                pass
+            if manifest is None:
+                # Vector files of an index being replaced are deleted once the new manifest is saved
+                self._stale_files = sorted(self.index_dir.glob('vectors-*.f32'))
+                generation = max((self._generation(path.name) for path in self._stale_files), default=-1) + 1
+                manifest = {'version': VECTOR_INDEX_VERSION, 'embedder': self.embedder_name,
+                            'file': f"vectors-{generation}.f32", 'dim': None, 'capacity': 0, 'used': 0,
+                            'free': [], 'files': {}}
+            self._manifest = manifest
+        return self._manifest
+
+    @staticmethod
+    def _generation(file_name: str) -> int:
+        """Get the generation number of a vector file name such as 'vectors-3.f32'."""
+        digits = re.sub(r'\D', '', file_name.split('.')[0])
+        return int(digits) if digits else 0
+
+    def _open(self, mode: str = 'r'):
+        """Memory-map the vector file with the manifest's capacity and dimension."""
+        np = _require_numpy()
+        manifest = self._load()
+        if not manifest['capacity'] or not self.vectors_path.exists():
+            return None
+        return np.memmap(str(self.vectors_path), dtype=np.float32, mode=mode,
+                         shape=(manifest['capacity'], manifest['dim']))
+
+    def update(self) -> IndexUpdate:
+        """Bring the index up to date with the memory files.
+
+        Returns:
+            The number of files re-read, chunks embedded, chunks removed and chunks indexed.
+        """
+        self._refresh()
+        try:
+            return self._update()
+        except BaseException:
+            # The manifest may be half updated; the next call reloads it from disk
+            self._manifest = self._matrix = self._rows = None
+            raise
+
+    def _update(self) -> IndexUpdate:
+        """Update the loaded manifest and the vector file; see update()."""
+        from runic.index import stat_markdown_files
+        from runic.sections import split_chunks
+        import hashlib
+        manifest = self._load()
+        indexed = manifest['files']
+        current = stat_markdown_files(self.memory_dir)
+        freed: List[int] = []
+        pending = []  # (chunk record, text) pairs waiting for a vector
+        changed_files = 0
+
+        for rel in sorted(set(indexed) - set(current)):
+            freed.extend(chunk['row'] for chunk in indexed.pop(rel)['chunks'])
+
+        for rel, stat_result in sorted(current.items()):
+            entry = indexed.get(rel)
+            if entry and entry['mtime_ns'] == stat_result.st_mtime_ns and entry['size'] == stat_result.st_size:
+                continue
+            try:
+                data = (self.memory_dir / rel).read_bytes()
+            except OSError:
+                continue
+            changed_files += 1
+            old_chunks: Dict[str, List[Dict]] = {}
+            for chunk in (entry or {}).get('chunks', []):
+                old_chunks.setdefault(chunk['hash'], []).append(chunk)
+
+            chunks = []
+            for chunk in split_chunks(data, CHUNK_CHARS):
+                if chunk.heading in SKIPPED_HEADINGS:
+                    continue
+                digest = hashlib.sha1(chunk.text.encode('utf-8')).hexdigest()
+                record = {'hash': digest, 'heading': chunk.heading, 'line': chunk.line,
+                          'preview': ' '.join(chunk.text.split())[:PREVIEW_CHARS], 'row': None}
+                reusable = old_chunks.get(digest)
+                if reusable:
+                    # Unchanged text keeps its vector, even if it moved within the file
+                    record['row'] = reusable.pop()['row']
+                else:
+                    pending.append((record, chunk.text))
+                chunks.append(record)
+            for leftovers in old_chunks.values():
+                freed.extend(chunk['row'] for chunk in leftovers)
+            indexed[rel] = {'mtime_ns': stat_result.st_mtime_ns, 'size': stat_result.st_size, 'chunks': chunks}
+
+        if pending:
+            self._store(pending)
+        manifest['free'] = sorted(set(manifest['free']) | set(freed))
+        if changed_files or freed:
+            if len(manifest['free']) > max(1024, manifest['used'] // 4):
+                self._compact()
+            self._save()
+        total = sum(len(entry['chunks']) for entry in indexed.values())
+        return IndexUpdate(changed_files, len(pending), len(freed), total)
+
+    def _store(self, pending: List) -> None:
+        """Embed new chunks and write their vectors into free or new rows."""
+        np = _require_numpy()
+        manifest = self._load()
+        vectors = np.asarray(self.embed([text for _, text in pending]), dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(pending):
+            raise ValueError(f"Embedder {self.embedder_name} must return one row per text")
+        if manifest['dim'] is None:
+            manifest['dim'] = int(vectors.shape[1])
+        elif vectors.shape[1] != manifest['dim']:
+            raise ValueError(f"Embedder {self.embedder_name} returned {vectors.shape[1]} dimensions, "
+                             f"the index has {manifest['dim']}")
+        # Stored vectors are unit length, so a dot product is the cosine similarity
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        # Rows freed by this update are only reused by the next one, so the manifest on
+        # disk never points at a row that was overwritten if the update is interrupted
+        free = list(manifest['free'])
+        rows = []
+        for _ in pending:
+            if free:
+                rows.append(free.pop(0))
+            else:
+                rows.append(manifest['used'])
+                manifest['used'] += 1
+        manifest['free'] = free
+
+        if manifest['used'] > manifest['capacity']:
+            self._grow(max(manifest['used'], manifest['capacity'] * 2, 1024))
+        matrix = self._open('r+')
+        order = np.argsort(rows)
+        matrix[np.array(rows)[order]] = vectors[order]
+        matrix.flush()
+        del matrix
+        for (record, _), row in zip(pending, rows):
+            record['row'] = row
+        self._matrix = None
+
+    def _grow(self, capacity: int) -> None:
+        """Extend the vector file to hold capacity rows."""
+        manifest = self._load()
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.vectors_path, 'ab') as f:
+            f.truncate(capacity * manifest['dim'] * 4)
+        manifest['capacity'] = capacity
+
+    def _compact(self) -> None:
+        """Copy the rows in use to a new vector file.
+
+        The new file gets a new name, so the old manifest and file stay valid until the
+        new manifest replaces the old one.
+        """
+        np = _require_numpy()
+        manifest = self._load()
+        old_path = self.vectors_path
+        old = self._open('r')
+        records = [chunk for entry in manifest['files'].values() for chunk in entry['chunks']]
+        records.sort(key=lambda chunk: chunk['row'])
+        generation = self._generation(manifest['file']) + 1
+        capacity = max(1024, len(records))
+        new_path = self.index_dir / f"vectors-{generation}.f32"
+        new = np.memmap(str(new_path), dtype=np.float32, mode='w+', shape=(capacity, manifest['dim']))
+        if records:
+            new[:len(records)] = old[np.array([chunk['row'] for chunk in records])]
+        for row, chunk in enumerate(records):
+            chunk['row'] = row
+        new.flush()
+        del new, old
+        manifest.update(file=new_path.name, capacity=capacity, used=len(records), free=[])
+        self._stale_files.append(old_path)
+        self._matrix = None
+
+    def _save(self) -> None:
+        """Write the manifest atomically."""
+        from runic.locking import atomic_write
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        atomic_write(self.manifest_path, json.dumps(self._load()).encode('utf-8'))
+        self._manifest_mtime = self.manifest_path.stat().st_mtime_ns
+        self._rows = None
+        for path in self._stale_files:
+            try:
+                path.unlink()
+            except OSError:
+                pass
+        self._stale_files = []
+
+    def _row_table(self):
+        """Map each used row to its chunk, with a mask of the rows in use."""
+        if self._rows is None:
+            np = _require_numpy()
+            manifest = self._load()
+            owners: List[Optional[tuple]] = [None] * manifest['used']
+            for rel, entry in manifest['files'].items():
+                for chunk in entry['chunks']:
+                    owners[chunk['row']] = (rel, chunk)
+            valid = np.array([owner is not None for owner in owners], dtype=bool)
+            self._rows = (owners, valid)
+        return self._rows
+
+    def query(self, texts: List[str], k: int = 5) -> List[List[VectorHit]]:
+        """Find the chunks most similar to each of several texts.
+
+        All texts are embedded in one batch and scored together, one block of rows at a
+        time, keeping the best k of each block.
+
+        Args:
+            texts: The query texts.
+            k: The number of results per query.
+
+        Returns:
+            For each text, up to k hits with a positive similarity, from most to least similar.
+        """
+        self._refresh()
+        np = _require_numpy()
+        manifest = self._load()
+        if not texts:
+            return []
+        if not manifest['used'] or manifest['dim'] is None:
+            return [[] for _ in texts]
+        if self._matrix is None:
+            self._matrix = self._open('r')
+        owners, valid = self._row_table()
+
+        queries = np.asarray(self.embed(list(texts)), dtype=np.float32)
+        if queries.ndim != 2 or queries.shape[1] != manifest['dim']:
+            raise ValueError(f"Embedder {self.embedder_name} doesn't match the index; rebuild it with --action index")
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+
+        used = manifest['used']
+        best_scores = np.full((len(texts), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(texts), 0), dtype=np.int64)
+        for start in range(0, used, QUERY_BLOCK_ROWS):
+            end = min(used, start + QUERY_BLOCK_ROWS)
+            scores = queries @ self._matrix[start:end].T
+            scores[:, ~valid[start:end]] = -np.inf
+            if end - start > k:
+                top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            else:
+                top = np.tile(np.arange(end - start), (len(texts), 1))
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            best_rows = np.concatenate([best_rows, top + start], axis=1)
+
+        results = []
+        for scores, rows in zip(best_scores, best_rows):
+            hits = []
+            for i in np.argsort(-scores, kind='stable')[:k]:
+                if not np.isfinite(scores[i]) or scores[i] <= 0:
+                    # Free rows, and chunks sharing no feature with the query
+                    continue
+                rel, chunk = owners[rows[i]]
+                hits.append(VectorHit(float(scores[i]), os.path.join(str(self.memory_dir), rel),
+                                      chunk['heading'], chunk['line'], chunk['preview']))
+            results.append(hits)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        """Describe the index: embedder, dimension, files, chunks and size on disk."""
+        self._refresh()
+        manifest = self._load()
+        try:
+            size = self.vectors_path.stat().st_size
+        except OSError:
+            size = 0
+        return {
+            'embedder': manifest['embedder'],
+            'dim': manifest['dim'],
+            'files': len(manifest['files']),
+            'chunks': sum(len(entry['chunks']) for entry in manifest['files'].values()),
+            'free_rows': len(manifest['free']),
+            'bytes': size,
+        }
+
+    def clear(self) -> None:
+        """Delete the index."""
+        import shutil
+        shutil.rmtree(str(self.index_dir), ignore_errors=True)
+        self._manifest = self._manifest_mtime = None
+        self._matrix = None
+        self._rows = None
+
+# Indexes kept open between queries in a long-running process (the daemon)
+_open_indexes: Dict[tuple, VectorIndex] = {}
+
+def get_vector_index(base_dir='.runic', embedder: Optional[str] = None) -> VectorIndex:
+    """Get the vector index of a Runic base directory, reusing one already open in this process.
+
+    Args:
+        base_dir: The base directory for Runic files.
+        embedder: The embedder name (see get_embedder).
+
+    Returns:
+        The index.
+    """
+    key = (os.path.abspath(str(base_dir)), embedder or os.environ.get('RUNIC_EMBEDDER') or DEFAULT_EMBEDDER)
+    if key not in _open_indexes:
+        _open_indexes[key] = VectorIndex(base_dir, key[1])
+    return _open_indexes[key]
@@ -0,0 +1,445 @@
+"""
+Watch module for Runic.
+
+This module provides `runic mem watch`, a change feed over `.runic/memory` (core files,
+tracks and merge requests). It keeps an incremental index of every memory file's sections
+and their hashes, and reports each change as an NDJSON event naming the file, the section,
+and the old and new hash of its content. Changes are picked up with inotify on Linux and
+with mtime polling elsewhere.
+"""
+
+import os
+import json
+import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+# Seconds between scans when inotify isn't available
+DEFAULT_POLL_INTERVAL = 1.0
+
+# Seconds to wait for more inotify events before rescanning, so one save is one batch
+DEBOUNCE_SECONDS = 0.05
+
+# inotify event flags (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF)
+
+class FileState(NamedTuple):
+    """What the watcher knows about one memory file."""
+    mtime_ns: int
+    size: int
+    sections: Dict[str, str]
+
+def _hash(data: bytes) -> str:
+    """Hash section content; hashlib is only imported once something is read."""
+    import hashlib
+    return hashlib.sha1(data).hexdigest()
+
+def section_hashes(data: bytes) -> Dict[str, str]:
+    """Hash the content of every section of a memory file.
+
+    Args:
+        data: The raw content of the file.
+
+    Returns:
+        A hash per section heading. Repeated headings get a ' #2', ' #3', ... suffix, and
+        text before the first heading is keyed by the empty string.
+    """
+    from runic.sections import parse_sections
+    sections = parse_sections(data)
+    hashes = {}
+    preamble = data[:sections[0].start] if sections else data
+    if preamble.strip():
+        hashes[''] = _hash(preamble.strip())
+    seen = {}
+    for section in sections:
+        count = seen.get(section.heading, 0) + 1
+        seen[section.heading] = count
+        key = section.heading if count == 1 else f"{section.heading} #{count}"
+        # Trailing blank lines change when a section is appended after this one
+        hashes[key] = _hash(data[section.body_start:section.end].strip())
+    return hashes
+
+class MemoryWatcher:
+    """Incremental index of the memory directory that reports section-level changes."""
+
+    def __init__(self, memory_dir: Union[str, Path] = '.runic/memory', state_path: Optional[Union[str, Path]] = None):
+        """Initialize the watcher.
+
+        Args:
+            memory_dir: The memory directory to watch.
+            state_path: Where to keep the index between runs, so a new run reports what
+                changed since the last one. If None, the first scan is the baseline.
+        """
+        self.memory_dir = os.path.realpath(str(memory_dir))
+        self.state_path = str(state_path) if state_path else None
+        self.files: Dict[str, FileState] = {}
+        self._loaded = False
+
+    def load(self) -> bool:
+        """Load the index saved by the previous run.
+
+        Returns:
+            True if a saved index was found.
+        """
+        self._loaded = True
+        if not self.state_path:
+            return False
+        try:
+            with open(self.state_path) as f:
+                data = json.load(f)
+            self.files = {path: FileState(*state) for path, state in data.get('files', {}).items()}
+            return True
+        except (OSError, ValueError, TypeError):
+            return False
+
+    def save(self) -> None:
+        """Save the index for the next run."""
+        if not self.state_path:
+            return
+        from runic.locking import atomic_write
+        data = {'files': {path: list(state) for path, state in self.files.items()}}
+        try:
+            atomic_write(self.state_path, json.dumps(data).encode('utf-8'))
+        except OSError:
+            pass
+
+    def _is_memory_file(self, name: str) -> bool:
+        """Check whether a file name is a memory file."""
+        # Temporary files and lock files of in-progress writes start with a dot
+        return name.endswith('.md') and not name.startswith('.')
+
+    def _walk(self) -> Iterator[Tuple[str, os.stat_result]]:
+        """List every memory file with its stat result, in one scandir pass per directory."""
+        stack = [self.memory_dir]
+        while stack:
+            directory = stack.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.name.startswith('.'):
+                            continue
+                        if entry.is_dir():
+                            stack.append(entry.path)
+                        elif self._is_memory_file(entry.name):
+                            try:
+                                yield os.path.relpath(entry.path, self.memory_dir), entry.stat()
+                            except FileNotFoundError:
+                                pass
+            except (FileNotFoundError, NotADirectoryError):
+                pass
+
+    def _events_for(self, rel_path: str, old: Optional[FileState], new: Optional[FileState],
+                    timestamp: str) -> List[Dict]:
+        """Compare two states of one file."""
+        events = []
+        if old is None and new is not None:
+            events.append({'type': 'file', 'change': 'added', 'file': rel_path, 'time': timestamp})
+        elif new is None and old is not None:
+            events.append({'type': 'file', 'change': 'removed', 'file': rel_path, 'time': timestamp})
+        old_sections = old.sections if old else {}
+        new_sections = new.sections if new else {}
+        for section, old_hash in old_sections.items():
+            new_hash = new_sections.get(section)
+            if new_hash != old_hash:
+                events.append({'type': 'section', 'change': 'modified' if new_hash else 'removed',
+                               'file': rel_path, 'section': section, 'old': old_hash, 'new': new_hash,
+                               'time': timestamp})
+        for section, new_hash in new_sections.items():
+            if section not in old_sections:
+                events.append({'type': 'section', 'change': 'added', 'file': rel_path, 'section': section,
+                               'old': None, 'new': new_hash, 'time': timestamp})
+        return events
+
+    def _read_state(self, rel_path: str, stat_result: os.stat_result) -> Optional[FileState]:
+        """Read one file into a new state, or reuse the old one if its stat didn't change."""
+        old = self.files.get(rel_path)
+        if old and old.mtime_ns == stat_result.st_mtime_ns and old.size == stat_result.st_size:
+            return old
+        try:
+            with open(os.path.join(self.memory_dir, rel_path), 'rb') as f:
+                data = f.read()
+        except (FileNotFoundError, IsADirectoryError):
+            return None
+        return FileState(stat_result.st_mtime_ns, stat_result.st_size, section_hashes(data))
+
+    def refresh(self, rel_paths: Optional[Iterable[str]] = None) -> List[Dict]:
+        """Bring the index up to date and report what changed.
+
+        Args:
+            rel_paths: The files (relative to the memory directory) that may have changed.
+                If None, the whole directory is rescanned; only files whose mtime or size
+                changed are read.
+
+        Returns:
+            The change events, in file order.
+        """
+        if not self._loaded:
+            self.load()
+        timestamp = datetime.datetime.now().isoformat(timespec='seconds')
+
+        if rel_paths is None:
+            current = dict(self._walk())
+            candidates = sorted(set(self.files) | set(current))
+        else:
+            current = {}
+            candidates = []
+            for rel_path in sorted(set(rel_paths)):
+                if not self._is_memory_file(os.path.basename(rel_path)):
+                    continue
+                candidates.append(rel_path)
+                try:
+                    current[rel_path] = os.stat(os.path.join(self.memory_dir, rel_path))
+                except (FileNotFoundError, NotADirectoryError):
+                    pass
+
+        events = []
+        for rel_path in candidates:
+            old = self.files.get(rel_path)
+            new = self._read_state(rel_path, current[rel_path]) if rel_path in current else None
+            if new is old:
+                continue
+            if new is None:
+                self.files.pop(rel_path, None)
+            else:
+                self.files[rel_path] = new
+            events.extend(self._events_for(rel_path, old, new, timestamp))
+        return events
+
+    def _prefix_paths(self, directory: str) -> List[str]:
+        """List the known memory files under a directory (for a directory that moved or was removed)."""
+        prefix = os.path.relpath(directory, self.memory_dir)
+        prefix = '' if prefix == '.' else prefix + os.sep
+        return [path for path in self.files if path.startswith(prefix)]
+
+    def watch(self, emit: Callable[[Dict], None], interval: float = DEFAULT_POLL_INTERVAL,
+              use_inotify: bool = True, stop: Optional[Callable[[], bool]] = None) -> None:
+        """Report changes until stopped.
+
+        Args:
+            emit: Called with each change event.
+            interval: Seconds between scans when polling.
+            use_inotify: Use inotify when the platform supports it.
+            stop: Checked between batches; the watch ends when it returns True.
+        """
+        # Without a saved index the first scan is only the baseline
+        had_state = self.load()
+        events = self.refresh()
+        if had_state:
+            for event in events:
+                emit(event)
+        self.save()
+
+        inotify = _Inotify.create() if use_inotify else None
+        try:
+            if inotify is None:
+                self._poll(emit, interval, stop)
+            else:
+                self._watch_inotify(inotify, emit, stop)
+        finally:
+            if inotify is not None:
+                inotify.close()
+            self.save()
+
+    def _poll(self, emit: Callable[[Dict], None], interval: float, stop: Optional[Callable[[], bool]]) -> None:
+        """Rescan the directory at a fixed interval."""
+        import time
+        while not (stop and stop()):
+            time.sleep(interval)
+            events = self.refresh()
+            for event in events:
+                emit(event)
+            if events:
+                self.save()
+
+    def _watch_inotify(self, inotify: '_Inotify', emit: Callable[[Dict], None],
+                       stop: Optional[Callable[[], bool]]) -> None:
+        """Rescan only the files inotify reports, after a short debounce."""
+        inotify.add_tree(self.memory_dir)
+        while not (stop and stop()):
+            changed = inotify.read(timeout=1.0)
+            if changed is None:
+                continue
+            # Collect the rest of a burst (e.g. a bulk `mem update`) into one rescan
+            while True:
+                more = inotify.read(timeout=DEBOUNCE_SECONDS)
+                if more is None:
+                    break
+                changed |= more
+
+            rel_paths = set()
+            rescan = False
+            for path, is_dir in changed:
+                if is_dir:
+                    # A directory appeared, moved or disappeared: watch it and diff everything under it
+                    if os.path.isdir(path):
+                        inotify.add_tree(path)
+                    rel_paths.update(self._prefix_paths(path))
+                    rescan = True
+                elif path == self.memory_dir:
+                    rescan = True
+                else:
+                    rel_paths.add(os.path.relpath(path, self.memory_dir))
+            events = self.refresh(None if rescan else rel_paths)
+            for event in events:
+                emit(event)
+            if events:
+                self.save()
+
+class _Inotify:
+    """Minimal inotify binding through ctypes, so no extra dependency is needed."""
+
+    def __init__(self, libc, fd: int):
+        self._libc = libc
+        self.fd = fd
+        self._dirs: Dict[int, str] = {}
+
+    @classmethod
+    def create(cls) -> Optional['_Inotify']:
+        """Open an inotify instance, or return None where inotify isn't available."""
+        import sys
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            import ctypes
+            import ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        except (OSError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        return cls(libc, fd)
+
+    def add_tree(self, directory: str) -> None:
+        """Watch a directory and every directory below it."""
+        for root, dirs, _ in os.walk(directory):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+            if wd >= 0:
+                self._dirs[wd] = root
+
+    def read(self, timeout: float) -> Optional[set]:
+        """Wait for events.
+
+        Args:
+            timeout: Seconds to wait.
+
+        Returns:
+            The set of (path, is_dir) pairs that changed, or None on timeout.
+        """
+        import select
+        import struct
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return None
+        try:
+            buffer = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return None
+
+        changed = set()
+        offset = 0
+        while offset + 16 <= len(buffer):
+            wd, mask, _, length = struct.unpack_from('iIII', buffer, offset)
+            name = buffer[offset + 16:offset + 16 + length].split(b'\0', 1)[0]
+            offset += 16 + length
+            directory = self._dirs.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            if not name:
+                # The watched directory itself was removed or moved
+                changed.add((directory, True))
+                continue
+            path = os.path.join(directory, os.fsdecode(name))
+            changed.add((path, bool(mask & IN_ISDIR)))
+        return changed
+
+    def close(self) -> None:
+        """Stop watching."""
+        os.close(self.fd)
+
+class EventSocket:
+    """Broadcasts NDJSON events to every client connected to a Unix socket."""
+
+    def __init__(self, path: str):
+        """Start listening.
+
+        Args:
+            path: The socket path. A stale socket file is replaced.
+
+        Raises:
+            FileExistsError: If the path is taken by something other than a stale socket.
+        """
+        import socket
+        import stat
+        import threading
+        self.path = path
+        try:
+            mode = os.stat(path).st_mode
+        except FileNotFoundError:
+            mode = None
+        if mode is not None:
+            if not stat.S_ISSOCK(mode):
+                raise FileExistsError(f"{path} exists and is not a socket")
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except ConnectionRefusedError:
+                # Left behind by a watcher that didn't shut down cleanly
+                os.unlink(path)
+            else:
+                raise FileExistsError(f"Something is already listening on {path}")
+            finally:
+                probe.close()
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(path)
+        self._server.listen()
+        self._clients = []
+        self._lock = threading.Lock()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self) -> None:
+        """Accept clients until the socket is closed."""
+        while True:
+            try:
+                client, _ = self._server.accept()
+            except OSError:
+                return
+            with self._lock:
+                self._clients.append(client)
+
+    def send(self, event: Dict) -> None:
+        """Send one event to every client, dropping the ones that disconnected."""
+        line = json.dumps(event).encode('utf-8') + b'\n'
+        with self._lock:
+            for client in list(self._clients):
+                try:
+                    client.sendall(line)
+                except OSError:
+                    self._clients.remove(client)
+                    client.close()
+
+    def close(self) -> None:
+        self._server.close()
+        with self._lock:
+            for client in self._clients:
+                client.close()
+            self._clients = []
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,240 @@
+"""
+Workspace module for Runic.
+
+This module provides `runic track workspace`, which gives each track its own Git worktree
+checked out on the track's branch. All workspaces share the main repository's object store,
+and each one links `.runic/memory` (and the framework files next to it) back to the main
+checkout, so every specialist reads and writes the same memory bank.
+"""
+
+import os
+from typing import List, NamedTuple, Optional
+from runic.git_context import Worktree, get_repo_context
+
+# Entries of the main .runic directory that belong to one checkout and are never linked
+LOCAL_RUNIC_ENTRIES = ('index.json', 'runic.sock', 'watch-state.json', 'token-cache.json', 'sync-state.json')
+
+# File in a worktree's private git directory naming the track the workspace was created for
+TRACK_RECORD = 'runic-track'
+
+class WorkspaceResult(NamedTuple):
+    """The outcome of setting up or removing one track workspace."""
+    track: str
+    path: str
+    branch: Optional[str]
+    status: str  # 'created', 'exists', 'removed', 'pruned' or 'error'
+    message: str = ''
+
+def list_worktrees(context=None) -> List[Worktree]:
+    """List the repository's worktrees, the main one first.
+
+    Args:
+        context: The repository context. If None, the current repository is used.
+
+    Returns:
+        The worktrees.
+    """
+    return (context or get_repo_context()).list_worktrees()
+
+def default_workspace_path(main_path: str, track_dir: str) -> str:
+    """Get the default workspace location for a track: a sibling of the main checkout.
+
+    Args:
+        main_path: The main worktree's path.
+        track_dir: The track's directory name.
+
+    Returns:
+        The path, e.g. ../project-api for the api track of ../project.
+    """
+    main_path = main_path.rstrip(os.sep)
+    return os.path.join(os.path.dirname(main_path), f"{os.path.basename(main_path)}-{track_dir}")
+
+def is_runic_workspace(path: str, runic_dir: str) -> bool:
+    """Check whether a worktree's memory is linked to the given shared .runic directory."""
+    memory = os.path.join(path, '.runic', 'memory')
+    return os.path.islink(memory) and os.path.realpath(memory) == os.path.realpath(os.path.join(runic_dir, 'memory'))
+
+def link_shared_runic(workspace_path: str, runic_dir: str) -> List[str]:
+    """Link a workspace's .runic entries to the shared .runic directory.
+
+    The memory directory is always linked. Framework files (core rules, role prompts) are
+    linked when the checkout doesn't already contain them, e.g. because .runic isn't committed.
+
+    Args:
+        workspace_path: The workspace's path.
+        runic_dir: The shared .runic directory.
+
+    Returns:
+        Warnings about entries that couldn't be linked.
+    """
+    warnings = []
+    target_dir = os.path.join(workspace_path, '.runic')
+    os.makedirs(target_dir, exist_ok=True)
+
+    with os.scandir(runic_dir) as entries:
+        names = [entry.name for entry in entries]
+    for name in names:
+        if name in LOCAL_RUNIC_ENTRIES or name.startswith('.'):
+            continue
+        src = os.path.realpath(os.path.join(runic_dir, name))
+        dst = os.path.join(target_dir, name)
+        if os.path.islink(dst):
+            if os.path.realpath(dst) == src:
+                continue
+            os.unlink(dst)
+        elif os.path.exists(dst):
+            if name == 'memory':
+                warnings.append(f"{dst} is checked out from Git, so it is not shared with the main checkout")
+            continue
+        os.symlink(src, dst)
+    return warnings
+
+def _worktree_git_dir(path: str) -> Optional[str]:
+    """Get a linked worktree's private git directory from its .git file, or None."""
+    try:
+        with open(os.path.join(path, '.git')) as f:
+            line = f.readline().strip()
+    except OSError:
+        return None
+    if not line.startswith('gitdir:'):
+        return None
+    return os.path.join(path, line[len('gitdir:'):].strip())
+
+def read_workspace_track(path: str) -> Optional[str]:
+    """Get the track a workspace was created for, or None if it has no record."""
+    git_dir = _worktree_git_dir(path)
+    try:
+        with open(os.path.join(git_dir, TRACK_RECORD)) as f:
+            return f.read().strip() or None
+    except (OSError, TypeError):
+        return None
+
+def record_workspace_track(path: str, track_dir: str) -> None:
+    """Record the track a workspace belongs to.
+
+    The record lives in the worktree's private git directory, so it never shows up as an
+    untracked file and is deleted along with the worktree.
+
+    Raises:
+        OSError: If the worktree's git directory can't be found or written.
+    """
+    git_dir = _worktree_git_dir(path)
+    if git_dir is None:
+        raise OSError(f"{path} is not a linked worktree")
+    with open(os.path.join(git_dir, TRACK_RECORD), 'w') as f:
+        f.write(track_dir + '\n')
+
+def _track_branch(context, track_dir: str, worktrees: List[Worktree]) -> str:
+    """Pick the branch for a track's workspace, creating one if the track has none.
+
+    The most recently committed `<track>-*` branch that isn't checked out elsewhere is used.
+    """
+    checked_out = {worktree.branch for worktree in worktrees if worktree.branch}
+    for branch in context.iter_branches([f"{track_dir}-*", f"{track_dir}-*/**"], sort='date'):
+        if branch.name not in checked_out:
+            return branch.name
+
+    branch = f"{track_dir}-initial-setup"
+    if branch in checked_out:
+        raise ValueError(f"Branch '{branch}' is already checked out in another worktree")
+    if context.resolve(f"refs/heads/{branch}") is None:
+        context.git.branch(branch, context.default_branch())
+        context.invalidate()
+    return branch
+
+def create_workspace(track_dir: str, path: Optional[str] = None, branch: Optional[str] = None,
+                     context=None) -> WorkspaceResult:
+    """Create a worktree for a track, or re-link the one that already exists.
+
+    Args:
+        track_dir: The track's directory name.
+        path: Where to create the worktree. Defaults to a sibling of the main checkout.
+        branch: The branch to check out. Defaults to the track's latest branch.
+        context: The repository context. If None, the current repository is used.
+
+    Returns:
+        The result for the track.
+    """
+    import git
+    context = context or get_repo_context()
+    worktrees = list_worktrees(context)
+    runic_dir = os.path.join(worktrees[0].path, '.runic')
+    path = os.path.abspath(path or default_workspace_path(worktrees[0].path, track_dir))
+
+    try:
+        existing = next((w for w in worktrees if os.path.realpath(w.path) == os.path.realpath(path)), None)
+        if existing and not existing.prunable:
+            if read_workspace_track(path) is None:
+                # Created before workspaces recorded their track
+                record_workspace_track(path, track_dir)
+            warnings = link_shared_runic(path, runic_dir)
+            return WorkspaceResult(track_dir, path, existing.branch, 'exists', '; '.join(warnings))
+        if existing:
+            # The directory was deleted by hand; forget it before reusing the path
+            context.git.worktree('prune')
+            worktrees = list_worktrees(context)
+        if os.path.exists(path):
+            return WorkspaceResult(track_dir, path, branch, 'error', f"{path} already exists and is not a worktree")
+
+        branch = branch or _track_branch(context, track_dir, worktrees)
+        context.git.worktree('add', path, branch)
+        record_workspace_track(path, track_dir)
+        warnings = link_shared_runic(path, runic_dir)
+        return WorkspaceResult(track_dir, path, branch, 'created', '; '.join(warnings))
+    except (git.GitCommandError, OSError, ValueError) as e:
+        return WorkspaceResult(track_dir, path, branch, 'error', str(e))
+
+def prune_workspaces(track_dirs: List[str], context=None) -> List[WorkspaceResult]:
+    """Remove stale track workspaces.
+
+    A workspace is stale when its directory was deleted, its branch was deleted, or the
+    track recorded when it was created no longer exists. Workspaces with uncommitted
+    changes are kept and reported.
+
+    Args:
+        track_dirs: The directory names of the tracks that still exist.
+        context: The repository context. If None, the current repository is used.
+
+    Returns:
+        One result per workspace that was removed or couldn't be.
+    """
+    import git
+    context = context or get_repo_context()
+    worktrees = list_worktrees(context)
+    runic_dir = os.path.join(worktrees[0].path, '.runic')
+    branches = set(context.branch_names())
+
+    results = []
+    for worktree in worktrees[1:]:
+        if worktree.prunable:
+            results.append(WorkspaceResult(os.path.basename(worktree.path.rstrip(os.sep)), worktree.path,
+                                           worktree.branch, 'pruned', 'directory is missing'))
+            continue
+        if not is_runic_workspace(worktree.path, runic_dir):
+            continue
+
+        track = read_workspace_track(worktree.path)
+        if worktree.branch is None or worktree.branch not in branches:
+            reason = 'branch was deleted'
+        elif track is not None and track not in track_dirs:
+            reason = 'track no longer exists'
+        else:
+            continue
+        track = track or os.path.basename(worktree.path.rstrip(os.sep))
+
+        try:
+            # Drop the links first so `git worktree remove` only sees the checkout itself
+            link = os.path.join(worktree.path, '.runic')
+            for name in os.listdir(link):
+                if os.path.islink(os.path.join(link, name)):
+                    os.unlink(os.path.join(link, name))
+            context.git.worktree('remove', worktree.path)
+            results.append(WorkspaceResult(track, worktree.path, worktree.branch, 'removed', reason))
+        except (git.GitCommandError, OSError) as e:
+            # Restore the links of a workspace git refused to remove (e.g. uncommitted changes)
+            link_shared_runic(worktree.path, runic_dir)
+            results.append(WorkspaceResult(track, worktree.path, worktree.branch, 'error', f"{reason}, but: {e}"))
+
+    if any(result.status == 'pruned' for result in results):
+        context.git.worktree('prune')
+    return results
@@ -0,0 +1,50 @@
+"""Tests for ingesting documentation from a local mirror."""
+
+from runic.docs import DocsIngester
+
+PAGE = "<html><head><title>Guide</title></head><body><h1>Guide</h1><p>{}</p></body></html>"
+
+def write_site(site, index_links, sub_links):
+    """Write a mirror where a.html and b.html have the same content."""
+    site.mkdir(exist_ok=True)
+    links = ''.join(f'<a href="{link}">{link}</a>' for link in index_links)
+    (site / 'index.html').write_text(PAGE.format(f"Start {links}"))
+    links = ''.join(f'<a href="{link}">{link}</a>' for link in sub_links)
+    (site / 'sub.html').write_text(PAGE.format(f"More {links}"))
+    for name in ('a.html', 'b.html'):
+        (site / name).write_text(PAGE.format("The same text under two URLs."))
+
+def assert_chunks_exist(ingester, manifest):
+    """Check that the duplicated content still has its chunks on disk."""
+    pages = manifest['pages']
+    owners = [url for url in pages if url.endswith(('/a.html', '/b.html')) and not pages[url].get('duplicate_of')]
+    assert len(owners) == 1
+    assert pages[owners[0]]['chunks']
+    for digest in pages[owners[0]]['chunks']:
+        assert (ingester.chunks_dir / digest[:2] / f"{digest}.md").is_file()
+    toc = (ingester.docs_dir / 'toc.md').read_text()
+    assert f"chunks/{pages[owners[0]]['chunks'][0][:2]}/" in toc
+
+def test_forced_reingest_keeps_chunks_of_duplicates(tmp_path):
+    site = tmp_path / 'site'
+    # a.html is reached first on the first run
+    write_site(site, ['a.html', 'sub.html'], ['b.html'])
+    ingester = DocsIngester(str(site), 'site', str(tmp_path / '.runic'), concurrency=1)
+    ingester.run()
+    manifest = ingester._load_manifest()
+    assert_chunks_exist(ingester, manifest)
+
+    # ...and b.html, which was recorded as its duplicate, on the second
+    write_site(site, ['b.html', 'sub.html'], ['a.html'])
+    for _ in range(2):
+        ingester.run(force=True)
+        assert_chunks_exist(ingester, ingester._load_manifest())
+
+def test_unchanged_reingest_keeps_chunks_of_duplicates(tmp_path):
+    site = tmp_path / 'site'
+    write_site(site, ['a.html', 'sub.html'], ['b.html'])
+    ingester = DocsIngester(str(site), 'site', str(tmp_path / '.runic'), concurrency=1)
+    ingester.run()
+    result = ingester.run()
+    assert result.chunks_removed == 0
+    assert_chunks_exist(ingester, ingester._load_manifest())